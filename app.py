@@ -1,18 +1,66 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from PIL import Image
 import google.generativeai as genai
-import json
 from openai import OpenAI
 import re
+import hmac
 import time
 import os
+import tempfile
+import sqlite3
+import zipfile
 import plotly.express as px
 import pandas as pd
 from pytrends.request import TrendReq
 from urllib.parse import quote
-import requests
 from datetime import datetime, timedelta
 import pytz # 시간대 변환을 위한 라이브러리
+import tracing
+import rerun_profiler
+from image_store import get_store
+import file_store
+import personal_color
+import garment_color
+import similarity
+import structured_output
+import prompts
+import batch
+import image_tiers
+import rate_limit
+import async_services
+import event_journal
+import kma_grid
+import catalog
+import speculation
+import wardrobe_archive
+import recommendation_history
+import image_workers
+import uuid
+from structured_output import ClothingAnalysis, CodyRecommendation, ParseError
+from tracing import traced, annotate, annotate_gemini_usage
+
+try:
+    from streamlit_js_eval import get_geolocation  # 브라우저 위치 (선택 설치)
+except ImportError:
+    get_geolocation = None
+from weather import (pivot_forecast, ForecastIndex, cache_daily_features, get_daily_features, format_rain_windows,
+                     recommend_clothing, recommend_clothing_by_weather, format_weather_for_prompt, KST,
+                     FEATURE_TTL_SECONDS)
+
+# 관리자 대시보드는 OTTAKU_ADMIN=1 환경 변수, 또는 OTTAKU_ADMIN_TOKEN을 설정하고 ?admin=<토큰>으로 접속할 때만 노출합니다.
+ADMIN_TOKEN = os.environ.get("OTTAKU_ADMIN_TOKEN", "")
+# 문자열끼리 비교하면 ASCII가 아닌 값에서 TypeError가 나므로 UTF-8 바이트로 비교합니다.
+is_admin = os.environ.get("OTTAKU_ADMIN") == "1" or bool(
+    ADMIN_TOKEN and hmac.compare_digest(st.query_params.get("admin", "").encode("utf-8"), ADMIN_TOKEN.encode("utf-8")))
+
+# --- 실행 시간 프로파일러 (OTTAKU_PROFILE 환경 변수, 관리자 세션은 ?profile= 쿼리 파라미터로도 켭니다) ---
+profiler = rerun_profiler.start(rerun_profiler.resolve_mode(st.query_params.get("profile") if is_admin else None,
+                                                            os.environ.get("OTTAKU_PROFILE")),
+                                session=st.session_state.get("prompt_session_key"),
+                                previous=st.session_state.get("rerun_profile"))
+st.session_state.rerun_profile = profiler
+profiler.mark("clients")
 
 # --- 페이지 기본 설정 ---
 st.set_page_config(
@@ -31,45 +79,85 @@ except Exception as e:
     st.stop()
 
 # --- Gemini 모델 초기화 ---
-llm_model = genai.GenerativeModel('gemini-1.5-flash')
+GEMINI_MODEL = "gemini-1.5-flash"
+llm_model = genai.GenerativeModel(GEMINI_MODEL)
+# 기본은 스키마 지정 JSON 응답. OTTAKU_GEMINI_STRUCTURED=0이면 예전 자유 텍스트 형식으로 요청합니다.
+STRUCTURED_OUTPUT = os.environ.get("OTTAKU_GEMINI_STRUCTURED", "1") != "0"
+
+# --- 이미지 저장소 (같은 호스트의 워커들이 공유) ---
+profiler.mark("stores")
+image_store = get_store()
+# audio/, captured_images/, saved_outfits/ 파일은 주인(세션)별 용량과 보관 기간을 관리하는 저장소로만 씁니다.
+files = file_store.get_store()
+# 사진 디코딩/색상 추출/임베딩/썸네일은 작업자 프로세스에서 처리해 다른 세션의 화면 그리기를 막지 않습니다.
+image_service = image_workers.get_service()
+# 새 추천이 이전 추천을 덮어써도 다시 찾을 수 있도록 추천마다 기록해 둡니다 (이미지도 복사해 둠).
+history = recommendation_history.get_history()
+
+# --- 유사 이미지 검색 인덱스 (프로세스당 한 번만 열고, 디스크 파일은 워커들이 공유) ---
+INDEX_DIR = os.environ.get("OTTAKU_INDEX_DIR", ".ottaku_index")
+
+
+@st.cache_resource
+def get_embedding_index(name):
+    return similarity.EmbeddingIndex(os.path.join(INDEX_DIR, name))
+
+
+closet_embeddings = get_embedding_index("closet")
+outfit_embeddings = get_embedding_index("outfits")
+
+
+# --- 오프라인 상품 카탈로그 (OTTAKU_CATALOG이 없으면 검색 링크만 보여 줍니다) ---
+@st.cache_resource
+def get_product_catalog():
+    if not catalog.CATALOG_PATH:
+        return None
+    try:
+        return catalog.ProductIndex.open(catalog.CATALOG_PATH)
+    except (OSError, ValueError) as e:
+        st.warning(f"상품 카탈로그를 불러오지 못했습니다: {e}")
+        return None
+
+
+product_catalog = get_product_catalog()
 
 
 # --- 1. 기능 함수들 ---
+profiler.mark("definitions")
 
 # --- 1.1. 날씨 관련 함수 ---
 
-def recommend_clothing(temp):
-    """기온에 따라 적절한 옷차림 추천 문구를 반환하는 함수."""
-    try:
-        temp = float(temp)
-    except (ValueError, TypeError):
-        return "온도 정보가 없어 추천할 수 없어요."
-    if temp >= 28:
-        return "민소매, 반팔, 반바지, 원피스 등 매우 가벼운 옷차림을 추천해요. 🥵"
-    elif temp >= 23:
-        return "반팔, 얇은 셔츠, 반바지, 면바지로 시원하게 입으세요. 😄"
-    elif temp >= 17:
-        return "얇은 니트, 가디건, 맨투맨, 청바지가 활동하기 좋은 날씨예요. 👍"
-    elif temp >= 10:
-        return "자켓, 트렌치코트, 니트, 청바지로 멋과 보온을 둘 다 챙기세요.🧥"
-    elif temp >= 5:
-        return "두꺼운 코트, 가죽 자켓, 플리스, 기모 옷차림이 필요해요. 🥶"
-    else:
-        return "패딩, 두꺼운 코트, 목도리, 장갑 등 방한용품으로 따뜻하게 입으세요. 🧤"
+class ForecastResponseError(Exception):
+    """기상청이 정상 코드('00')가 아닌 응답(NO_DATA, 키 오류 등)을 보낸 경우"""
 
 
-def get_weather_data(api_key, base_date, base_time, nx, ny):
-    """기상청 단기예보 API로부터 날씨 데이터를 요청하는 함수"""
+@st.cache_data(ttl=FEATURE_TTL_SECONDS, show_spinner=False)
+@traced("weather")
+def fetch_forecast(base_date, base_time, nx, ny, _api_key):
+    """격자 칸·발표 시각별 예보 응답을 캐시하는 함수 (근처 사용자는 같은 칸을 공유하고, 오류는 캐시하지 않음)"""
     endpoint = "http://apis.data.go.kr/1360000/VilageFcstInfoService_2.0/getVilageFcst"
-    params = {'serviceKey': api_key, 'pageNo': '1', 'numOfRows': '1000', 'dataType': 'JSON', 'base_date': base_date,
+    params = {'serviceKey': _api_key, 'pageNo': '1', 'numOfRows': '1000', 'dataType': 'JSON', 'base_date': base_date,
               'base_time': base_time, 'nx': nx, 'ny': ny}
+    response = async_services.fetch(endpoint, params=params, timeout=10)
+    annotate(payload_bytes=len(response.content))
+    data = response.json()
+    # HTTP 200이어도 resultCode가 '00'이 아니면 예외로 올려 캐시에 남지 않게 합니다 (발표 직후 NO_DATA 등).
+    header = data.get('response', {}).get('header', {}) if isinstance(data, dict) else {}
+    if header.get('resultCode') != '00':
+        raise ForecastResponseError(header.get('resultMsg') or '알 수 없는 오류')
+    return data
+
+
+def get_weather_data(api_key, base_date, base_time, nx, ny):
+    """기상청 단기예보 API로부터 날씨 데이터를 요청하는 함수"""
     try:
-        response = requests.get(endpoint, params=params, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return fetch_forecast(base_date, base_time, int(nx), int(ny), api_key)
+    except async_services.HTTP_ERRORS as e:
         st.sidebar.error(f"API 요청 오류: {e}")
         return None
+    except ForecastResponseError as e:
+        st.sidebar.error(f"API 응답 오류: {e}")
+        return None
 
 
 def process_weather_data(data):
@@ -78,15 +166,7 @@ def process_weather_data(data):
         result_msg = data.get('response', {}).get('header', {}).get('resultMsg', '알 수 없는 오류')
         st.sidebar.error(f"API 응답 오류: {result_msg}")
         return pd.DataFrame()
-    items = data['response']['body']['items']['item']
-    df = pd.DataFrame(items)
-    df_pivot = df.pivot_table(index=['fcstDate', 'fcstTime'], columns='category', values='fcstValue',
-                              aggfunc='first').reset_index()
-    sky_codes = {'1': '맑음 ☀️', '3': '구름많음 ☁️', '4': '흐림 🌥️'}
-    pty_codes = {'0': '강수 없음', '1': '비 🌧️', '2': '비/눈 🌨️', '3': '눈 ❄️', '4': '소나기 🌦️'}
-    if 'SKY' in df_pivot.columns: df_pivot['SKY_STATUS'] = df_pivot['SKY'].map(sky_codes)
-    if 'PTY' in df_pivot.columns: df_pivot['PTY_STATUS'] = df_pivot['PTY'].map(pty_codes).fillna('강수 없음')
-    return df_pivot
+    return pivot_forecast(data['response']['body']['items']['item'])
 
 
 def get_base_datetime():
@@ -144,6 +224,7 @@ def recommend_size(height, weight, gender):
 
 
 @st.cache_data(ttl=3600)
+@traced("trends")
 def get_google_trends_data():
     try:
         pytrends = TrendReq(hl='ko-KR', tz=360)
@@ -152,128 +233,684 @@ def get_google_trends_data():
         df = pytrends.interest_over_time()
         return df.drop(columns=['isPartial']) if not df.empty else pd.DataFrame()
     except Exception as e:
+        annotate(error=type(e).__name__)
         st.warning(f"Google Trends 데이터를 가져오는 데 실패했습니다: {e}")
         return pd.DataFrame()
 
 
 def save_image(directory, file):
-    if not os.path.exists(directory): os.makedirs(directory)
-    filename = f"capture_{int(time.time())}.jpg"
-    filepath = os.path.join(directory, filename)
-    with open(filepath, 'wb') as f: f.write(file.getbuffer())
-    return filepath
+    return files.put_bytes(directory, file.getbuffer(), ".jpg", owner=st.session_state.prompt_session_key,
+                           prefix="capture")
 
 
 def save_image_from_url(directory, url):
-    if not os.path.exists(directory): os.makedirs(directory)
+    owner = st.session_state.prompt_session_key
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        filename = f"saved_{int(time.time())}.png"
-        filepath = os.path.join(directory, filename)
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192): f.write(chunk)
-        return True, filepath
+        if os.path.exists(url):
+            # 로컬에서 만든 콜라주는 내려받지 않고 복사합니다.
+            return True, files.copy(directory, url, owner=owner, prefix="saved")
+        return True, files.write_with(directory, ".png", lambda path: async_services.download(url, path), owner=owner,
+                                      prefix="saved")
     except Exception as e:
         st.error(f"이미지 저장 중 오류 발생: {e}")
         return False, None
 
 
-def generate_image_with_dalle(prompt, retries=3, delay=5):
+@traced("dalle", model="dall-e-3")
+def generate_image_with_dalle(prompt, retries=3, delay=5, notify=True, tier=None):
+    tier = image_tiers.get(tier)
+    annotate(payload_bytes=len(prompt.encode()), model=tier.model, tier=tier.name)
     for attempt in range(retries):
+        wait_for_quota(tier.model)
         try:
-            response = openai_client.images.generate(model="dall-e-3", prompt=prompt, size="1024x1024",
-                                                     quality="standard", n=1)
+            response = async_services.generate_image(openai_client, prompt, **tier.request_kwargs())
+            annotate(images=1, cost_usd=tier.price)
             return response.data[0].url
         except Exception as e:
-            if "Connection error" in str(e) and attempt < retries - 1:
-                st.warning(f"DALL-E 연결 오류. {delay}초 후 재시도합니다... ({attempt + 1}/{retries})")
+            if rate_limit.is_rate_limit_error(e) and attempt < retries - 1:
+                # 다음 차례는 대기열이 정해 주므로 여기서 따로 잠들지 않습니다.
+                annotate(retries=1)
+                rate_limit.penalize(tier.model, delay)
+            elif "Connection error" in str(e) and attempt < retries - 1:
+                annotate(retries=1)
+                if notify:
+                    st.warning(f"DALL-E 연결 오류. {delay}초 후 재시도합니다... ({attempt + 1}/{retries})")
                 time.sleep(delay)
             else:
-                st.error(f"DALL-E 이미지 생성 중 오류 발생: {e}")
+                annotate(error=type(e).__name__)
+                if notify:
+                    st.error(f"DALL-E 이미지 생성 중 오류 발생: {e}")
                 return None
 
 
+@traced("image_collage")
+def compose_collage(sources, tier):
+    """옷장 썸네일 콜라주를 로컬에서 만들어 이미지 저장소 경로를 반환하는 함수 (실패하면 None)
+
+    콜라주는 참조 수를 올리지 않고 저장하므로, 용량이 모자라면 오래된 것부터 지워질 수 있습니다.
+    지워진 콜라주는 displayable_image()가 걸러 내고, 저장할 때는 다시 만들거나 고화질로 생성합니다.
+    """
+    try:
+        data = image_tiers.collage(sources, tier.pixels[0])
+        annotate(payload_bytes=len(data), tier=tier.name)
+        return image_store.path(image_store.put(data, acquire=False))
+    except Exception as e:
+        annotate(error=type(e).__name__)
+        return None
+
+
+def displayable_image(url):
+    """화면에 보여 줄 수 있는 이미지 주소인지 확인하는 함수 (저장소에서 지워진 로컬 콜라주는 None)"""
+    if url and not url.startswith(("http://", "https://")) and not os.path.exists(url):
+        return None
+    return url
+
+
+def render_outfit_image(prompt, tier=None, collage_sources=None, notify=True):
+    """품질 단계에 맞춰 코디 이미지를 만들고 (이미지 주소, 실제 사용한 단계 이름)을 반환하는 함수
+
+    collage_sources는 콜라주 단계일 때만 호출되는 함수로, 콜라주에 쓸 이미지 목록을 반환합니다.
+    콜라주를 만들 수 없으면 전체 해상도 단계로 생성합니다.
+    """
+    tier = image_tiers.get(tier)
+    if tier.local:
+        url = compose_collage(collage_sources(), tier) if collage_sources else None
+        if url:
+            return url, tier.name
+        tier = image_tiers.get(image_tiers.FULL_TIER)
+    return generate_image_with_dalle(prompt, notify=notify, tier=tier.name), tier.name
+
+
+def closet_collage_sources(garment_bytes, index, analysis=None, closet=None):
+    """index번째 코디 콜라주 재료: 분석한 옷 사진과 옷장에서 종류가 다른 옷 썸네일 최대 3장 (코디마다 다른 조합)
+
+    작업 스레드에서 부를 때는 세션 상태 대신 analysis와 closet을 넘깁니다.
+    """
+    analysis = st.session_state.get("analysis_result") if analysis is None else analysis
+    closet = st.session_state.my_closet if closet is None else closet
+    item_type = (analysis or {}).get("item_type")
+    others = [item for item in closet if item["analysis"].get("item_type") != item_type]
+    if others:
+        shift = index * 3 % len(others)
+        others = others[shift:] + others[:shift]
+    thumbnails = [path for path in thumbnail_paths([item["image_id"] for item in others[:3]], 256) if path]
+    return ([garment_bytes] if garment_bytes else []) + thumbnails
+
+
+def upgrade_recommendation_image(output, i):
+    """미리보기 이미지를 전체 해상도로 다시 생성해 추천 결과에 반영하는 함수 (성공하면 True)"""
+    url, tier_name = render_outfit_image(output["image_prompts"][i], image_tiers.FULL_TIER)
+    if not url:
+        return False
+    output["image_urls"][i] = url
+    output["image_tiers"][i] = tier_name
+    record_event("recommendation_set", output=output)
+    return True
+
+
+def wait_for_quota(name):
+    """호출 한도 대기열에서 차례를 기다리고 대기 시간을 현재 호출 기록에 남기는 함수"""
+    waited = rate_limit.acquire(name)
+    if waited:
+        annotate(queue_wait_ms=waited * 1000)
+
+
+def call_gemini(model, contents, **kwargs):
+    """호출 한도를 지켜 Gemini를 호출하는 함수. 한도 초과 응답을 받으면 대기열 전체가 잠시 쉬도록 합니다."""
+    wait_for_quota(GEMINI_MODEL)
+    try:
+        response = async_services.generate_content(model or llm_model, contents, **kwargs)
+    except Exception as e:
+        if rate_limit.is_rate_limit_error(e):
+            rate_limit.penalize(GEMINI_MODEL, 10)
+        raise
+    annotate_gemini_usage(response)
+    return response
+
+
+def generate_json(contents, schema, model=None):
+    """응답 스키마를 지정해 Gemini를 호출하고 응답 텍스트를 반환하는 함수"""
+    return call_gemini(model, contents, generation_config=structured_output.generation_config(schema)).text
+
+
+def generate_text(contents, model=None):
+    return call_gemini(model, contents).text
+
+
+def get_prompt(name):
+    """세션별로 고정된 A/B 변형의 프롬프트를 고르고, 현재 호출 기록에 프롬프트 키를 남기는 함수"""
+    template = prompts.get(name, session_key=st.session_state.prompt_session_key)
+    annotate(prompt=template.key)
+    return template
+
+
+@traced("analyze_clothing", model="gemini-1.5-flash")
 def analyze_clothing_image(uploaded_image):
+    annotate(payload_bytes=uploaded_image.size if hasattr(uploaded_image, "size") else 0,
+             parse="structured" if STRUCTURED_OUTPUT else "legacy")
     img = Image.open(uploaded_image)
-    prompt = """
-    당신은 패션 스타일리스트이자 의류 분석 전문가입니다. 이 이미지에 있는 옷을 분석해서 아래 JSON 형식에 맞춰 답변해주세요. 각 항목에 대해 가장 적절한 단 하나의 값만 선택해주세요. **중요: 답변에는 JSON 코드 외에 어떤 설명이나 인사도 포함하지 말고, 오직 JSON 객체만 응답해야 합니다.**
-    {"item_type": "상의, 하의, 아우터, 신발, 액세서리 중 하나", "category": "티셔츠, 셔츠, 청바지 등 구체적인 카테고리", "color": "옷의 가장 주된 색상", "pattern": "솔리드(단색), 스트라이프, 체크 등", "style_tags": ["캐주얼", "미니멀", "스트리트", "포멀", "스포티"]}
-    """
+    template = get_prompt("clothing_analysis" if STRUCTURED_OUTPUT else "clothing_analysis_text")
+    model = prompts.model_for(template)
+    contents = [template.render(), img]
+    schema = structured_output.CLOTHING_SCHEMA
+    text = ""
     try:
-        response = llm_model.generate_content([prompt, img])
-        match = re.search(r"\{.*\}", response.text, re.DOTALL)
-        if match:
-            return json.loads(match.group(0))
-        else:
-            st.error("AI 응답에서 JSON을 찾을 수 없습니다.");
-            st.code(response.text)
-            return None
+        text = generate_json(contents, schema, model) if STRUCTURED_OUTPUT else generate_text(contents, model)
+        try:
+            analysis = ClothingAnalysis.from_text(text)
+        except ParseError:
+            # 형식만 깨진 경우에는 이미지를 다시 보내지 않고 답변 텍스트를 JSON으로 옮겨 적게 합니다.
+            annotate(repairs=1)
+            analysis = ClothingAnalysis.from_text(generate_json(structured_output.reformat_prompt(text, schema), schema))
+        if analysis.missing:
+            # 빠진 필드만 짧게 다시 묻습니다.
+            annotate(repairs=1)
+            missing = list(analysis.missing)
+            repaired = generate_json([structured_output.clothing_repair_prompt(analysis, missing), img],
+                                     structured_output.subschema(schema, missing))
+            analysis.merge(structured_output.extract_json(repaired))
+        return analysis.to_dict()
+    except ParseError:
+        annotate(error="ParseError")
+        st.error("AI 응답에서 분석 결과를 읽을 수 없습니다.");
+        st.code(text)
+        return None
     except Exception as e:
+        annotate(error=type(e).__name__)
         st.error(f"이미지 분석 중 오류 발생: {e}");
         return None
 
 
-def get_cody_recommendation_with_image(user_info, clothing_info, situation):
-    prompt = f"""
-    당신은 친절하고 스타일리시한 AI 패션 어드바이저입니다. 고객 정보, 의류 아이템, 주어진 상황을 바탕으로 최고의 코디를 추천해주세요. **중요: 답변의 가독성을 높이기 위해 다음 규칙을 반드시 지켜주세요.** 1. 각 코디 제안의 제목은 Markdown의 `##`를 사용하여 크고 굵게 표시해주세요. 2. 설명에 어울리는 이모티콘(👕,👖,👟,✨ 등)을 자유롭게 사용해주세요. 3. 의류 아이템, 색상, 스타일 등 중요한 키워드는 `<span style='color: #87CEEB;'>키워드</span>` 와 같이 HTML 태그를 사용해 색상을 입혀 강조해주세요. 4. 추천된 각 아이템 뒤에는 검색 가능한 키워드를 `(검색 키워드: [키워드])` 형식으로 추가해주세요.
-    ## 🧑‍💻 고객 정보:
-    - 성별: {user_info['성별']}; - 키: {user_info['키']}cm, 몸무게: {user_info['몸무게']}kg; - 피부 톤: {user_info['피부_톤']}; - 선호 스타일: {', '.join(user_info['선호_스타일'])}
-    ## 👚 분석된 의류 아이템:
-    - 종류: {clothing_info['item_type']}, 카테고리: {clothing_info['category']}, 색상: {clothing_info['color']}, 패턴: {clothing_info['pattern']}
-    ## 🏞️ 주어진 상황:
-    - {situation}
-    ## 요청 사항:
-    1. 위 정보를 종합하여, 총 **두 가지 스타일의 완성된 코디**를 추천하고, 각 코디를 추천한 이유를 친절하게 설명해주세요.
-    2. 각 코디 설명 후, DALL-E가 이미지를 생성할 수 있도록, **고객의 성별을 반영**하고 **주어진 상황을 반영**하여 해당 코디를 입은 모델의 모습을 상세하고 사실적으로 묘사하는 **영어 프롬프트**를 다음 형식으로 제공해주세요: `IMAGE_PROMPT_1: [첫 번째 코디에 대한 상세한 영어 묘사]`, `IMAGE_PROMPT_2: [두 번째 코디에 대한 상세한 영어 묘사]`
+def get_recommendation_prompt():
+    return get_prompt("cody_recommendation" if STRUCTURED_OUTPUT else "cody_recommendation_text")
+
+
+@traced("cody_recommendation", model="gemini-1.5-flash")
+def build_cody_recommendation(template, user_info, clothing_info, situation, weather_context=None):
+    """코디 추천 (설명, 이미지 프롬프트, 검색 키워드)을 만드는 함수. 세션 상태와 화면을 쓰지 않아 작업 스레드에서도 부릅니다."""
+    annotate(parse="structured" if STRUCTURED_OUTPUT else "legacy", prompt=template.key)
+    model = prompts.model_for(template)
+    prompt = template.render(gender=user_info['성별'], height=user_info['키'], weight=user_info['몸무게'],
+                             skin_tone=user_info['피부_톤'], styles=', '.join(user_info['선호_스타일']),
+                             item_type=clothing_info['item_type'], category=clothing_info['category'],
+                             color=clothing_info['color'], pattern=clothing_info['pattern'], situation=situation,
+                             weather=weather_context or "정보 없음")
+    text = generate_json(prompt, structured_output.RECOMMENDATION_SCHEMA, model) if STRUCTURED_OUTPUT \
+        else generate_text(prompt, model)
+    recommendation = CodyRecommendation.from_text(text)
+    missing = recommendation.missing_image_prompts()
+    if missing:
+        # 설명은 살리고 이미지 프롬프트가 빠진 코디만 짧게 다시 묻습니다.
+        annotate(repairs=1)
+        repaired = generate_json(
+            structured_output.image_prompt_repair_prompt(recommendation, missing, user_info['성별'], situation),
+            structured_output.IMAGE_PROMPTS_SCHEMA)
+        for i, image_prompt in zip(missing, structured_output.extract_json(repaired).get("image_prompts", [])):
+            recommendation.outfits[i].image_prompt = image_prompt
+    display_text = recommendation.display_text()
+    if template.postprocess:
+        display_text = template.postprocess(display_text)
+    return display_text, recommendation.image_prompts, recommendation.search_keywords
+
+
+def compose_recommendation(template, user_info, analysis, situation, weather_context, garment_bytes, closet, owner,
+                           notify=True, check=None):
+    """추천 설명 → 미리보기 이미지 → 음성 순서로 추천 결과를 만드는 함수 (check는 단계 사이마다 취소 여부를 확인)
+
+    먼저 미리보기 단계로 빠르게 보여 주고, 저장하거나 크게 볼 때만 전체 해상도로 다시 만듭니다.
+    """
+    text, image_prompts, keywords = build_cody_recommendation(template, user_info, analysis, situation,
+                                                              weather_context)
+    if not text or not image_prompts:
+        return None
+    images = []
+    for i, prompt in enumerate(image_prompts):
+        if check:
+            check()
+        images.append(render_outfit_image(prompt, image_tiers.PREVIEW_TIER, lambda i=i: closet_collage_sources(
+            garment_bytes, i, analysis, closet), notify=notify))
+    if check:
+        check()
+    return {"text": text, "keywords": keywords, "image_urls": [url for url, _ in images],
+            "image_tiers": [tier for _, tier in images], "image_prompts": image_prompts,
+            "audio": make_audio(text, owner=owner, notify=notify)}
+
+
+@traced("cody_recommendation_batch", model="gemini-1.5-flash")
+def get_batch_cody_recommendations(template, user_info, batch_items):
+    """여러 (옷, 상황, 날짜) 요청을 Gemini 호출 한 번으로 추천받는 함수 (빠진 항목은 None, 작업 스레드에서 호출)"""
+    annotate(prompt=template.key, items=len(batch_items))
+    request_lines = []
+    for i, item in enumerate(batch_items):
+        g = item.garment
+        line = f"[{i}] 아이템: {g['item_type']} / {g['category']} / {g['color']} / {g['pattern']} · 상황: {item.situation}"
+        if item.date:
+            line += f" · 날짜: {item.date}"
+        if item.weather:
+            line += f" · 날씨: {item.weather}"
+        request_lines.append(line)
+    prompt = template.render(gender=user_info['성별'], height=user_info['키'], weight=user_info['몸무게'],
+                             skin_tone=user_info['피부_톤'], styles=', '.join(user_info['선호_스타일']),
+                             requests="\n".join(request_lines))
+    text = generate_json(prompt, structured_output.BATCH_RECOMMENDATION_SCHEMA, prompts.model_for(template))
+    results = structured_output.parse_batch_recommendations(text, len(batch_items))
+    missing = sum(r is None for r in results)
+    if missing:
+        annotate(repairs=missing)
+    return results
+
+
+def run_batch_recommendations(user_info, batch_items):
+    """배치 추천을 실행하고 항목별 결과 딕셔너리를 끝나는 순서대로 내보내는 제너레이터"""
+    template = get_prompt("cody_recommendation_batch")
+    session_key = st.session_state.prompt_session_key
+    # 작업 스레드에서는 옷장을 읽을 수 없으므로 미리보기가 콜라주 단계면 배치 이미지는 전체 해상도로 만듭니다.
+    batch_tier = image_tiers.PREVIEW_TIER
+    if image_tiers.get(batch_tier).local:
+        batch_tier = image_tiers.FULL_TIER
+    stats = {}
+
+    def in_batch_queue(func):
+        # 작업 스레드에서 실행되므로 우선순위와 세션을 직접 지정합니다 (대화형 요청이 먼저 처리됨).
+        def wrapper(*args):
+            with rate_limit.context(priority=rate_limit.BATCH, session=session_key):
+                return func(*args)
+        return wrapper
+
+    for result in batch.run_batch(
+            batch_items,
+            recommend_chunk=in_batch_queue(lambda chunk: get_batch_cody_recommendations(template, user_info, chunk)),
+            generate_image=in_batch_queue(lambda prompt: render_outfit_image(prompt, batch_tier, notify=False)),
+            recommend_one=in_batch_queue(lambda item: get_batch_cody_recommendations(template, user_info, [item])[0]),
+            stats=stats):
+        item = result.item
+        entry = {"label": item.label, "situation": item.situation, "date": item.date, "ok": result.ok}
+        if result.ok:
+            text = result.recommendation.display_text()
+            images = [image or (None, None) for image in result.image_urls]
+            entry.update(text=template.postprocess(text) if template.postprocess else text,
+                         keywords=result.recommendation.search_keywords,
+                         image_urls=[url for url, _ in images], image_tiers=[tier for _, tier in images])
+        yield result.index, entry, stats
+
+
+@traced("catalog_search")
+def find_products(keywords, max_price=None):
+    """추천 키워드별로 카탈로그의 상위 상품을 찾는 함수 (카탈로그가 없으면 빈 결과)"""
+    if product_catalog is None:
+        return {}
+    product_catalog.refresh()
+    products = product_catalog.resolve(keywords, k=3, max_price=max_price)
+    annotate(payload_bytes=sum(len(items) for items in products.values()))
+    return products
+
+
+def render_products(keyword, products):
+    """키워드 하나의 상품 카드를 그리는 함수 (상품이 없으면 무신사 검색 링크)"""
+    musinsa_url = f"https://www.musinsa.com/search/musinsa/integration?q={quote(keyword)}"
+    if not products:
+        st.markdown(f"- [{keyword} 찾아보기]({musinsa_url})")
+        return
+    st.markdown(f"**{keyword}** · [무신사에서 더 보기]({musinsa_url})")
+    for col, product in zip(st.columns(3), products):
+        with col:
+            if product["image_url"]:
+                st.image(product["image_url"], use_container_width=True)
+            price = f" · {product['price']:,.0f}원" if product["price"] is not None else ""
+            name = f"[{product['name']}]({product['url']})" if product["url"] else product["name"]
+            st.caption(f"{product['brand']}{price}")
+            st.markdown(name)
+
+
+def remember_recommendation(output, situation, garment, weather=None, date=None):
+    """추천 결과를 입력값과 함께 추천 기록에 남기는 함수 (실패해도 추천 화면은 그대로 보여 줌)"""
+    try:
+        history.add(st.session_state.prompt_session_key, output,
+                    {"situation": situation, "garment": garment, "weather": weather, "date": date})
+    except (sqlite3.Error, OSError) as e:
+        st.warning(f"추천 기록 저장에 실패했습니다: {e}")
+
+
+def render_batch_entry(entry):
+    """배치 추천 결과 한 항목을 그리는 함수"""
+    st.markdown(f"#### 📅 {entry['date'] or ''} · {entry['situation']} · {entry['label']}")
+    if not entry["ok"]:
+        st.warning("이 항목은 추천을 받지 못했습니다. 다시 시도해주세요.")
+        return
+    st.markdown(entry["text"], unsafe_allow_html=True)
+    if entry["keywords"]:
+        st.markdown(" · ".join(f"[{k}](https://www.musinsa.com/search/musinsa/integration?q={quote(k)})"
+                               for k in dict.fromkeys(entry["keywords"])))
+    tiers = entry.get("image_tiers") or [None] * len(entry["image_urls"])
+    images = [(url, tier) for url, tier in zip(entry["image_urls"], tiers) if displayable_image(url)]
+    if images:
+        for col, (url, tier) in zip(st.columns(len(images)), images):
+            col.image(url, caption=image_tiers.get(tier).label, use_container_width=True)
+
+
+@traced("garment_palette")
+def extract_garment_palette(image_file):
+    """옷 사진에서 대표 색 팔레트를 로컬로 추출하는 함수 (실패하면 빈 목록)"""
+    try:
+        return image_service.palette(image_file).result()
+    except Exception as e:
+        annotate(error=type(e).__name__)
+        return []
+
+
+@traced("embed_image")
+def index_image(index, item_id, image):
+    """이미지 특징 벡터를 계산해 유사도 인덱스에 추가하는 함수 (이미 있으면 건너뜀)"""
+    if item_id in index:
+        return
+    try:
+        index.add(item_id, image_service.embed(image).result())
+    except Exception as e:
+        annotate(error=type(e).__name__)
+
+
+@traced("embed_images")
+def index_images(index, images):
+    """(항목 id, 이미지) 목록 중 인덱스에 없는 것만 작업자 프로세스에서 한꺼번에 계산해 추가하는 함수"""
+    jobs = {item_id: image_service.embed(image) for item_id, image in images if item_id not in index}
+    annotate(items=len(jobs))
+    for item_id, job in jobs.items():
+        try:
+            index.add(item_id, job.result())
+        except Exception as e:
+            annotate(error=type(e).__name__)
+
+
+def thumbnail_paths(image_ids, max_size=512):
+    """썸네일을 작업자 프로세스에서 한꺼번에 만들고 파일 경로 목록을 반환하는 함수 (원본이 없는 이미지는 None)"""
+    jobs = [image_service.thumbnail(image_id, max_size) for image_id in image_ids]
+    paths = []
+    for image_id, job in zip(image_ids, jobs):
+        try:
+            digest = job.result()
+        except FileNotFoundError:
+            digest = None
+        except Exception:
+            # 작업자를 쓸 수 없으면 이 스레드에서 만듭니다.
+            try:
+                digest = image_store.thumbnail(image_id, max_size)
+            except FileNotFoundError:
+                digest = None
+        # 만든 직후 다른 워커가 용량 때문에 지웠을 수도 있으므로 파일이 있는지 확인합니다.
+        paths.append(image_store.path(digest) if digest and image_store.contains(digest) else None)
+    return paths
+
+
+def sync_outfit_index():
+    """이 세션이 저장한 코디 중 아직 인덱스에 없는 이미지만 추가하고, 파일 저장소에서 정리된 코디는 인덱스에서 빼는 함수
+
+    검색 후보로 쓸 이 세션의 코디 파일 이름 목록을 반환합니다 (다른 세션의 코디가 결과에 섞이지 않도록).
     """
+    # 인덱스 id를 먼저 읽어야 그 사이 다른 워커가 저장·등록한 코디를 정리된 것으로 잘못 빼지 않습니다.
+    indexed = outfit_embeddings.ids()
+    tracked = {os.path.basename(path) for path in files.paths("saved_outfits")}
+    for filename in indexed:
+        if filename not in tracked:
+            outfit_embeddings.remove(filename)
+    own = [(os.path.basename(path), path) for path in session_outfit_files()]
+    index_images(outfit_embeddings, own)
+    return [filename for filename, _ in own]
+
+
+def session_outfit_files():
+    """이 세션이 저장한 코디 파일 경로 목록 (저장한 순서)"""
+    return [path for path in files.paths("saved_outfits", owner=st.session_state.prompt_session_key)
+            if os.path.exists(path)]
+
+
+def embedding_of(index, item_id, image):
+    """인덱스의 임베딩을 반환하는 함수 (아직 없으면 로컬에서 계산해 넣은 뒤 반환)"""
+    index_image(index, item_id, image)
+    return index.vector(item_id)
+
+
+@traced("wardrobe_export")
+def export_wardrobe():
+    """옷장과 이 세션이 저장한 코디를 보관 파일(zip)로 만들어 (임시 파일, 통계)를 반환하는 함수"""
+    archive = tempfile.TemporaryFile()
+    outfits = [(path, embedding_of(outfit_embeddings, os.path.basename(path), path)) for path in session_outfit_files()]
+    stats = wardrobe_archive.export_archive(
+        archive, [item for item in st.session_state.my_closet if not item.get("unavailable")], image_store.get_bytes,
+        closet_vector=lambda image_id: embedding_of(closet_embeddings, image_id, image_store.path(image_id)),
+        outfits=outfits)
+    annotate(items=stats["closet"] + stats["outfits"], payload_bytes=archive.tell())
+    archive.seek(0)
+    return archive, stats
+
+
+def usable_vector(index, vector):
+    return vector if vector is not None and vector.size == index.dim else None
+
+
+@traced("wardrobe_import")
+def import_wardrobe(archive_file):
+    """보관 파일의 옷과 코디를 이 세션에 추가하고 통계를 반환하는 함수 (이미 있는 이미지는 건너뛰고 분석을 다시 하지 않음)"""
+    known = {item["image_id"] for item in st.session_state.my_closet}
+    known.update(wardrobe_archive.file_sha256(path) for path in session_outfit_files())
+    stats = {"closet": 0, "outfits": 0}
+    for entry in wardrobe_archive.read_archive(archive_file, known, stats):
+        if entry.kind == "closet":
+            # 같은 호스트의 저장소에 원본이 남아 있으면 그대로 다시 씁니다.
+            if image_store.contains(entry.content_hash):
+                image_id = store_closet_image(None, entry.content_hash)
+            else:
+                image_id = store_closet_image(entry.data)
+            item = {"image_id": image_id, "name": entry.name, "analysis": entry.analysis, "palette": entry.palette}
+            st.session_state.color_index.add(image_id, item["palette"])
+            vector = usable_vector(closet_embeddings, entry.vector)
+            if vector is not None and image_id not in closet_embeddings:
+                closet_embeddings.add(image_id, vector)
+            st.session_state.my_closet.append(item)
+            record_event("closet_added", item=item)
+            stats["closet"] += 1
+        elif entry.kind == "outfit":
+            path = files.put_bytes("saved_outfits", entry.data, ".webp", owner=st.session_state.prompt_session_key,
+                                   prefix="saved")
+            vector = usable_vector(outfit_embeddings, entry.vector)
+            if vector is not None:
+                outfit_embeddings.add(os.path.basename(path), vector)
+            st.session_state.saved_images.append(path)
+            record_event("saved_image_added", url=path)
+            stats["outfits"] += 1
+    annotate(items=stats["read"], skipped=stats["skipped"], payload_bytes=getattr(archive_file, "size", 0))
+    return stats
+
+
+@traced("personal_color_local")
+def analyze_personal_color_locally(face_image):
+    """NumPy 색상 분석으로 퍼스널 컬러를 먼저 판정하는 함수 (애매하면 season이 'uncertain')"""
     try:
-        response = llm_model.generate_content(prompt)
-        recommendation_text = response.text
-        image_prompts = re.findall(r"IMAGE_PROMPT_\d:\s*(.*)", recommendation_text)
-        search_keywords = re.findall(r"\(검색 키워드: (.*?)\)", recommendation_text)
-        display_text = re.sub(r"\(검색 키워드: .*?\)", "", recommendation_text)
-        display_text = re.sub(r"IMAGE_PROMPT_\d:\s*.*", "", display_text).strip()
-        return display_text, image_prompts, search_keywords
+        return image_service.personal_color(face_image).result()
     except Exception as e:
-        st.error(f"코디 추천 중 오류 발생: {e}");
-        return None, None, None
+        annotate(error=type(e).__name__)
+        return {"season": personal_color.UNCERTAIN, "confidence": 0.0, "features": None}
 
 
-def analyze_personal_color(face_image):
+@traced("personal_color", model="gemini-1.5-flash")
+def analyze_personal_color(face_image, local_result=None):
+    annotate(payload_bytes=face_image.size if hasattr(face_image, "size") else 0)
     img = Image.open(face_image)
-    prompt = """
-    당신은 전문 퍼스널 컬러 컨설턴트입니다. 이 인물의 얼굴 사진을 보고, 피부의 언더톤, 머리카락과 눈동자 색의 대비 등을 종합적으로 분석하여 가장 가능성이 높은 퍼스널 컬러를 진단해주세요.
-    답변은 아래 형식과 같이 **진단 결과**와 **진단 근거**를 명확히 구분하여 작성해주세요. 진단 근거는 2~3가지 핵심적인 이유를 간결한 불릿 포인트로 설명해야 합니다.
-    **진단 결과**: [🌱봄 웜톤, 🌊여름 쿨톤, 🍂가을 웜톤, ❄️겨울 쿨톤 중 하나]
-    **진단 근거**:
-    * 피부 톤: [피부 톤에 대한 구체적인 분석]
-    * 헤어/눈동자 컬러: [헤어와 눈동자 컬러에 대한 구체적인 분석]
-    * 전체적인 조화: [전체적인 이미지와 색의 조화에 대한 분석]
-    """
+    template = get_prompt("personal_color")
+    local_hint = ""
+    if local_result and local_result.get("features"):
+        f = local_result["features"]
+        season_hint = local_result["season"] if local_result["season"] != personal_color.UNCERTAIN else "판단 보류"
+        local_hint = (f"\n참고용 로컬 색상 측정값: 피부 Lab=({f['skin_L']:.0f}, {f['skin_a']:.0f}, {f['skin_b']:.0f}), "
+                      f"피부 색상각 {f['skin_hue']:.0f}°, 피부와 헤어/눈동자 명도 차 {f['contrast']:.0f}, 예비 진단: {season_hint}")
     try:
-        response = llm_model.generate_content([prompt, img])
-        return response.text.strip()
+        return generate_text([template.render(local_hint=local_hint), img], prompts.model_for(template)).strip()
     except Exception as e:
+        annotate(error=type(e).__name__)
         st.error(f"퍼스널 컬러 분석 중 오류 발생: {e}");
         return None
 
 
-def make_audio(text_to_speak, filename):
-    if not os.path.exists("audio"): os.makedirs("audio")
+@traced("tts", model="tts-1")
+def make_audio(text_to_speak, owner=None, notify=True):
     clean_text = re.sub('<.*?>', '', text_to_speak)
+    annotate(chars=len(clean_text))
     try:
-        response = openai_client.audio.speech.create(model="tts-1", input=clean_text, voice="echo",
-                                                     response_format="mp3", speed=1.2)
-        filepath = os.path.join("audio", filename)
-        response.stream_to_file(filepath)
+        wait_for_quota("tts-1")
+        filepath = files.write_with("audio", ".mp3", lambda path: async_services.create_speech(
+            openai_client, path, model="tts-1", input=clean_text, voice="echo", response_format="mp3", speed=1.2),
+            owner=owner or st.session_state.prompt_session_key, prefix="tts")
+        annotate(payload_bytes=os.path.getsize(filepath))
         return filepath
     except Exception as e:
-        st.error(f"음성 생성 중 오류가 발생했습니다: {e}")
+        annotate(error=type(e).__name__)
+        if notify:
+            st.error(f"음성 생성 중 오류가 발생했습니다: {e}")
         return None
 
 
+# --- 1.6. 세션 상태 저널 ---
+
+@traced("journal_restore")
+def open_journal(session_id):
+    """세션 키의 이벤트 저널을 열고 저장된 상태를 세션에 되살리는 함수 (저널을 쓸 수 없으면 None)"""
+    try:
+        journal = event_journal.open_session(session_id)
+    except (OSError, ValueError) as e:
+        annotate(error=type(e).__name__)
+        st.warning(f"세션 기록을 열지 못해 이번 세션의 상태는 저장되지 않습니다: {e}")
+        return None
+    if journal is None:
+        return None
+    restored = journal.restored_state()
+    unavailable = restore_closet_images(journal, session_id, restored.get("my_closet", []))
+    if unavailable:
+        st.warning(f"옷장의 옷 {unavailable}벌은 이미지를 찾을 수 없어 표시만 해 둡니다. "
+                   "삭제한 뒤 보관 파일에서 다시 들여올 수 있습니다.")
+    st.session_state.update(restored)
+    if restored.get("user_info"):
+        user_info = restored["user_info"]
+        st.session_state.성별, st.session_state.키, st.session_state.몸무게 = user_info['성별'], user_info['키'], \
+            user_info['몸무게']
+        st.session_state.피부_톤, st.session_state.선호_스타일 = user_info['피부_톤'], user_info['선호_스타일']
+    annotate(events=journal.seq, replayed=journal.replayed_on_restore, unavailable=unavailable)
+    return journal
+
+
+def restore_closet_images(journal, session_id, closet):
+    """되살린 옷장의 이미지를 공유 저장소에 다시 잡아 두고, 찾을 수 없는 옷 수를 반환하는 함수
+
+    재배포나 재부팅으로 저장소(/dev/shm)가 비워졌으면 저널 옆에 보관한 사본으로 다시 넣고,
+    사본도 없는 옷은 기록에서 지우지 않고 unavailable로 표시만 합니다.
+    참조는 세션 키 단위로 한 번만 세므로 같은 sid로 여러 번 접속해도 늘지 않습니다.
+    """
+    unavailable = 0
+    for item in closet:
+        image_id = item["image_id"]
+        try:
+            if image_store.contains(image_id):
+                image_store.acquire(image_id, holder=session_id)
+                # 사본이 없던 예전 저널은 지금 채워 둡니다.
+                if not os.path.exists(journal.image_path(image_id)):
+                    journal.keep_image(image_id, image_store.get_bytes(image_id))
+                continue
+            data = journal.load_image(image_id)
+            if data is not None:
+                image_store.put(data, holder=session_id)
+                continue
+        except OSError as e:
+            annotate(error=type(e).__name__)
+        item["unavailable"] = True
+        unavailable += 1
+    return unavailable
+
+
+def store_closet_image(data, image_id=None):
+    """옷장에 넣을 이미지를 이 세션 몫으로 저장소에 잡아 두고 저널 옆에 사본을 남긴 뒤 해시를 반환하는 함수
+
+    image_id를 주면 저장소에 이미 있는 그 이미지를 다시 씁니다 (data는 사본이 없을 때만 읽음).
+    """
+    owner = st.session_state.prompt_session_key
+    if image_id is None:
+        image_id = image_store.put(data, holder=owner)
+    else:
+        image_store.acquire(image_id, holder=owner)
+    journal = st.session_state.get("journal")
+    if journal is not None and not os.path.exists(journal.image_path(image_id)):
+        try:
+            journal.keep_image(image_id, data if data is not None else image_store.get_bytes(image_id))
+        except OSError as e:
+            st.warning(f"옷장 이미지 사본 저장에 실패해 재시작 후에는 복구되지 않을 수 있습니다: {e}")
+    return image_id
+
+
+def release_closet_image(image_id):
+    """옷장에서 마지막으로 빠진 이미지의 이 세션 참조와 저널 사본을 놓아주는 함수"""
+    image_store.release(image_id, holder=st.session_state.prompt_session_key)
+    journal = st.session_state.get("journal")
+    if journal is not None:
+        journal.drop_image(image_id)
+
+
+def record_event(kind, **data):
+    """세션 상태 변경을 이벤트 저널에 남기는 함수 (기록에 실패해도 화면 동작은 계속됩니다)"""
+    journal = st.session_state.get("journal")
+    if journal is None:
+        return
+    try:
+        journal.append(kind, **data)
+    except OSError as e:
+        st.warning(f"세션 기록 저장에 실패했습니다: {e}")
+
+
+# --- 1.7. 기본 상황 코디 추천 미리 생성 ---
+DEFAULT_SITUATION = "일상적인 상황"
+speculator = speculation.get_speculator()
+
+
+def current_weather_context():
+    """사이드바에서 조회한 날씨를 추천 프롬프트용 문장으로 바꾸는 함수 (조회 전이면 None)"""
+    if not st.session_state.get("weather_data"):
+        return None
+    weather_location = st.session_state.weather_data["location"]
+    weather_date = st.session_state.selected_date.strftime('%Y%m%d')
+    return format_weather_for_prompt(get_daily_features(weather_location, weather_date),
+                                     weather_location, weather_date) or None
+
+
+def recommendation_key(template, situation, weather_context):
+    """추천 결과를 결정하는 입력들로 만든 추천 요청 키 (미리 만든 결과를 찾는 데 씁니다)"""
+    tier = image_tiers.get(image_tiers.PREVIEW_TIER)
+    # 콜라주 단계일 때만 옷장 구성이 이미지에 영향을 줍니다.
+    closet_ids = [item["image_id"] for item in st.session_state.my_closet] if tier.local else []
+    return speculation.request_key(template.key, st.session_state.user_info, st.session_state.analysis_result,
+                                   situation, weather_context, tier.name, closet_ids)
+
+
+def recommendation_inputs(situation, weather_context, template=None):
+    """compose_recommendation()에 넘길 인자 (세션 상태의 복사본)"""
+    garment_bytes = st.session_state.cloth_photo_object.getvalue() \
+        if st.session_state.get("cloth_photo_object") else None
+    return (template or get_recommendation_prompt(), dict(st.session_state.user_info),
+            dict(st.session_state.analysis_result), situation, weather_context, garment_bytes,
+            list(st.session_state.my_closet), st.session_state.prompt_session_key)
+
+
+def speculate_default_recommendation():
+    """분석 직후 기본 상황의 추천(설명, 미리보기 이미지, 음성)을 백그라운드에서 미리 만들기 시작하는 함수"""
+    if not speculation.ENABLED or not st.session_state.get("user_info") \
+            or not st.session_state.get("analysis_result"):
+        return
+    template = get_recommendation_prompt()
+    weather_context = current_weather_context()
+    key = recommendation_key(template, DEFAULT_SITUATION, weather_context)
+    # 작업 스레드에서는 세션 상태를 읽을 수 없으므로 필요한 값을 지금 복사해 둡니다.
+    args = recommendation_inputs(DEFAULT_SITUATION, weather_context, template)
+    speculator.start(key, st.session_state.prompt_session_key,
+                     lambda spec: compose_recommendation(*args, notify=False, check=spec.check))
+
+
 # --- 2. 사이드바 및 페이지 상태 관리 ---
+profiler.mark("sidebar")
 st.sidebar.title("옷타쿠")
 st.sidebar.text("'옷타쿠'는 '옷'과 '오타쿠'의 합성어로, 옷을 진심으로 사랑하는 사람들을 위한 AI 기반 퍼스널 스타일리스트입니다.")
 if st.sidebar.button("🏠 나의 맞춤 패션 추천", use_container_width=True): st.session_state.page = "main"
@@ -281,11 +918,9 @@ if st.sidebar.button("👚 나의 옷장", use_container_width=True): st.session
 if st.sidebar.button("🎨 퍼스널 컬러 분석", use_container_width=True): st.session_state.page = "personal_color"
 if st.sidebar.button("📊 패션 데이터 분석", use_container_width=True): st.session_state.page = "analytics"
 if st.sidebar.button("🔎 옷 입혀보기 AI", use_container_width=True): st.session_state.page = "vton"
+if is_admin and st.sidebar.button("🛠️ 성능 대시보드", use_container_width=True): st.session_state.page = "admin"
 
 # --- 사이드바 날씨 기능 ---
-st.sidebar.divider()
-st.sidebar.subheader("🌤️ 오늘의 날씨 및 옷차림 추천")
-
 # --- ✨ (수정) 날짜 범위 설정 ---
 today = datetime.now().date()
 min_date = today
@@ -300,236 +935,672 @@ if st.session_state.selected_date < min_date:
 if st.session_state.selected_date > max_date:
     st.session_state.selected_date = max_date
 
-st.sidebar.caption(f"🗓️ {min_date.strftime('%m월 %d일')} ~ {max_date.strftime('%m월 %d일')} 예보 제공")
-
-col1, col2, col3 = st.sidebar.columns([1, 4, 1])
-if col1.button("◀", use_container_width=True):
-    if st.session_state.selected_date > min_date:
-        st.session_state.selected_date -= timedelta(days=1)
-if col3.button("▶", use_container_width=True):
-    if st.session_state.selected_date < max_date:
-        st.session_state.selected_date += timedelta(days=1)
-
-st.session_state.selected_date = col2.date_input(
-    "날짜 선택",
-    value=st.session_state.selected_date,
-    min_value=min_date,
-    max_value=max_date,
-    label_visibility="collapsed"
-)
 
-locations = {"서울": (60, 127), "부산": (98, 76), "대구": (89, 90), "인천": (55, 124), "광주": (58, 74), "대전": (67, 100),
-             "울산": (102, 84), "세종": (66, 103), "경기": (60, 120), "강원": (73, 134), "충북": (69, 107), "충남": (68, 100),
-             "전북": (63, 89), "전남": (51, 67), "경북": (89, 91), "경남": (91, 77), "제주": (52, 38)}
-selected_location = st.sidebar.selectbox("조회할 지역을 선택하세요", list(locations.keys()))
-
-if st.sidebar.button("날씨 조회하기 🚀", use_container_width=True):
-    with st.spinner('날씨 데이터를 가져오는 중입니다...'):
-        nx, ny = locations[selected_location]
-        base_date, base_time = get_base_datetime() # ✨ (수정) 항상 현재 시간 기준으로 요청
-        weather_json = get_weather_data(kma_api_key, base_date, base_time, nx, ny)
-        if weather_json:
-            df = process_weather_data(weather_json)
-            st.session_state.weather_data = {"location": selected_location, "df": df} if not df.empty else None
-        else:
-            st.session_state.weather_data = None
-
-if 'weather_data' in st.session_state and st.session_state.weather_data:
-    data = st.session_state.weather_data
-    df = data["df"]
-    location = data["location"]
-    selected_date_str = st.session_state.selected_date.strftime('%Y%m%d')
-    today_forecast = df[df['fcstDate'] == selected_date_str]
-
-    if not today_forecast.empty:
-        st.sidebar.success(f"**{location}** 날씨 조회 완료!")
-        latest_data = today_forecast.iloc[0]
-        temp = latest_data.get('TMP', 'N/A')
-        clothing_recommendation = recommend_clothing(temp)
-        st.sidebar.info(f"👕 **옷차림 추천:** {clothing_recommendation}")
-        st.sidebar.metric(label="현재 기온", value=f"{temp}°C")
-        with st.sidebar.expander("상세 예보 보기"):
-            st.dataframe(df)
+
+@st.cache_resource
+def get_gazetteer():
+    return kma_grid.Gazetteer.load()
+
+
+gazetteer = get_gazetteer()
+location_modes = ["지역 선택", "주소 입력"] + (["현재 위치"] if get_geolocation else [])
+
+
+@st.fragment
+def weather_widget():
+    """사이드바 날씨 위젯 (날짜를 넘기거나 조회해도 이 위젯만 다시 실행됩니다)"""
+    st.caption(f"🗓️ {min_date.strftime('%m월 %d일')} ~ {max_date.strftime('%m월 %d일')} 예보 제공")
+
+    col1, col2, col3 = st.columns([1, 4, 1])
+    if col1.button("◀", use_container_width=True):
+        if st.session_state.selected_date > min_date:
+            st.session_state.selected_date -= timedelta(days=1)
+    if col3.button("▶", use_container_width=True):
+        if st.session_state.selected_date < max_date:
+            st.session_state.selected_date += timedelta(days=1)
+
+    st.session_state.selected_date = col2.date_input(
+        "날짜 선택",
+        value=st.session_state.selected_date,
+        min_value=min_date,
+        max_value=max_date,
+        label_visibility="collapsed"
+    )
+
+    location_mode = st.radio("위치 지정 방식", location_modes, horizontal=True, label_visibility="collapsed")
+    place = None
+    if location_mode == "지역 선택":
+        region_names = [region.name for region in gazetteer.regions()]
+        place = gazetteer.get(st.selectbox("조회할 지역을 선택하세요", region_names))
+    elif location_mode == "주소 입력":
+        address = st.text_input("주소", placeholder="예: 서울 강남구 역삼동", label_visibility="collapsed")
+        if address:
+            place = gazetteer.search(address)
+            if place is None:
+                st.caption("지명 사전에서 찾지 못했습니다. 시/군/구 이름을 넣어 보세요.")
     else:
-        st.sidebar.warning(f"{st.session_state.selected_date.strftime('%Y년 %m월 %d일')}의 예보 데이터가 없습니다.")
+        position = get_geolocation()
+        if position and position.get("coords"):
+            lat, lon = position["coords"]["latitude"], position["coords"]["longitude"]
+            near = gazetteer.nearest(lat, lon)
+            label = f"현재 위치 ({near.label} 부근)"
+            place = kma_grid.Place(label, label, lat, lon)
+        else:
+            st.caption("브라우저에서 위치 권한을 허용해 주세요.")
+    if place is not None:
+        st.caption(f"📍 {place.label} · 예보 격자 {place.grid}")
+
+    if st.button("날씨 조회하기 🚀", use_container_width=True, disabled=place is None):
+        with st.spinner('날씨 데이터를 가져오는 중입니다...'):
+            nx, ny = place.grid
+            base_date, base_time = get_base_datetime() # ✨ (수정) 항상 현재 시간 기준으로 요청
+            weather_json = get_weather_data(kma_api_key, base_date, base_time, nx, ny)
+            if weather_json:
+                df = process_weather_data(weather_json)
+                if not df.empty:
+                    # 받은 예보는 한 번만 날짜별로 나눠 요약하고, 이후 날짜 전환은 색인 조회만 합니다.
+                    forecast = ForecastIndex(df)
+                    cache_daily_features(place.label, forecast.daily_features())
+                    st.session_state.weather_data = {"location": place.label, "grid": (nx, ny), "forecast": forecast}
+                else:
+                    st.session_state.weather_data = None
+            else:
+                st.session_state.weather_data = None
+
+    if 'weather_data' in st.session_state and st.session_state.weather_data:
+        data = st.session_state.weather_data
+        location = data["location"]
+        selected_date_str = st.session_state.selected_date.strftime('%Y%m%d')
+        day = data["forecast"].get(selected_date_str)
+
+        if day is not None:
+            st.success(f"**{location}** 날씨 조회 완료!")
+            now = datetime.now(KST)
+            current = day.current(now)
+            temp = current.get('TMP', 'N/A')
+            day_features = get_daily_features(location, selected_date_str)
+            if day_features is None:
+                # 캐시가 만료되었으면 이미 나눠 둔 요약을 다시 넣습니다 (추가 API 호출 없음).
+                cache_daily_features(location, data["forecast"].daily_features())
+                day_features = day.features
+            clothing_recommendation = recommend_clothing_by_weather(day_features) if day_features else recommend_clothing(temp)
+            st.info(f"👕 **옷차림 추천:** {clothing_recommendation}")
+            is_today = selected_date_str == now.strftime('%Y%m%d')
+            st.metric(label="현재 기온" if is_today else f"{current['fcstTime'][:2]}시 기온", value=f"{temp}°C")
+            if day_features:
+                st.caption(format_weather_for_prompt(day_features))
+                if day_features.get("rain_windows"):
+                    st.caption(f"☔ 비 예상 시간: {format_rain_windows(day_features['rain_windows'])}")
+            with st.expander("상세 예보 보기"):
+                st.dataframe(day.table, hide_index=True)
+        else:
+            st.warning(f"{st.session_state.selected_date.strftime('%Y년 %m월 %d일')}의 예보 데이터가 없습니다.")
+
+
+st.sidebar.divider()
+st.sidebar.subheader("🌤️ 오늘의 날씨 및 옷차림 추천")
+with st.sidebar:
+    weather_widget()
 
 # --- 페이지 상태 초기화 ---
+profiler.mark("session")
+# URL의 sid로 세션을 구분해, 워커가 재시작되거나 새로 배포되어도 같은 주소로 접속하면 저널에서 상태를 되살립니다.
+if "journal" not in st.session_state:
+    session_id = st.query_params.get("sid")
+    if not event_journal.valid_session_id(session_id):
+        session_id = uuid.uuid4().hex
+        st.query_params["sid"] = session_id
+    st.session_state.prompt_session_key = session_id
+    st.session_state.journal = open_journal(session_id)
 if "page" not in st.session_state: st.session_state.page = "main"
 if "face_photo_object" not in st.session_state: st.session_state.face_photo_object = None
 if "cloth_photo_object" not in st.session_state: st.session_state.cloth_photo_object = None
 if "user_activity_log" not in st.session_state: st.session_state.user_activity_log = []
 if "my_closet" not in st.session_state: st.session_state.my_closet = []
 if "saved_images" not in st.session_state: st.session_state.saved_images = []
+# 추천 이미지 URL → 저장한 파일 경로 (저장됨 표시용, URL은 한 시간쯤 지나면 만료되므로 기록하지 않습니다)
+if "saved_image_files" not in st.session_state: st.session_state.saved_image_files = {}
+if "color_index" not in st.session_state: st.session_state.color_index = garment_color.build_index(st.session_state.my_closet)
+# 호출 한도 대기열에서 세션별로 공평하게 차례를 나누기 위해 이 세션의 키를 등록합니다.
+rate_limit.bind_session(st.session_state.prompt_session_key)
+profiler.session = st.session_state.prompt_session_key
 
 personal_color_options = ["봄 웜톤", "여름 쿨톤", "가을 웜톤", "겨울 쿨톤"]
 
+# --- 2.1. 화면 조각(fragment)과 상태 의존성 ---
+# 각 조각은 안의 위젯을 누르면 그 조각만 다시 실행됩니다. 다른 조각이 읽는 상태를 바꿀 때만 rerun()이 앱 전체를 다시 실행합니다.
+# 조각이 화면을 그릴 때 읽는 세션 상태 (버튼을 누른 뒤에만 읽는 상태는 넣지 않습니다)
+STATE_READERS = {
+    "user_info": {"size", "analysis", "recommendation"},
+    "cloth_photo_object": {"analysis", "recommendation"},
+    "analysis_result": {"analysis", "recommendation"},
+    "recommendation_output": {"recommendation"},
+    "batch_output": {"recommendation"},
+    "my_closet": {"recommendation", "closet"},
+    "similar_query": {"closet"},
+    "saved_images": {"recommendation", "saved_outfits"},
+    "user_activity_log": {"activity_charts"},
+    "weather_data": {"weather"},
+    "selected_date": {"weather"},
+}
+# 조각이 그려지는 페이지 (None은 모든 페이지에 보이는 사이드바)
+FRAGMENT_PAGES = {"weather": None, "profile": "main", "size": "main", "analysis": "main", "recommendation": "main",
+                  "history": "main", "closet": "closet", "saved_outfits": "closet", "archive": "closet", "activity_charts": "analytics",
+                  "trends": "analytics"}
+
+
+def rerun(fragment, *changed):
+    """fragment에서 changed 상태를 바꾼 뒤 다시 실행하는 함수 (지금 보이는 다른 조각이 읽으면 앱 전체를 다시 실행)"""
+    readers = set().union(*(STATE_READERS.get(key, set()) for key in changed))
+    visible = {name for name in readers if FRAGMENT_PAGES[name] in (None, st.session_state.page)}
+    # 조각 단위 재실행은 그 조각만 실행 중일 때만 가능합니다 (첫 실행이나 전체 실행 중에는 앱 전체).
+    ctx = get_script_run_ctx()
+    in_fragment_run = bool(ctx and ctx.fragment_ids_this_run)
+    st.rerun(scope="fragment" if in_fragment_run and visible <= {fragment} else "app")
+
+
+@st.fragment
+def profile_tab():
+    """나의 맞춤 정보 탭"""
+    st.subheader("성별");
+    성별 = st.radio("성별", ["남자", "여자"], horizontal=True, key="gender_radio")
+    st.subheader("체형");
+    키 = st.number_input("키(cm)", 100, 250, st.session_state.get("키", 170), 1)
+    몸무게 = st.number_input("몸무게(kg)", 30, 200, st.session_state.get("몸무게", 62), 1)
+    st.subheader("피부")
+    default_index = personal_color_options.index(st.session_state.get("피부_톤", personal_color_options[0]))
+    피부_톤 = st.radio("피부 톤", personal_color_options, index=default_index, key="skin_tone_radio")
+    st.subheader("패션")
+    if os.path.exists("img/img.png"): st.image("img/img.png")
+    fashion_styles_options = ["캐주얼", "시크", "시티보이", "클래식", "에스닉", "걸리시", "고프코어", "미니멀", "프레피", "리조트", "레트로", "로맨틱",
+                              "스포티", "스트리트", "워크웨어"]
+    선호_스타일 = st.multiselect("선호하는 패션 스타일", fashion_styles_options, default=st.session_state.get("선호_스타일", []))
+    if st.button("내 정보 저장하기"):
+        st.session_state.user_info = {"성별": 성별, "키": 키, "몸무게": 몸무게, "피부_톤": 피부_톤, "선호_스타일": 선호_스타일}
+        record_event("user_info_set", user_info=st.session_state.user_info)
+        st.session_state.성별, st.session_state.키, st.session_state.몸무게, st.session_state.피부_톤, st.session_state.선호_스타일 = 성별, 키, 몸무게, 피부_톤, 선호_스타일
+        st.toast("정보가 저장되었습니다!")
+        rerun("profile", "user_info")
+
+
+@st.fragment
+def size_tab():
+    """사이즈 추천 탭"""
+    st.subheader("📏 AI 사이즈 추천")
+    if 'user_info' in st.session_state:
+        gender, height, weight = st.session_state.user_info['성별'], st.session_state.user_info['키'], \
+        st.session_state.user_info['몸무게']
+        st.write(f"입력된 정보: **성별 {gender}**, **키 {height}cm**, **몸무게 {weight}kg**")
+        if st.button("내 사이즈 추천받기", use_container_width=True):
+            sizes = recommend_size(height, weight, gender)
+            st.success("사이즈 추천 완료!");
+            st.markdown(f"### 추천 상의: **{sizes['상의']}**");
+            st.markdown(f"### 추천 하의: **{sizes['하의']}**")
+            st.info("※ 위 추천은 일반적인 체형 기준이며, 브랜드나 핏에 따라 다를 수 있습니다.")
+    else:
+        st.warning("먼저 '나의 맞춤 정보' 탭에서 정보를 저장해주세요.")
+
+
+@st.fragment
+def analysis_tab():
+    """옷 분석 탭"""
+    st.subheader("👚 분석할 옷 사진 업로드")
+    uploaded_file = st.file_uploader("코디를 추천받고 싶은 옷 사진", type=["jpg", "jpeg", "png"], key="cloth_uploader")
+    if uploaded_file:
+        st.session_state.cloth_photo_object = uploaded_file
+        # 분석 버튼을 누르기 전에 색상 팔레트와 임베딩 계산을 작업자 프로세스에서 미리 시작합니다 (새 파일일 때만).
+        if st.session_state.get("prefetched_upload") != uploaded_file.file_id:
+            st.session_state.prefetched_upload = uploaded_file.file_id
+            image_service.palette(uploaded_file)
+            image_service.embed(uploaded_file)
+    if st.session_state.get("cloth_photo_object"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.image(st.session_state.cloth_photo_object, caption="업로드된 옷 이미지", use_container_width=True)
+            if st.button("이미지 삭제", use_container_width=True, key="del_cloth_img"):
+                st.session_state.cloth_photo_object = None
+                st.session_state.analysis_result = None
+                record_event("analysis_set", analysis=None)
+                rerun("analysis", "cloth_photo_object", "analysis_result")
+        with col2:
+            if st.button("AI로 옷 분석 시작하기", use_container_width=True):
+                if 'user_info' not in st.session_state:
+                    st.error("먼저 '나의 맞춤 정보' 탭에서 정보를 저장해주세요!")
+                else:
+                    with st.spinner("AI가 이미지를 분석하고 있습니다... 🧠"):
+                        analysis_result = analyze_clothing_image(st.session_state.cloth_photo_object)
+                        if analysis_result:
+                            analysis_result["palette"] = extract_garment_palette(st.session_state.cloth_photo_object)
+                            st.session_state.analysis_result = analysis_result
+                            st.session_state.user_activity_log.append(analysis_result)
+                            record_event("analysis_set", analysis=analysis_result)
+                            record_event("activity_logged", analysis=analysis_result)
+                            speculate_default_recommendation()
+                            rerun("analysis", "analysis_result", "user_activity_log")
+            if st.session_state.get("analysis_result"):
+                result = st.session_state.analysis_result
+                st.success("분석 완료!");
+                st.subheader("✅ AI 분석 결과")
+                st.write(f"**의류 종류**: {result.get('item_type', 'N/A')}");
+                st.write(f"**카테고리**: {result.get('category', 'N/A')}")
+                st.write(f"**색상**: {result.get('color', 'N/A')}");
+                if result.get("palette"):
+                    swatches = " ".join(
+                        f"<span style='display:inline-block;width:1.2em;height:1.2em;background:{c['hex']};"
+                        f"border:1px solid #ccc;vertical-align:middle;'></span> {c['name']} {c['weight']:.0%}"
+                        for c in result["palette"])
+                    st.markdown(f"**색상 팔레트**: {swatches}", unsafe_allow_html=True)
+                st.write(f"**패턴**: {result.get('pattern', 'N/A')}")
+                tags = result.get('style_tags', []);
+                st.write(f"**스타일 태그**: {', '.join(tags) if tags else 'N/A'}")
+                if st.button("👚 옷장에 추가하기", use_container_width=True):
+                    # 이미지 바이트는 세션마다 들고 있지 않고 공유 저장소의 해시만 보관합니다.
+                    closet_item = {"image_id": store_closet_image(st.session_state.cloth_photo_object.getvalue()),
+                                   "name": st.session_state.cloth_photo_object.name, "analysis": result,
+                                   "palette": result.get("palette", [])}
+                    st.session_state.color_index.add(closet_item["image_id"], closet_item["palette"])
+                    index_image(closet_embeddings, closet_item["image_id"], image_store.path(closet_item["image_id"]))
+                    st.session_state.my_closet.append(closet_item);
+                    record_event("closet_added", item=closet_item)
+                    st.toast(f"'{st.session_state.cloth_photo_object.name}'을(를) 옷장에 추가했습니다!")
+                    rerun("analysis", "my_closet")
+                st.info("'코디 추천받기' 탭으로 이동하여 추천을 받아보세요!")
+
+
+@st.fragment
+def recommendation_tab():
+    """코디 추천 탭 (주간 코디 플래너 포함)"""
+    st.subheader("✨ AI 코디 추천 결과")
+    if 'analysis_result' in st.session_state and st.session_state.get(
+            'analysis_result') is not None and 'user_info' in st.session_state:
+        situation_input = st.text_input("어떤 상황에서 입을 코디를 추천받을까요?", placeholder="예: 주말 오후 카페에서, 도서관에서 공부할 때")
+        situation = situation_input if situation_input else DEFAULT_SITUATION
+        weather_context = current_weather_context()
+        key = recommendation_key(get_recommendation_prompt(), situation, weather_context)
+        # 다른 상황을 입력했거나 날씨 날짜를 바꾸면 미리 만들던 기본 추천은 쓰이지 않으므로 바로 취소합니다.
+        speculator.cancel(st.session_state.prompt_session_key, keep=key)
+        if st.button("AI 코디 추천 및 이미지 생성", use_container_width=True):
+            with st.spinner("AI 스타일리스트가 코디를 만들고 이미지를 생성합니다... ✨"):
+                # 분석 직후 미리 만들기 시작한 같은 요청이 있으면 그 결과를 (아직 만드는 중이면 기다려서) 씁니다.
+                output = speculator.take(key, st.session_state.prompt_session_key) if speculation.ENABLED else None
+                if output is None:
+                    try:
+                        output = compose_recommendation(*recommendation_inputs(situation, weather_context))
+                    except Exception as e:
+                        st.error(f"코디 추천 중 오류 발생: {e}")
+                if output is None:
+                    st.error("코디 추천에 실패했습니다.")
+                else:
+                    remember_recommendation(output, situation, st.session_state.analysis_result, weather_context)
+                st.session_state.recommendation_output = output
+                record_event("recommendation_set", output=st.session_state.recommendation_output)
+
+        if st.session_state.get("recommendation_output"):
+            output = st.session_state.recommendation_output
+            # 보관 기간이 지나 정리된 음성 파일은 건너뜁니다.
+            if output.get("audio") and os.path.exists(output["audio"]):
+                audio_filepath = output["audio"]
+                audio_col, button_col = st.columns([4, 1])
+                with audio_col:
+                    st.audio(audio_filepath, autoplay=True)
+                with button_col:
+                    if st.button("🔊 음성 삭제", use_container_width=True, key="delete_audio"):
+                        files.delete(audio_filepath)
+                        st.session_state.recommendation_output["audio"] = None
+                        record_event("recommendation_set", output=st.session_state.recommendation_output)
+                        st.toast("음성 파일이 삭제되었습니다.")
+                        rerun("recommendation", "recommendation_output")
+            st.subheader("AI 스타일리스트의 추천");
+            st.markdown(output["text"], unsafe_allow_html=True)
+            st.subheader("🛍️ 추천 아이템 쇼핑하기")
+            max_price = None
+            if product_catalog is not None:
+                budget = st.number_input("최대 가격(원, 0이면 제한 없음)", min_value=0, step=10000, value=0,
+                                         key="product_max_price")
+                max_price = budget or None
+            products = find_products(output["keywords"], max_price)
+            for keyword in dict.fromkeys(output["keywords"]):
+                render_products(keyword, products.get(keyword))
+            if output["image_urls"]:
+                st.subheader("🎨 추천 코디 시각화")
+                cols = st.columns(len(output["image_urls"]))
+                image_tier_names = output.setdefault("image_tiers",
+                                                     [image_tiers.FULL_TIER] * len(output["image_urls"]))
+                for i, url in enumerate(output["image_urls"]):
+                    with cols[i]:
+                        if url:
+                            tier = image_tiers.get(image_tier_names[i])
+                            if displayable_image(url):
+                                st.image(url, caption=f"추천 코디 {i + 1} · {tier.label}", use_container_width=True)
+                            else:
+                                st.info(f"추천 코디 {i + 1} 미리보기가 정리되었습니다. 고화질로 다시 볼 수 있습니다.")
+                            upgradable = image_tiers.needs_upgrade(tier.name) and output.get("image_prompts")
+                            if upgradable and st.button("🔍 고화질로 보기", key=f"zoom_{i}", use_container_width=True):
+                                with st.spinner("고화질 이미지를 생성합니다..."):
+                                    if upgrade_recommendation_image(output, i):
+                                        rerun("recommendation", "recommendation_output")
+                            save_key = f"save_{url}_{i}"
+                            if st.session_state.saved_image_files.get(url) in st.session_state.saved_images:
+                                st.success("✅ 저장됨")
+                            else:
+                                if st.button("💾 이 코디 저장하기", key=save_key, use_container_width=True):
+                                    # 저장은 항상 전체 해상도로 합니다.
+                                    if upgradable:
+                                        with st.spinner("고화질 이미지를 생성합니다..."):
+                                            if upgrade_recommendation_image(output, i):
+                                                url = output["image_urls"][i]
+                                    success, filepath = save_image_from_url("saved_outfits", url)
+                                    if success:
+                                        index_image(outfit_embeddings, os.path.basename(filepath), filepath)
+                                        # 임시 URL 대신 저장한 파일 경로를 남겨야 재배포 후 복구한 세션에서도 보입니다.
+                                        st.session_state.saved_images.append(filepath)
+                                        st.session_state.saved_image_files[url] = filepath
+                                        record_event("saved_image_added", url=filepath)
+                                        st.toast("저장 완료!"); rerun("recommendation", "saved_images")
+                                    else:
+                                        st.error("저장에 실패했습니다.")
+                        else:
+                            st.warning(f"추천 코디 {i + 1} 이미지 생성 실패.")
+    else:
+        st.warning("먼저 '옷 분석하기'를 완료해주세요.")
+
+    # 여러 옷과 상황(예: 한 주의 일정)을 한 번에 추천받는 플래너
+    garment_options = {}
+    if st.session_state.get("analysis_result"):
+        garment_options["방금 분석한 옷"] = st.session_state.analysis_result
+    for item in st.session_state.my_closet:
+        garment_options.setdefault(f"옷장: {item['name']}", item["analysis"])
+    if garment_options and 'user_info' in st.session_state:
+        with st.expander("🗓️ 여러 상황 한 번에 추천받기 (주간 코디 플래너)"):
+            option_names = list(garment_options)
+            plan_df = pd.DataFrame({
+                "옷": [option_names[0]] * 5,
+                "상황": ["출근", "출근", "저녁 약속", "출근", "주말 나들이"],
+                "날짜": [today + timedelta(days=i) for i in range(5)],
+            })
+            plan = st.data_editor(plan_df, num_rows="dynamic", use_container_width=True, key="batch_plan",
+                                  column_config={
+                                      "옷": st.column_config.SelectboxColumn(options=option_names, required=True),
+                                      "날짜": st.column_config.DateColumn(format="MM/DD (ddd)"),
+                                  })
+            if st.button("한 번에 추천받기", use_container_width=True, key="run_batch"):
+                batch_items = []
+                for row in plan.itertuples(index=False):
+                    if row[0] not in garment_options or not str(row[1] or "").strip():
+                        continue
+                    date = pd.Timestamp(row[2]).strftime('%Y%m%d') if pd.notna(row[2]) else None
+                    weather_text = None
+                    if date and st.session_state.get("weather_data"):
+                        location = st.session_state.weather_data["location"]
+                        weather_text = format_weather_for_prompt(get_daily_features(location, date)) or None
+                    batch_items.append(batch.BatchItem(garment_options[row[0]], str(row[1]).strip(),
+                                                       date and f"{date[4:6]}/{date[6:]}", weather_text,
+                                                       label=row[0]))
+                if not batch_items:
+                    st.warning("상황이 입력된 행이 없습니다.")
+                else:
+                    # 끝나는 항목부터 바로 보여주기 위해 자리를 먼저 잡아 둡니다.
+                    progress = st.progress(0.0, text="추천을 준비하고 있습니다...")
+                    slots = [st.empty() for _ in batch_items]
+                    entries, stats = [None] * len(batch_items), {}
+                    for done, (index, entry, stats) in enumerate(
+                            run_batch_recommendations(st.session_state.user_info, batch_items), start=1):
+                        entries[index] = entry
+                        if entry["ok"]:
+                            item = batch_items[index]
+                            remember_recommendation(entry, item.situation, item.garment, item.weather, item.date)
+                        with slots[index].container():
+                            render_batch_entry(entry)
+                        progress.progress(done / len(batch_items), text=f"{done}/{len(batch_items)} 완료")
+                    st.session_state.batch_output = {"entries": entries, "stats": dict(stats)}
+                    rerun("recommendation", "batch_output")
+            elif st.session_state.get("batch_output"):
+                stats = st.session_state.batch_output["stats"]
+                st.caption(f"요청 {stats.get('items', 0)}건 → Gemini 호출 {stats.get('llm_calls', 0)}회"
+                           f"(+ 재요청 {stats.get('llm_retries', 0)}회), 이미지 {stats.get('images_generated', 0)}장"
+                           f" (중복 제거 전 {stats.get('image_prompts', 0)}장)")
+                for entry in st.session_state.batch_output["entries"]:
+                    render_batch_entry(entry)
+
+
+@st.fragment
+def recommendation_history_panel():
+    """지난 추천 검색 (이미지는 기록할 때 복사해 둔 것을 보여 주고 새로 생성하지 않음)"""
+    with st.expander("🕘 지난 추천 다시 보기"):
+        query = st.text_input("검색어", placeholder="예: 카페, 린넨 셔츠, 비 오는 날", key="history_query")
+        started = time.perf_counter()
+        entries = history.search(st.session_state.prompt_session_key, query, limit=20)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not entries:
+            st.info("검색 결과가 없습니다." if query.strip() else "아직 기록된 추천이 없습니다.")
+            return
+        total = history.count(st.session_state.prompt_session_key)
+        st.caption(f"추천 {total}개 중 {len(entries)}개 ({elapsed_ms:.0f}ms)")
+        for entry in entries:
+            created = datetime.fromtimestamp(entry["created"], pytz.timezone("Asia/Seoul"))
+            title = f"{created:%m/%d %H:%M} · {entry['situation'] or DEFAULT_SITUATION}"
+            if entry["keywords"]:
+                title += f" · {', '.join(entry['keywords'][:3])}"
+            with st.expander(title):
+                st.markdown(entry["text"], unsafe_allow_html=True)
+                if entry["keywords"]:
+                    st.markdown(" · ".join(f"[{k}](https://www.musinsa.com/search/musinsa/integration?q={quote(k)})"
+                                           for k in dict.fromkeys(entry["keywords"])))
+                images = [image for image in entry["images"] if image["display"]]
+                if images:
+                    for col, image in zip(st.columns(len(images)), images):
+                        col.image(image["display"], caption=image_tiers.get(image["tier"]).label,
+                                  use_container_width=True)
+
+
+@st.fragment
+def closet_grid():
+    """옷장 그리드, 비슷한 옷 찾기, 색상으로 찾기"""
+    st.subheader("내가 분석한 옷")
+    if not st.session_state.my_closet:
+        st.info("아직 옷장에 저장된 옷이 없습니다.")
+    else:
+        with profiler.section("closet_images"):
+            thumbnails = thumbnail_paths([item["image_id"] for item in st.session_state.my_closet])
+            cols = st.columns(4)
+            for i, item in enumerate(st.session_state.my_closet):
+                with cols[i % 4]:
+                    if thumbnails[i]:
+                        st.image(thumbnails[i], caption=item["name"])
+                    else:
+                        st.warning(f"'{item['name']}' 이미지를 찾을 수 없습니다.")
+                    if st.button("🔍 비슷한 옷", key=f"similar_closet_{i}", use_container_width=True):
+                        st.session_state.similar_query = item["image_id"]
+                    if st.button("삭제", key=f"delete_closet_{i}", use_container_width=True):
+                        removed = st.session_state.my_closet.pop(i)
+                        record_event("closet_removed", index=i)
+                        # 같은 이미지가 옷장에 두 번 담긴 경우에는 이미지 참조와 색상 인덱스 항목을 남겨둡니다.
+                        if not any(item["image_id"] == removed["image_id"] for item in st.session_state.my_closet):
+                            release_closet_image(removed["image_id"])
+                            st.session_state.color_index.remove(removed["image_id"])
+                            # 다른 세션의 옷장에 같은 이미지가 있으면 비슷한 옷 찾기를 열 때 다시 계산해 넣습니다.
+                            closet_embeddings.remove(removed["image_id"])
+                            if st.session_state.get("similar_query") == removed["image_id"]:
+                                st.session_state.similar_query = None
+                        rerun("closet", "my_closet", "similar_query")
+        if st.session_state.get("similar_query"):
+            query_id = st.session_state.similar_query
+            items_by_id = {item["image_id"]: item for item in st.session_state.my_closet}
+            st.markdown(f"#### 🔍 '{items_by_id[query_id]['name']}'과(와) 비슷한 아이템")
+            index_images(closet_embeddings, [(image_id, image_store.path(image_id)) for image_id in items_by_id])
+            own_outfits = sync_outfit_index()
+            query_vector = closet_embeddings.vector(query_id)
+            if query_vector is None:
+                st.warning("이 옷의 이미지 특징을 계산하지 못해 비슷한 옷을 찾을 수 없습니다.")
+                similar_items, similar_outfits = [], []
+            else:
+                similar_items = closet_embeddings.search(query_vector, top_k=4, candidates=list(items_by_id),
+                                                         exclude=[query_id])
+                similar_outfits = outfit_embeddings.search(query_vector, top_k=4, candidates=own_outfits)
+            if similar_items:
+                st.caption("내 옷장에서")
+                similar_cols = st.columns(4)
+                thumbnails = thumbnail_paths([image_id for image_id, _ in similar_items])
+                shown = [(item, path) for item, path in zip(similar_items, thumbnails) if path]
+                for j, ((image_id, score), path) in enumerate(shown):
+                    with similar_cols[j]:
+                        st.image(path, caption=f"{items_by_id[image_id]['name']} (유사도 {score:.0%})")
+            if similar_outfits:
+                st.caption("저장된 코디에서")
+                similar_cols = st.columns(4)
+                for j, (filename, score) in enumerate(similar_outfits):
+                    with similar_cols[j]:
+                        filepath = os.path.join("saved_outfits", filename)
+                        files.touch(filepath)
+                        st.image(filepath, caption=f"유사도 {score:.0%}")
+            if st.button("닫기", key="close_similar"):
+                st.session_state.similar_query = None
+                rerun("closet", "similar_query")
+        st.markdown("#### 🎨 색상으로 옷 찾기")
+        picked_color = st.color_picker("찾고 싶은 색을 고르세요", "#1F2A54")
+        matches = st.session_state.color_index.query(garment_color.hex_to_lab(picked_color), top_k=8)
+        if matches:
+            items_by_id = {item["image_id"]: item for item in st.session_state.my_closet}
+            match_cols = st.columns(4)
+            thumbnails = thumbnail_paths([image_id for image_id, _ in matches])
+            shown = [(match, path) for match, path in zip(matches, thumbnails) if path]
+            for j, ((image_id, delta_e), path) in enumerate(shown):
+                with match_cols[j % 4]:
+                    st.image(path, caption=f"{items_by_id[image_id]['name']} (색 차이 {delta_e:.0f})")
+        else:
+            st.caption("비슷한 색의 옷이 없습니다.")
+
+
+@st.fragment
+def saved_outfits_grid():
+    """저장된 추천 코디 목록"""
+    st.subheader("저장된 추천 코디")
+    if not st.session_state.saved_images:
+        st.info("아직 저장된 추천 코디가 없습니다.")
+    else:
+        cols = st.columns(4)
+        for i, url in enumerate(st.session_state.saved_images):
+            with cols[i % 4]:
+                if displayable_image(url):
+                    st.image(url, caption=f"저장된 코디 {i + 1}")
+                else:
+                    st.warning(f"저장된 코디 {i + 1}의 이미지를 더 이상 불러올 수 없습니다.")
+                if st.button("삭제", key=f"delete_saved_{i}", use_container_width=True):
+                    st.session_state.saved_images.pop(i)
+                    record_event("saved_image_removed", index=i)
+                    rerun("saved_outfits", "saved_images")
+
+
+@st.fragment
+def wardrobe_archive_panel():
+    """옷장 보관 파일 내보내기/가져오기"""
+    with st.expander("📦 옷장 내보내기 / 가져오기"):
+        st.caption("옷 사진(WebP), AI 분석 결과, 유사도 임베딩과 저장한 코디를 zip 파일 하나에 담습니다. "
+                   "가져올 때는 이미 있는 사진을 건너뛰고 AI 분석을 다시 하지 않습니다.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("보관 파일 만들기", use_container_width=True, key="export_wardrobe"):
+                with st.spinner("보관 파일을 만드는 중입니다..."):
+                    archive, stats = export_wardrobe()
+                    # 만들 때는 디스크에 쓰지만 내려받기 버튼에는 완성된 zip의 바이트를 넘겨야 합니다.
+                    with archive:
+                        data = archive.read()
+                st.caption(f"옷 {stats['closet']}벌 · 코디 {stats['outfits']}개 · 이미지 {stats['images']}장 "
+                           f"({stats['bytes_in'] / 2 ** 20:.1f}MB → {stats['bytes_out'] / 2 ** 20:.1f}MB)")
+                st.download_button("⬇️ 보관 파일 내려받기", data, file_name=f"ottaku_wardrobe_{datetime.now():%Y%m%d}.zip",
+                                   mime="application/zip", on_click="ignore", use_container_width=True)
+        with col2:
+            archive_file = st.file_uploader("보관 파일 가져오기", type=["zip"], key="wardrobe_archive")
+            if archive_file and st.button("가져오기", use_container_width=True, key="import_wardrobe"):
+                try:
+                    with st.spinner("보관 파일을 가져오는 중입니다..."):
+                        stats = import_wardrobe(archive_file)
+                except (zipfile.BadZipFile, KeyError, ValueError) as e:
+                    st.error(f"보관 파일을 읽을 수 없습니다: {e}")
+                    return
+                st.toast(f"옷 {stats['closet']}벌, 코디 {stats['outfits']}개를 가져왔습니다. "
+                         f"(이미 있는 {stats['skipped']}개는 건너뜀)")
+                rerun("archive", "my_closet", "saved_images")
+
+
+@st.fragment
+def activity_charts():
+    """분석 기록 기반 스타일/색상 차트"""
+    st.markdown("### 📈 나의 패션 프로필 분석")
+    st.caption("'옷 분석하기' 데이터를 기반으로 생성됩니다.")
+    if not st.session_state.user_activity_log:
+        st.info("아직 분석된 옷 데이터가 없습니다.")
+    else:
+        all_tags = [tag for item in st.session_state.user_activity_log for tag in item.get('style_tags', [])]
+        tag_counts = pd.Series(all_tags).value_counts()
+        # 로컬 팔레트가 있는 분석 결과는 기본 색 이름별 면적 비율로, 없으면 AI가 적어준 색상 문자열로 집계합니다.
+        palette_index = garment_color.build_index(
+            [{"id": i, "palette": item.get("palette")} for i, item in enumerate(st.session_state.user_activity_log)],
+            id_key="id")
+        color_distribution = palette_index.color_distribution()
+        text_colors = [item.get('color', 'N/A') for item in st.session_state.user_activity_log if not item.get("palette")]
+        color_counts = pd.Series(color_distribution, dtype=float).add(pd.Series(text_colors, dtype=object).value_counts(),
+                                                                      fill_value=0).sort_values(ascending=False)
+        col1, col2 = st.columns(2)
+        with col1:
+            if not tag_counts.empty:
+                fig_style = px.bar(tag_counts, y=tag_counts.index, x=tag_counts.values, orientation='h',
+                                   title="나의 스타일 선호도 분석", labels={'y': '스타일', 'x': '분석 횟수'}, color=tag_counts.values,
+                                   color_continuous_scale='viridis')
+                st.plotly_chart(fig_style, use_container_width=True)
+            else:
+                st.info("스타일 데이터가 부족합니다.")
+        with col2:
+            if not color_counts.empty:
+                fig_color = px.pie(values=color_counts.values, names=color_counts.index, title="분석된 옷 색상 분포",
+                                   color=color_counts.index, color_discrete_sequence=px.colors.qualitative.Pastel,
+                                   color_discrete_map={name: "rgb({}, {}, {})".format(*rgb)
+                                                       for name, rgb in garment_color.NAMED_COLORS.items()})
+                st.plotly_chart(fig_color, use_container_width=True)
+            else:
+                st.info("색상 데이터가 부족합니다.")
+
+
+@st.fragment
+def trends_chart():
+    """Google Trends 관심도 차트"""
+    st.markdown("### 🌍 최신 패션 트렌드 분석 (Google Trends)")
+    with st.spinner("Google Trends에서 최신 데이터를 가져오는 중..."):
+        trends_df = get_google_trends_data()
+        if not trends_df.empty:
+            st.line_chart(trends_df);
+            st.caption("지난 1년간의 주요 패션 키워드에 대한 관심도 변화입니다.")
+        else:
+            st.warning("트렌드 데이터를 가져오는 데 실패했습니다.")
+
+
 # --- 3. 페이지별 UI 구성 ---
+profiler.page = st.session_state.page
+profiler.mark(f"page:{st.session_state.page}")
 
 # 3.1. 메인 페이지
 if st.session_state.page == "main":
     st.title("👕 나의 맞춤 패션 추천")
     tab1, tab_size, tab2, tab3 = st.tabs(["⚙️ 나의 맞춤 정보", "📏 사이즈 추천", "🧠 옷 분석하기", "✨ 코디 추천받기"])
     with tab1:
-        st.subheader("성별");
-        성별 = st.radio("성별", ["남자", "여자"], horizontal=True, key="gender_radio")
-        st.subheader("체형");
-        키 = st.number_input("키(cm)", 100, 250, st.session_state.get("키", 170), 1)
-        몸무게 = st.number_input("몸무게(kg)", 30, 200, st.session_state.get("몸무게", 62), 1)
-        st.subheader("피부")
-        default_index = personal_color_options.index(st.session_state.get("피부_톤", personal_color_options[0]))
-        피부_톤 = st.radio("피부 톤", personal_color_options, index=default_index, key="skin_tone_radio")
-        st.subheader("패션")
-        if os.path.exists("img/img.png"): st.image("img/img.png")
-        fashion_styles_options = ["캐주얼", "시크", "시티보이", "클래식", "에스닉", "걸리시", "고프코어", "미니멀", "프레피", "리조트", "레트로", "로맨틱",
-                                  "스포티", "스트리트", "워크웨어"]
-        선호_스타일 = st.multiselect("선호하는 패션 스타일", fashion_styles_options, default=st.session_state.get("선호_스타일", []))
-        if st.button("내 정보 저장하기"):
-            st.session_state.user_info = {"성별": 성별, "키": 키, "몸무게": 몸무게, "피부_톤": 피부_톤, "선호_스타일": 선호_스타일}
-            st.session_state.성별, st.session_state.키, st.session_state.몸무게, st.session_state.피부_톤, st.session_state.선호_스타일 = 성별, 키, 몸무게, 피부_톤, 선호_스타일
-            st.success("정보가 저장되었습니다!")
+        profile_tab()
     with tab_size:
-        st.subheader("📏 AI 사이즈 추천")
-        if 'user_info' in st.session_state:
-            gender, height, weight = st.session_state.user_info['성별'], st.session_state.user_info['키'], \
-            st.session_state.user_info['몸무게']
-            st.write(f"입력된 정보: **성별 {gender}**, **키 {height}cm**, **몸무게 {weight}kg**")
-            if st.button("내 사이즈 추천받기", use_container_width=True):
-                sizes = recommend_size(height, weight, gender)
-                st.success("사이즈 추천 완료!");
-                st.markdown(f"### 추천 상의: **{sizes['상의']}**");
-                st.markdown(f"### 추천 하의: **{sizes['하의']}**")
-                st.info("※ 위 추천은 일반적인 체형 기준이며, 브랜드나 핏에 따라 다를 수 있습니다.")
-        else:
-            st.warning("먼저 '나의 맞춤 정보' 탭에서 정보를 저장해주세요.")
+        size_tab()
     with tab2:
-        st.subheader("👚 분석할 옷 사진 업로드")
-        uploaded_file = st.file_uploader("코디를 추천받고 싶은 옷 사진", type=["jpg", "jpeg", "png"], key="cloth_uploader")
-        if uploaded_file:
-            st.session_state.cloth_photo_object = uploaded_file
-        if st.session_state.get("cloth_photo_object"):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.image(st.session_state.cloth_photo_object, caption="업로드된 옷 이미지", use_container_width=True)
-                if st.button("이미지 삭제", use_container_width=True, key="del_cloth_img"):
-                    st.session_state.cloth_photo_object = None
-                    st.session_state.analysis_result = None
-                    st.rerun()
-            with col2:
-                if st.button("AI로 옷 분석 시작하기", use_container_width=True):
-                    if 'user_info' not in st.session_state:
-                        st.error("먼저 '나의 맞춤 정보' 탭에서 정보를 저장해주세요!")
-                    else:
-                        with st.spinner("AI가 이미지를 분석하고 있습니다... 🧠"):
-                            analysis_result = analyze_clothing_image(st.session_state.cloth_photo_object)
-                            if analysis_result:
-                                st.session_state.analysis_result = analysis_result
-                                st.session_state.user_activity_log.append(analysis_result)
-                                st.rerun()
-                if st.session_state.get("analysis_result"):
-                    result = st.session_state.analysis_result
-                    st.success("분석 완료!");
-                    st.subheader("✅ AI 분석 결과")
-                    st.write(f"**의류 종류**: {result.get('item_type', 'N/A')}");
-                    st.write(f"**카테고리**: {result.get('category', 'N/A')}")
-                    st.write(f"**색상**: {result.get('color', 'N/A')}");
-                    st.write(f"**패턴**: {result.get('pattern', 'N/A')}")
-                    tags = result.get('style_tags', []);
-                    st.write(f"**스타일 태그**: {', '.join(tags) if tags else 'N/A'}")
-                    if st.button("👚 옷장에 추가하기", use_container_width=True):
-                        closet_item = {"image": st.session_state.cloth_photo_object.getvalue(),
-                                       "name": st.session_state.cloth_photo_object.name, "analysis": result}
-                        st.session_state.my_closet.append(closet_item);
-                        st.success(f"'{st.session_state.cloth_photo_object.name}'을(를) 옷장에 추가했습니다!")
-                    st.info("'코디 추천받기' 탭으로 이동하여 추천을 받아보세요!")
+        analysis_tab()
     with tab3:
-        st.subheader("✨ AI 코디 추천 결과")
-        if 'analysis_result' in st.session_state and st.session_state.get(
-                'analysis_result') is not None and 'user_info' in st.session_state:
-            situation_input = st.text_input("어떤 상황에서 입을 코디를 추천받을까요?", placeholder="예: 주말 오후 카페에서, 도서관에서 공부할 때")
-            if st.button("AI 코디 추천 및 이미지 생성", use_container_width=True):
-                situation = situation_input if situation_input else "일상적인 상황"
-                with st.spinner("AI 스타일리스트가 코디를 만들고 이미지를 생성합니다... ✨"):
-                    recommendation_text, image_prompts, search_keywords = get_cody_recommendation_with_image(
-                        st.session_state.user_info, st.session_state.analysis_result, situation)
-                    if recommendation_text and image_prompts:
-                        image_urls = [generate_image_with_dalle(prompt) for prompt in image_prompts]
-                        audio_filepath = make_audio(recommendation_text, "output.mp3")
-                        st.session_state.recommendation_output = {"text": recommendation_text,
-                                                                  "keywords": search_keywords, "image_urls": image_urls,
-                                                                  "audio": audio_filepath}
-                    else:
-                        st.session_state.recommendation_output = None; st.error("코디 추천에 실패했습니다.")
-
-            if st.session_state.get("recommendation_output"):
-                output = st.session_state.recommendation_output
-                if output.get("audio"):
-                    audio_filepath = output["audio"]
-                    audio_col, button_col = st.columns([4, 1])
-                    with audio_col:
-                        st.audio(audio_filepath, autoplay=True)
-                    with button_col:
-                        if st.button("🔊 음성 삭제", use_container_width=True, key="delete_audio"):
-                            if os.path.exists(audio_filepath):
-                                os.remove(audio_filepath)
-                            st.session_state.recommendation_output["audio"] = None
-                            st.success("음성 파일이 삭제되었습니다.")
-                            st.rerun()
-                st.subheader("AI 스타일리스트의 추천");
-                st.markdown(output["text"], unsafe_allow_html=True)
-                st.subheader("🛍️ 추천 아이템 쇼핑하기")
-                for keyword in set(output["keywords"]):
-                    musinsa_url = f"https://www.musinsa.com/search/musinsa/integration?q={quote(keyword)}"
-                    st.markdown(f"- [{keyword} 찾아보기]({musinsa_url})")
-                if output["image_urls"]:
-                    st.subheader("🎨 추천 코디 시각화")
-                    cols = st.columns(len(output["image_urls"]))
-                    for i, url in enumerate(output["image_urls"]):
-                        with cols[i]:
-                            if url:
-                                st.image(url, caption=f"추천 코디 {i + 1}", use_container_width=True)
-                                save_key = f"save_{url}_{i}"
-                                if url in st.session_state.saved_images:
-                                    st.success("✅ 저장됨")
-                                else:
-                                    if st.button("💾 이 코디 저장하기", key=save_key, use_container_width=True):
-                                        success, filepath = save_image_from_url("saved_outfits", url)
-                                        if success:
-                                            st.session_state.saved_images.append(url); st.success(f"저장 완료!"); st.rerun()
-                                        else:
-                                            st.error("저장에 실패했습니다.")
-                            else:
-                                st.warning(f"추천 코디 {i + 1} 이미지 생성 실패.")
-        else:
-            st.warning("먼저 '옷 분석하기'를 완료해주세요.")
+        recommendation_tab()
+        recommendation_history_panel()
 
 # 3.2. (삭제) 오늘의 날씨 페이지는 사이드바로 통합됨
 
 # 3.3. 나의 옷장 페이지
 elif st.session_state.page == "closet":
     st.title("👚 나의 옷장")
-    st.subheader("내가 분석한 옷")
-    if not st.session_state.my_closet:
-        st.info("아직 옷장에 저장된 옷이 없습니다.")
-    else:
-        cols = st.columns(4)
-        for i, item in enumerate(st.session_state.my_closet):
-            with cols[i % 4]:
-                st.image(item["image"], caption=item["name"])
-                if st.button("삭제", key=f"delete_closet_{i}", use_container_width=True):
-                    st.session_state.my_closet.pop(i);
-                    st.rerun()
+    closet_grid()
     st.write("---")
-    st.subheader("저장된 추천 코디")
-    if not st.session_state.saved_images:
-        st.info("아직 저장된 추천 코디가 없습니다.")
-    else:
-        cols = st.columns(4)
-        for i, url in enumerate(st.session_state.saved_images):
-            with cols[i % 4]:
-                st.image(url, caption=f"저장된 코디 {i + 1}")
-                if st.button("삭제", key=f"delete_saved_{i}", use_container_width=True):
-                    st.session_state.saved_images.pop(i);
-                    st.rerun()
+    saved_outfits_grid()
+    wardrobe_archive_panel()
 
 # 3.4. 퍼스널 컬러 분석 페이지
 elif st.session_state.page == "personal_color":
@@ -548,14 +1619,20 @@ elif st.session_state.page == "personal_color":
         st.image(st.session_state.face_photo_object, caption="분석할 얼굴 이미지", width=300)
         col1, col2 = st.columns([3, 1])
         with col1:
+            detailed = st.checkbox("Gemini에게 상세 설명 받기", help="끄면 로컬 색상 분석으로 확실한 경우 AI 호출 없이 바로 진단합니다.")
             if st.button("AI로 분석하기", use_container_width=True):
                 with st.spinner("AI가 퍼스널 컬러를 분석 중입니다..."):
-                    analysis_text = analyze_personal_color(st.session_state.face_photo_object)
+                    local_result = analyze_personal_color_locally(st.session_state.face_photo_object)
+                    if local_result["season"] != personal_color.UNCERTAIN and not detailed:
+                        analysis_text = personal_color.describe(local_result)
+                        st.caption(f"⚡ 로컬 색상 분석으로 진단했습니다. (확신도 {local_result['confidence']:.0%})")
+                    else:
+                        analysis_text = analyze_personal_color(st.session_state.face_photo_object, local_result)
                     if analysis_text:
                         st.markdown(analysis_text)
-                        match = re.search(r"진단 결과\s*:\s*(.+)", analysis_text)
-                        if match and match.group(1).strip() in personal_color_options:
-                            st.session_state.analyzed_color = match.group(1).strip()
+                        season = personal_color.parse_season(analysis_text)
+                        if season in personal_color_options:
+                            st.session_state.analyzed_color = season
                     else:
                         st.error("분석에 실패했습니다.")
         with col2:
@@ -566,45 +1643,16 @@ elif st.session_state.page == "personal_color":
     if "analyzed_color" in st.session_state and st.session_state.face_photo_object:
         if st.button(f"'{st.session_state.analyzed_color}' 결과를 내 정보에 적용하기"):
             st.session_state.피부_톤 = st.session_state.analyzed_color
-            if 'user_info' in st.session_state: st.session_state.user_info['피부_톤'] = st.session_state.analyzed_color
+            if 'user_info' in st.session_state:
+                st.session_state.user_info['피부_톤'] = st.session_state.analyzed_color
+                record_event("user_info_set", user_info=st.session_state.user_info)
             st.success(f"'{st.session_state.피부_톤}'이 맞춤 정보에 적용되었습니다.")
 
 # 3.5. 패션 데이터 분석 페이지
 elif st.session_state.page == "analytics":
     st.title("📊 패션 데이터 분석 대시보드")
-    st.markdown("### 📈 나의 패션 프로필 분석")
-    st.caption("'옷 분석하기' 데이터를 기반으로 생성됩니다.")
-    if not st.session_state.user_activity_log:
-        st.info("아직 분석된 옷 데이터가 없습니다.")
-    else:
-        all_tags = [tag for item in st.session_state.user_activity_log for tag in item.get('style_tags', [])]
-        tag_counts = pd.Series(all_tags).value_counts()
-        all_colors = [item.get('color', 'N/A') for item in st.session_state.user_activity_log]
-        color_counts = pd.Series(all_colors).value_counts()
-        col1, col2 = st.columns(2)
-        with col1:
-            if not tag_counts.empty:
-                fig_style = px.bar(tag_counts, y=tag_counts.index, x=tag_counts.values, orientation='h',
-                                   title="나의 스타일 선호도 분석", labels={'y': '스타일', 'x': '분석 횟수'}, color=tag_counts.values,
-                                   color_continuous_scale='viridis')
-                st.plotly_chart(fig_style, use_container_width=True)
-            else:
-                st.info("스타일 데이터가 부족합니다.")
-        with col2:
-            if not color_counts.empty:
-                fig_color = px.pie(values=color_counts.values, names=color_counts.index, title="분석된 옷 색상 분포",
-                                   color_discrete_sequence=px.colors.qualitative.Pastel)
-                st.plotly_chart(fig_color, use_container_width=True)
-            else:
-                st.info("색상 데이터가 부족합니다.")
-    st.markdown("### 🌍 최신 패션 트렌드 분석 (Google Trends)")
-    with st.spinner("Google Trends에서 최신 데이터를 가져오는 중..."):
-        trends_df = get_google_trends_data()
-        if not trends_df.empty:
-            st.line_chart(trends_df);
-            st.caption("지난 1년간의 주요 패션 키워드에 대한 관심도 변화입니다.")
-        else:
-            st.warning("트렌드 데이터를 가져오는 데 실패했습니다.")
+    activity_charts()
+    trends_chart()
 
 # 3.6. 옷 입혀보기 AI 페이지
 elif st.session_state.page == "vton":
@@ -613,3 +1661,102 @@ elif st.session_state.page == "vton":
     st.write(f"아래 링크를 통해 외부 가상 피팅 사이트를 이용할 수 있습니다.")
     st.markdown(f"**[가상 피팅 사이트로 이동하기]({site_url})**", unsafe_allow_html=True)
     st.info("⚠️ 외부 사이트는 안정적이지 않을 수 있으며, 로딩에 시간이 걸릴 수 있습니다")
+
+# 3.7. 관리자 성능 대시보드 페이지
+elif st.session_state.page == "admin" and is_admin:
+    st.title("🛠️ 성능 대시보드")
+    st.caption("이 프로세스에서 기록된 외부 API 호출의 지연 시간과 예상 비용입니다.")
+    records = tracing.get_records()
+    if not records:
+        st.info("아직 기록된 호출이 없습니다.")
+    else:
+        summary = tracing.stage_summary(records)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("기록된 호출 수", len(records))
+        col2.metric("예상 누적 비용", f"${summary['cost_usd'].sum():.4f}")
+        col3.metric("오류 수", int(summary['errors'].sum()))
+        st.dataframe(summary, use_container_width=True)
+        prompt_records = [r for r in records if r.get("prompt")]
+        if prompt_records:
+            st.markdown("#### 🧾 프롬프트 버전별 비교")
+            st.dataframe(tracing.stage_summary(prompt_records, by="prompt"), use_container_width=True)
+        image_records = [r for r in records if r.get("tier")]
+        if image_records:
+            st.markdown("#### 🖼️ 이미지 품질 단계별 비교")
+            st.dataframe(tracing.stage_summary(image_records, by="tier"), use_container_width=True)
+        latency_df = summary.melt(id_vars="stage", value_vars=["p50_ms", "p95_ms", "p99_ms"], var_name="percentile",
+                                  value_name="ms")
+        fig_latency = px.bar(latency_df, x="stage", y="ms", color="percentile", barmode="group",
+                             title="단계별 지연 시간 (p50/p95/p99)")
+        st.plotly_chart(fig_latency, use_container_width=True)
+        with st.expander("최근 호출 기록"):
+            st.dataframe(pd.DataFrame(records[-200:]).iloc[::-1], use_container_width=True)
+        col1, col2 = st.columns(2)
+        col1.download_button("JSONL 내보내기", tracing.export_jsonl(records), file_name="ottaku_traces.jsonl",
+                             mime="application/jsonl", use_container_width=True)
+        col2.download_button("OpenMetrics 내보내기", tracing.export_openmetrics(records), file_name="ottaku_metrics.txt",
+                             mime="text/plain", use_container_width=True)
+        if st.button("기록 초기화", use_container_width=True):
+            tracing.clear_records()
+            st.rerun()
+    st.markdown("#### 🚦 호출 한도 대기열")
+    limiter_stats = rate_limit.stats()
+    if limiter_stats:
+        st.dataframe(pd.DataFrame(limiter_stats), use_container_width=True)
+    else:
+        st.caption("아직 한도 대기열을 거친 호출이 없거나 제한이 꺼져 있습니다 (OTTAKU_RATE_LIMITS).")
+    st.markdown("#### 💾 디스크 사용량 (audio / captured_images / saved_outfits)")
+    file_stats = files.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("관리 파일 용량", f"{file_stats['bytes'] / 2 ** 20:.1f}MB",
+                help=f"전체 상한 {file_stats['max_bytes'] / 2 ** 20:.0f}MB")
+    col2.metric("최대 사용자 용량", f"{file_stats['largest_user_bytes'] / 2 ** 20:.1f}MB",
+                help=f"사용자별 상한 {file_stats['user_max_bytes'] / 2 ** 20:.0f}MB")
+    col3.metric("LRU로 제거", f"{file_stats['evicted_files']}개", f"{file_stats['evicted_bytes'] / 2 ** 20:.1f}MB",
+                delta_color="off")
+    col4.metric("디스크 여유 공간", f"{file_stats['disk_free_bytes'] / 2 ** 30:.1f}GB")
+    st.dataframe(pd.DataFrame(file_stats["areas"]), use_container_width=True, hide_index=True)
+    if file_stats["last_sweep"]:
+        st.caption(f"마지막 정리: {datetime.fromtimestamp(file_stats['last_sweep']['at']):%H:%M:%S} "
+                   f"(임시 파일 {file_stats['last_sweep']['tmp_removed']} · 편입 {file_stats['last_sweep']['adopted']} · "
+                   f"보관 기간 만료 {file_stats['last_sweep']['expired']} · 용량 초과 {file_stats['last_sweep']['evicted']})")
+    if st.button("지금 정리하기", use_container_width=True):
+        files.sweep()
+        st.rerun()
+    st.markdown("#### 🔮 기본 추천 미리 생성")
+    spec_stats = speculator.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("적중률", f"{spec_stats['hit_rate']:.0%}", help=f"적중 {spec_stats['hits']} · 놓침 {spec_stats['misses']} "
+                                                          f"(생성 중 합류 {spec_stats['joined']})")
+    col2.metric("미리 시작", spec_stats["started"], help=f"취소 {spec_stats['cancelled']} · 만료 {spec_stats['expired']} "
+                                                     f"· 실패 {spec_stats['failed']}")
+    col3.metric("낭비된 예상 비용", f"${spec_stats['wasted_usd']:.4f}", help=f"미리 생성 전체 ${spec_stats['spent_usd']:.4f}")
+    col4.metric("앞당긴 시간", f"{spec_stats['head_start_s']:.0f}s")
+    st.markdown("#### 🖼️ 이미지 작업자")
+    image_stats = image_service.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("작업자 프로세스", image_stats["workers"] or "끔", help="0이면 스크립트 스레드에서 바로 처리합니다.")
+    col2.metric("처리한 작업", image_stats["submitted"], help=f"재사용 {image_stats['reused']} · 실패 {image_stats['failed']}")
+    col3.metric("대기 중", image_stats["pending"])
+    col4.metric("공유 메모리로 전달", f"{image_stats['shm_bytes'] / 2 ** 20:.1f}MB")
+    if st.session_state.get("journal"):
+        st.markdown("#### 🗂️ 세션 저널 (현재 세션)")
+        st.json(st.session_state.journal.stats())
+    st.markdown("#### 🧾 프롬프트 레지스트리")
+    st.caption("고정 지시문은 system_instruction으로 분리되며, 토큰 수는 로컬 추정치입니다.")
+    st.dataframe(pd.DataFrame(prompts.registry_table()), use_container_width=True)
+
+# --- 4. 실행 시간 프로파일 (프로파일러가 켜져 있을 때만 사이드바에 접어서 보여 줍니다) ---
+profile_record = profiler.finish()
+if profile_record:
+    with st.sidebar.expander(f"⏱️ 이번 실행 {profile_record['total_ms']:.0f}ms ({profile_record['mode']})"):
+        sections_df = pd.DataFrame(profile_record["sections"])
+        sections_df["name"] = ["  " * depth + name for name, depth in zip(sections_df["name"], sections_df["depth"])]
+        st.dataframe(sections_df[["name", "ms"]].round(1), hide_index=True, use_container_width=True)
+        if profile_record.get("functions"):
+            st.caption("cProfile 누적 시간 상위 함수")
+            st.dataframe(pd.DataFrame(profile_record["functions"]).round(1), hide_index=True, use_container_width=True)
+        if profile_record.get("stacks"):
+            st.caption(f"스택 샘플 {profile_record['samples']}개 중 상위 스택")
+            st.code("\n".join(f"{row['samples']:>5} {row['stack']}" for row in profile_record["stacks"]))
+        st.caption(f"기록 파일: {rerun_profiler.PROFILE_FILE}")
@@ -0,0 +1,188 @@
+"""외부 API 호출(기상청, 이미지 다운로드, OpenAI, Gemini)을 위한 asyncio 서비스 계층
+
+프로세스마다 하나의 백그라운드 이벤트 루프 스레드를 두고, 모든 외부 호출을 그 루프의 코루틴으로 실행합니다.
+Streamlit 페이지는 동기 래퍼(fetch, download, generate_image, ...)로 결과를 기다리므로 기존 코드 흐름은 그대로이고,
+응답을 기다리는 동안 쌓이는 것은 작업자 스레드가 아닌 코루틴입니다.
+여러 호출을 동시에 보낼 때는 gather()/submit()을 쓰면 스레드를 늘리지 않고 한 번에 기다릴 수 있습니다.
+
+httpx가 설치되어 있지 않으면 HTTP 요청만 requests를 루프의 기본 스레드 풀에서 실행하는 방식으로 대신합니다.
+
+환경 변수
+    OTTAKU_ASYNC_IO              0이면 예전처럼 동기 클라이언트를 직접 호출합니다 (기본값 1)
+    OTTAKU_HTTP_MAX_CONNECTIONS  HTTP 연결 풀 크기 (기본값 100)
+"""
+import asyncio
+import json
+import os
+import threading
+
+import openai
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+ENABLED = os.environ.get("OTTAKU_ASYNC_IO", "1") != "0"
+MAX_CONNECTIONS = int(os.environ.get("OTTAKU_HTTP_MAX_CONNECTIONS", "100"))
+
+# 호출하는 쪽에서 HTTP 오류를 한 번에 잡을 수 있도록 두 클라이언트의 예외를 묶어 둡니다.
+# requests는 JSON이 아닌 응답의 .json() 오류도 RequestException이지만 httpx는 json.JSONDecodeError를 그대로 올리므로 함께 넣습니다.
+HTTP_ERRORS = (requests.exceptions.RequestException, json.JSONDecodeError) + ((httpx.HTTPError,) if httpx else ())
+# 다운로드를 파일에 나눠 쓰는 크기
+DOWNLOAD_CHUNK_SIZE = 8192
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+# 루프 스레드 안에서만 만들고 쓰는 비동기 클라이언트 (잠금 없이 접근)
+_clients = {}
+
+
+def get_loop():
+    """프로세스 전체가 함께 쓰는 백그라운드 이벤트 루프를 반환하는 함수 (처음 호출할 때 시작)"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="ottaku-aio", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def submit(coro):
+    """코루틴을 백그라운드 루프에 넣고 concurrent.futures.Future를 바로 반환하는 함수"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """코루틴을 백그라운드 루프에서 실행하고 결과를 기다리는 동기 브리지"""
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("이벤트 루프 스레드 안에서는 run() 대신 await를 사용하세요.")
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+def gather(*coros, timeout=None, return_exceptions=False):
+    """여러 코루틴을 동시에 실행하고 결과 목록을 입력 순서대로 반환하는 동기 브리지"""
+    async def _all():
+        return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+    return run(_all(), timeout)
+
+
+class _ThreadedHttpClient:
+    """httpx가 없을 때 쓰는 대체 클라이언트 (requests를 루프의 기본 스레드 풀에서 실행)"""
+
+    async def get(self, url, params=None, timeout=None):
+        return await asyncio.to_thread(requests.get, url, params=params, timeout=timeout)
+
+
+def new_http_client():
+    if httpx is None:
+        return _ThreadedHttpClient()
+    return httpx.AsyncClient(limits=httpx.Limits(max_connections=MAX_CONNECTIONS), follow_redirects=True)
+
+
+def _client(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = factory()
+    return client
+
+
+def _http():
+    return _client("http", new_http_client)
+
+
+def _openai(api_key):
+    return _client(("openai", api_key), lambda: openai.AsyncOpenAI(api_key=api_key))
+
+
+# --- 코루틴 (루프 안에서 await로 사용) ---
+
+async def fetch_async(url, params=None, timeout=10):
+    response = await _http().get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def _download_sync(url, path, timeout):
+    response = requests.get(url, stream=True, timeout=timeout)
+    response.raise_for_status()
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+    return path
+
+
+async def download_async(url, path, timeout=60):
+    """응답 전체를 메모리에 올리지 않고 조각 단위로 path에 쓰는 코루틴"""
+    if httpx is None:
+        return await asyncio.to_thread(_download_sync, url, path, timeout)
+    async with _http().stream("GET", url, timeout=timeout) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    return path
+
+
+async def generate_image_async(api_key, prompt, **kwargs):
+    return await _openai(api_key).images.generate(prompt=prompt, **kwargs)
+
+
+async def create_speech_async(api_key, path, **kwargs):
+    response = await _openai(api_key).audio.speech.create(**kwargs)
+    with open(path, "wb") as f:
+        f.write(response.content)
+    return path
+
+
+async def generate_content_async(model, contents, **kwargs):
+    return await model.generate_content_async(contents, **kwargs)
+
+
+# --- 동기 래퍼 (Streamlit 페이지에서 사용, OTTAKU_ASYNC_IO=0이면 동기 클라이언트를 그대로 호출) ---
+
+def fetch(url, params=None, timeout=10):
+    """GET 요청을 보내고 상태 코드를 확인한 응답 객체를 반환하는 함수"""
+    if not ENABLED:
+        response = requests.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response
+    return run(fetch_async(url, params, timeout))
+
+
+def download(url, path, timeout=60):
+    """URL의 내용을 path에 저장하는 함수"""
+    if not ENABLED:
+        return _download_sync(url, path, timeout)
+    return run(download_async(url, path, timeout))
+
+
+def generate_image(client, prompt, **kwargs):
+    """이미지를 생성하는 함수 (client는 API 키를 가져오고 동기 모드에서 그대로 쓰는 openai.OpenAI)"""
+    if not ENABLED:
+        return client.images.generate(prompt=prompt, **kwargs)
+    return run(generate_image_async(getattr(client, "api_key", None), prompt, **kwargs))
+
+
+def create_speech(client, path, **kwargs):
+    """음성을 생성해 path에 저장하는 함수"""
+    if not ENABLED:
+        client.audio.speech.create(**kwargs).stream_to_file(path)
+        return path
+    return run(create_speech_async(getattr(client, "api_key", None), path, **kwargs))
+
+
+def generate_content(model, contents, **kwargs):
+    """Gemini 모델로 응답을 생성하는 함수"""
+    if not ENABLED:
+        return model.generate_content(contents, **kwargs)
+    return run(generate_content_async(model, contents, **kwargs))
@@ -0,0 +1,157 @@
+"""여러 (옷, 상황, 날짜) 조합의 코디 추천을 한꺼번에 처리하는 배치 실행기
+
+요청들을 출력 토큰 한도 안에서 가능한 한 적은 Gemini 호출로 묶고,
+같은 이미지 프롬프트는 한 번만 생성하며, 이미지 생성은 프로세스 전체에서 공유하는
+작업자 풀(동시 실행 수 제한)로 보냅니다. 결과는 항목별로 끝나는 순서대로 돌려받을 수 있습니다.
+
+환경 변수
+    OTTAKU_BATCH_MAX_ITEMS     Gemini 호출 하나에 묶을 최대 요청 수 (기본값 5)
+    OTTAKU_IMAGE_CONCURRENCY   프로세스 전체의 동시 이미지 생성 수 (기본값 4)
+"""
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_ITEMS_PER_CALL = int(os.environ.get("OTTAKU_BATCH_MAX_ITEMS", "5"))
+# 코디 2벌(설명, 키워드, 영어 프롬프트) 한 항목의 대략적인 출력 토큰 수와 호출당 출력 한도
+OUTPUT_TOKENS_PER_ITEM = 900
+MAX_OUTPUT_TOKENS = 8192
+IMAGE_CONCURRENCY = int(os.environ.get("OTTAKU_IMAGE_CONCURRENCY", "4"))
+LLM_CONCURRENCY = 2
+
+# 모든 세션이 함께 쓰는 이미지 생성 작업자 풀. 작업자 수가 곧 전역 동시 실행 한도입니다.
+_image_pool = ThreadPoolExecutor(max_workers=IMAGE_CONCURRENCY, thread_name_prefix="ottaku-image")
+
+
+class BatchItem:
+    """배치 요청 하나 (분석된 옷 정보, 상황, 날짜, 날씨 설명)"""
+
+    def __init__(self, garment, situation, date=None, weather=None, label=None):
+        self.garment = garment
+        self.situation = situation
+        self.date = date
+        self.weather = weather
+        self.label = label or garment.get("category", "")
+
+
+class BatchResult:
+    """항목 하나의 추천 결과 (recommendation이 None이면 실패)"""
+
+    def __init__(self, index, item, recommendation=None, image_urls=None):
+        self.index = index
+        self.item = item
+        self.recommendation = recommendation
+        self.image_urls = image_urls or []
+
+    @property
+    def ok(self):
+        return self.recommendation is not None
+
+
+def pack(n_items, max_items=None, max_output_tokens=MAX_OUTPUT_TOKENS, tokens_per_item=OUTPUT_TOKENS_PER_ITEM):
+    """n_items개의 요청을 호출당 출력 토큰 한도에 맞춰 [[인덱스...], ...] 묶음으로 나누는 함수"""
+    per_call = max(1, min(max_items or MAX_ITEMS_PER_CALL, max_output_tokens // tokens_per_item))
+    # 마지막 묶음만 작아지지 않도록 묶음 크기를 고르게 나눕니다.
+    n_calls = -(-n_items // per_call)
+    chunks, start = [], 0
+    for c in range(n_calls):
+        size = -(-(n_items - start) // (n_calls - c))
+        chunks.append(list(range(start, start + size)))
+        start += size
+    return chunks
+
+
+def normalize_image_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip().rstrip(".").lower()
+
+
+class ImageRequests:
+    """같은 배치 안에서 같은 이미지 프롬프트는 한 번만 생성하도록 Future를 공유하는 객체"""
+
+    def __init__(self, generate_image):
+        self._generate_image = generate_image
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.requested = 0
+
+    def submit(self, prompt):
+        key = normalize_image_prompt(prompt)
+        with self._lock:
+            self.requested += 1
+            future = self._futures.get(key)
+            if future is None:
+                future = _image_pool.submit(self._generate_image, prompt)
+                self._futures[key] = future
+            return future
+
+    @property
+    def generated(self):
+        return len(self._futures)
+
+
+def run_batch(items, recommend_chunk, generate_image, recommend_one=None, stats=None):
+    """배치를 실행하고 BatchResult를 끝나는 순서대로 내보내는 제너레이터
+
+    recommend_chunk(items)는 입력과 같은 순서의 추천 목록(빠진 항목은 None)을 반환해야 하며,
+    빠진 항목은 recommend_one(item)으로 해당 항목만 다시 요청합니다.
+    """
+    results = queue.Queue()
+    images = ImageRequests(generate_image)
+    calls = {"llm": 0, "llm_retries": 0}
+    calls_lock = threading.Lock()
+
+    def finish(index, recommendation):
+        item = items[index]
+        if recommendation is None:
+            results.put(BatchResult(index, item))
+            return
+        futures = [images.submit(p) for p in recommendation.image_prompts]
+        if not futures:
+            results.put(BatchResult(index, item, recommendation))
+            return
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_image_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            urls = [None if f.exception() else f.result() for f in futures]
+            results.put(BatchResult(index, item, recommendation, urls))
+
+        for future in futures:
+            future.add_done_callback(on_image_done)
+
+    def run_chunk(chunk):
+        try:
+            with calls_lock:
+                calls["llm"] += 1
+            recommendations = list(recommend_chunk([items[i] for i in chunk]))
+        except Exception:
+            recommendations = []
+        recommendations += [None] * (len(chunk) - len(recommendations))
+        for index, recommendation in zip(chunk, recommendations):
+            if recommendation is None and recommend_one is not None:
+                with calls_lock:
+                    calls["llm_retries"] += 1
+                try:
+                    recommendation = recommend_one(items[index])
+                except Exception:
+                    recommendation = None
+            try:
+                finish(index, recommendation)
+            except Exception:
+                # 어떤 경우에도 항목마다 결과 하나는 내보내야 소비하는 쪽이 멈추지 않습니다.
+                results.put(BatchResult(index, items[index]))
+
+    with ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="ottaku-batch") as llm_pool:
+        for chunk in pack(len(items)):
+            llm_pool.submit(run_chunk, chunk)
+        for _ in range(len(items)):
+            yield results.get()
+    if stats is not None:
+        stats.update(items=len(items), llm_calls=calls["llm"], llm_retries=calls["llm_retries"],
+                     image_prompts=images.requested, images_generated=images.generated)
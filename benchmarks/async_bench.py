@@ -0,0 +1,140 @@
+"""동기 클라이언트와 asyncio 서비스 계층(async_services)의 동시 대기 비용을 비교하는 벤치마크
+
+가짜 API(benchmarks/fakes)에 같은 지연 시간을 주입한 뒤, Gemini/DALL-E/기상청 호출을 섞어 N개를 동시에 보냅니다.
+    sync_threads   호출마다 스레드 하나 (지금처럼 세션 스레드가 응답을 기다리는 방식)
+    sync_pool      고정 크기 스레드 풀 (스레드 수를 제한하면 처리량이 풀 크기에 묶임)
+    async          백그라운드 이벤트 루프 하나에서 코루틴으로 대기
+단계마다 처리량(호출/s), 최대 동시 스레드 수, RSS 증가량을 기록합니다.
+
+사용 예:
+    python -m benchmarks.async_bench --inflight 10,100,1000 --latency 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fakes  # noqa: E402
+from benchmarks.load_test import current_rss_bytes  # noqa: E402
+from benchmarks.run_bench import RESULTS_DIR, git_revision  # noqa: E402
+import async_services  # noqa: E402
+
+KMA_URL = "http://apis.data.go.kr/1360000/VilageFcstInfoService_2.0/getVilageFcst"
+SERVICES = ("gemini", "dalle", "kma")
+
+
+class ThreadSampler:
+    """측정 중 동시에 살아 있는 스레드 수의 최댓값을 기록하는 객체 (자기 자신은 제외)"""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count() - 1)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def sync_call(i, model, client):
+    service = SERVICES[i % len(SERVICES)]
+    if service == "gemini":
+        return model.generate_content("벤치마크")
+    if service == "dalle":
+        return client.images.generate(prompt=f"look {i}", model="dall-e-3", size="1024x1024")
+    import requests
+    return requests.get(KMA_URL, params={"pageNo": "1"}, timeout=10)
+
+
+async def async_call(i, model):
+    service = SERVICES[i % len(SERVICES)]
+    if service == "gemini":
+        return await async_services.generate_content_async(model, "벤치마크")
+    if service == "dalle":
+        return await async_services.generate_image_async("fixture", f"look {i}", model="dall-e-3",
+                                                         size="1024x1024")
+    return await async_services.fetch_async(KMA_URL, params={"pageNo": "1"})
+
+
+def run_mode(mode, n, pool_size):
+    """한 방식으로 n개의 호출을 동시에 보내고 측정값을 반환하는 함수"""
+    import google.generativeai as genai
+    import openai
+
+    model = genai.GenerativeModel("gemini-1.5-flash")
+    client = openai.OpenAI(api_key="fixture")
+    fakes.reset_call_counts()
+    rss_before = current_rss_bytes()
+    with ThreadSampler() as sampler:
+        t0 = time.perf_counter()
+        if mode == "async":
+            async_services.gather(*(async_call(i, model) for i in range(n)))
+        else:
+            workers = n if mode == "sync_threads" else min(n, pool_size)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda i: sync_call(i, model, client), range(n)))
+        wall = time.perf_counter() - t0
+    calls = sum(fakes.CALL_COUNTS[s] for s in SERVICES)
+    return {"mode": mode, "inflight": n, "calls": calls, "wall_s": wall, "calls_per_s": calls / wall,
+            "peak_threads": sampler.peak, "rss_delta_mb": (current_rss_bytes() - rss_before) / 2 ** 20}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="옷타쿠 동기/비동기 외부 호출 비교 벤치마크")
+    parser.add_argument("--inflight", default="10,100,1000", help="쉼표로 구분한 동시 호출 수 단계")
+    parser.add_argument("--latency", type=float, default=0.2, help="호출마다 주입할 지연 시간(초)")
+    parser.add_argument("--pool-size", type=int, default=32, help="sync_pool 방식의 스레드 풀 크기")
+    parser.add_argument("--output", help="결과 JSON 경로 (기본값: benchmarks/results/async_<rev>_<시각>.json)")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    fakes.configure_latency(**{service: args.latency for service in SERVICES})
+    fakes.install_fakes()
+    # 루프 시작 비용이 첫 단계에 섞이지 않도록 미리 띄워 둡니다.
+    async_services.get_loop()
+    levels = [int(n) for n in args.inflight.split(",") if n.strip()]
+
+    results = []
+    for n in levels:
+        for mode in ("sync_threads", "sync_pool", "async"):
+            result = run_mode(mode, n, args.pool_size)
+            results.append(result)
+            print(f"{mode:<13} 동시 {n:>5}개: {result['calls_per_s']:>8.1f} 호출/s, "
+                  f"최대 스레드 {result['peak_threads']:>5}개, RSS +{result['rss_delta_mb']:.1f}MB")
+
+    report = {
+        "meta": {"git_revision": git_revision(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+                 "latency_s": args.latency, "pool_size": args.pool_size, "cpu_count": os.cpu_count(),
+                 "httpx": async_services.httpx is not None},
+        "results": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"async_{report['meta']['git_revision']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n결과 저장: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""오프라인 상품 색인(catalog)의 구축/검색/증분 갱신 비용을 재는 벤치마크
+
+색상·소재·핏·품목·브랜드 조합으로 합성 카탈로그를 만든 뒤
+    build        전체 색인 구축 시간과 색인 크기, RSS 증가량
+    search       추천 키워드 하나를 상위 3개 상품으로 바꾸는 지연 시간 (조건 없음 / 카테고리·가격 조건)
+    reload       1% 행이 바뀐(추가/수정/삭제) 카탈로그를 증분 반영하는 시간
+을 기록합니다.
+
+사용 예:
+    python -m benchmarks.catalog_bench --items 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.load_test import current_rss_bytes  # noqa: E402
+from benchmarks.run_bench import RESULTS_DIR, git_revision, summarize_latencies  # noqa: E402
+import catalog  # noqa: E402
+
+COLORS = ["화이트", "블랙", "베이지", "네이비", "그레이", "아이보리", "차콜", "카키", "브라운", "연청", "진청", "스카이 블루",
+          "버건디", "올리브", "크림", "민트", "라벤더", "오렌지"]
+MATERIALS = ["린넨", "코튼", "울", "캐시미어", "데님", "나일론", "레더", "스웨이드", "캔버스", "니트", "플리스", "코듀로이"]
+FITS = ["오버핏", "세미 와이드", "와이드", "슬림", "레귤러", "크롭", "릴렉스드", "스트레이트", "테이퍼드", "빅"]
+ITEMS = [("상의", "반팔 티셔츠"), ("상의", "긴팔 티셔츠"), ("상의", "셔츠"), ("상의", "맨투맨"), ("상의", "후드"),
+         ("상의", "니트"), ("상의", "가디건"), ("하의", "슬랙스"), ("하의", "데님 팬츠"), ("하의", "치노 팬츠"),
+         ("하의", "조거 팬츠"), ("하의", "스커트"), ("아우터", "블레이저"), ("아우터", "코트"), ("아우터", "패딩"),
+         ("아우터", "바람막이"), ("신발", "스니커즈"), ("신발", "로퍼"), ("신발", "부츠"), ("가방", "토트백"),
+         ("가방", "크로스백"), ("가방", "백팩"), ("모자", "볼캡"), ("모자", "버킷햇")]
+KEYWORDS = ["베이지 와이드 슬랙스", "화이트 스니커즈", "화이트 반팔 티셔츠", "연청 데님 팬츠", "캔버스 토트백",
+            "네이비 블레이저", "블랙 레더 부츠", "그레이 후드", "차콜 울 코트", "크림 니트 가디건"]
+
+
+def make_catalog(n, seed=0, first_id=0):
+    """n개 상품의 합성 카탈로그 DataFrame을 만드는 함수"""
+    rng = np.random.default_rng(seed)
+    item = rng.integers(len(ITEMS), size=n)
+    brands = np.array([f"브랜드{i:04d}" for i in range(2000)])
+    names = (pd.Series(np.array(FITS)[rng.integers(len(FITS), size=n)]) + " "
+             + pd.Series(np.array(MATERIALS)[rng.integers(len(MATERIALS), size=n)]) + " "
+             + pd.Series(np.array([name for _, name in ITEMS])[item]))
+    ids = np.char.add("P", np.arange(first_id, first_id + n).astype(str))
+    return pd.DataFrame({
+        "product_id": ids, "name": names, "brand": brands[rng.integers(len(brands), size=n)],
+        "category": np.array([category for category, _ in ITEMS])[item],
+        "color": np.array(COLORS)[rng.integers(len(COLORS), size=n)],
+        "price": rng.integers(10, 500, size=n) * 1000.0,
+        "url": "", "image_url": "",
+    })
+
+
+def measure(func, iterations):
+    latencies = []
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - t0)
+    return summarize_latencies(latencies, time.perf_counter() - wall_start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="옷타쿠 오프라인 상품 색인 벤치마크")
+    parser.add_argument("--items", type=int, default=1_000_000, help="합성 카탈로그 상품 수")
+    parser.add_argument("--iterations", type=int, default=200, help="검색 반복 횟수")
+    parser.add_argument("--change-ratio", type=float, default=0.01, help="증분 갱신에서 바꿀 행 비율")
+    parser.add_argument("--output", help="결과 JSON 경로 (기본값: benchmarks/results/catalog_<rev>_<시각>.json)")
+    args = parser.parse_args(argv)
+
+    df = make_catalog(args.items)
+    rss_before = current_rss_bytes()
+    index = catalog.ProductIndex(df)
+    build = {"items": args.items, "build_s": index.build_ms / 1000, **index.stats(),
+             "rss_delta_mb": (current_rss_bytes() - rss_before) / 2 ** 20}
+    print(f"구축: {args.items:,}개 {build['build_s']:.1f}s, 색인 {build['index_mb']:.1f}MB, "
+          f"2-gram {build['grams']:,}개, RSS +{build['rss_delta_mb']:.0f}MB")
+
+    results = {
+        "search": measure(lambda i: index.search(KEYWORDS[i % len(KEYWORDS)], k=3), args.iterations),
+        "search_filtered": measure(lambda i: index.search(KEYWORDS[i % len(KEYWORDS)], k=3, category="하의",
+                                                          max_price=100_000), args.iterations),
+        "resolve_5_keywords": measure(lambda i: index.resolve(KEYWORDS[:5], k=3), args.iterations // 5 or 1),
+    }
+    for name, result in results.items():
+        print(f"{name:<20} p50 {result['p50_ms']:7.2f}ms  p95 {result['p95_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms")
+
+    # 일부 행은 가격이 바뀌고, 일부는 빠지고, 같은 수만큼 새 상품이 들어온 카탈로그
+    n_change = max(1, int(args.items * args.change_ratio))
+    changed = df.iloc[:len(df) - n_change].copy()
+    changed.loc[changed.index[:n_change], "price"] += 1000
+    changed = pd.concat([changed, make_catalog(n_change, seed=1, first_id=args.items)], ignore_index=True)
+    reload = index.apply(changed)
+    print(f"증분 갱신: 추가 {reload['added']:,} / 수정 {reload['updated']:,} / 삭제 {reload['removed']:,} "
+          f"→ {reload['ms']:.0f}ms ({reload['mode']})")
+    results["search_after_reload"] = measure(lambda i: index.search(KEYWORDS[i % len(KEYWORDS)], k=3),
+                                             args.iterations)
+
+    report = {
+        "meta": {"git_revision": git_revision(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+                 "cpu_count": os.cpu_count()},
+        "build": build, "reload": reload, "results": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"catalog_{report['meta']['git_revision']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=float)
+    print(f"\n결과 저장: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""녹화된 API 응답을 재생하는 로컬 가짜 클라이언트 모음
+
+Gemini, DALL-E, TTS, 기상청(KMA), Google Trends 호출을 (동기/비동기 클라이언트 모두) 네트워크 없이 재현하며,
+서비스별로 인위적인 지연 시간을 주입할 수 있습니다. install_fakes()는 app.py가
+실행되기 전에 각 라이브러리의 진입점을 교체하므로 AppTest로 앱 전체를 구동할 수 있습니다.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import types
+
+import pandas as pd
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 서비스별 주입 지연 시간(초). configure_latency()로 변경합니다.
+LATENCY = {"gemini": 0.0, "dalle": 0.0, "tts": 0.0, "kma": 0.0, "trends": 0.0, "image_download": 0.0}
+
+# 가짜 클라이언트가 실제로 받은 호출 수 (벤치마크 결과에 함께 기록)
+CALL_COUNTS = {name: 0 for name in LATENCY}
+_counts_lock = threading.Lock()
+
+# 이미지 크기별 지연 시간 배율 (주입한 dalle 지연은 1024x1024 기준). 작은 미리보기가 더 빨리 끝나는 것을 흉내 냅니다.
+IMAGE_LATENCY_SCALE = {"256x256": 0.3, "512x512": 0.5}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def configure_latency(**latencies):
+    """서비스 이름=초 형식으로 주입 지연 시간을 설정하는 함수"""
+    for name, seconds in latencies.items():
+        if name not in LATENCY:
+            raise KeyError(f"알 수 없는 서비스: {name}")
+        LATENCY[name] = float(seconds)
+
+
+def reset_call_counts():
+    with _counts_lock:
+        for name in CALL_COUNTS:
+            CALL_COUNTS[name] = 0
+
+
+def _simulate(service, scale=1.0):
+    with _counts_lock:
+        CALL_COUNTS[service] += 1
+    if LATENCY[service] > 0:
+        time.sleep(LATENCY[service] * scale)
+
+
+async def _simulate_async(service, scale=1.0):
+    with _counts_lock:
+        CALL_COUNTS[service] += 1
+    if LATENCY[service] > 0:
+        await asyncio.sleep(LATENCY[service] * scale)
+
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part for part in contents if isinstance(part, str))
+
+
+def classify_gemini_prompt(prompt):
+    """프롬프트 내용으로 어떤 녹화 응답을 돌려줄지 결정하는 함수"""
+    if "item_type" in prompt and "IMAGE_PROMPT" not in prompt:
+        return "clothing_analysis"
+    if "퍼스널 컬러" in prompt:
+        return "personal_color"
+    return "cody_recommendation"
+
+
+class FakeGeminiResponse:
+    def __init__(self, text, usage):
+        self.text = text
+        self.usage_metadata = types.SimpleNamespace(**usage)
+
+
+class FakeGenerativeModel:
+    """google.generativeai.GenerativeModel 대체 클래스"""
+    responses = None
+
+    def __init__(self, model_name="gemini-1.5-flash", *args, system_instruction=None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+        if FakeGenerativeModel.responses is None:
+            FakeGenerativeModel.responses = load_fixture("gemini_responses.json")
+
+    def generate_content(self, contents, *args, generation_config=None, **kwargs):
+        _simulate("gemini")
+        return self._response(contents, generation_config)
+
+    async def generate_content_async(self, contents, *args, generation_config=None, **kwargs):
+        await _simulate_async("gemini")
+        return self._response(contents, generation_config)
+
+    def _response(self, contents, generation_config):
+        schema = (generation_config or {}).get("response_schema")
+        if schema:
+            return self._structured_response(schema, _prompt_text(contents))
+        prompt = f"{self.system_instruction}\n{_prompt_text(contents)}"
+        recorded = self.responses[classify_gemini_prompt(prompt)]
+        return FakeGeminiResponse(recorded["text"], recorded["usage"])
+
+    def _structured_response(self, schema, prompt):
+        """response_schema의 필드 구성으로 녹화된 구조화 응답을 고르고, 요청된 필드만 남겨 돌려주는 함수"""
+        fields = schema["properties"]
+        if "items" in fields:
+            # 배치 요청은 프롬프트의 [번호] 줄 수만큼 녹화된 코디를 (프롬프트를 조금씩 바꿔) 돌려줍니다.
+            recorded = self.responses["cody_recommendation_structured"]
+            outfits = json.loads(recorded["text"])["outfits"]
+            indices = [int(n) for n in re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)]
+            items = [{"index": i, "outfits": [dict(o, image_prompt=f"{o['image_prompt']} Look {i}.") for o in outfits]}
+                     for i in indices]
+            usage = {k: v * max(1, len(indices)) for k, v in recorded["usage"].items()}
+            return FakeGeminiResponse(json.dumps({"items": items}, ensure_ascii=False), usage)
+        if "outfits" in fields:
+            recorded = self.responses["cody_recommendation_structured"]
+            return FakeGeminiResponse(recorded["text"], recorded["usage"])
+        if "image_prompts" in fields:
+            recorded = self.responses["cody_recommendation_structured"]
+            prompts = [o["image_prompt"] for o in json.loads(recorded["text"])["outfits"]]
+            return FakeGeminiResponse(json.dumps({"image_prompts": prompts}), {"prompt_token_count": 180,
+                                                                                "candidates_token_count": 90})
+        recorded = self.responses["clothing_analysis_structured"]
+        data = {k: v for k, v in json.loads(recorded["text"]).items() if k in fields}
+        return FakeGeminiResponse(json.dumps(data, ensure_ascii=False), recorded["usage"])
+
+    def count_tokens(self, contents, *args, **kwargs):
+        # 한국어 위주 텍스트 기준의 대략적인 추정치
+        return types.SimpleNamespace(total_tokens=max(1, len(_prompt_text(contents)) // 2))
+
+
+class _FakeSpeechResponse:
+    def __init__(self, size):
+        self.content = b"\xff\xfb" + b"\x00" * (size - 2)
+
+    def stream_to_file(self, path):
+        with open(path, "wb") as f:
+            f.write(self.content)
+
+    def write_to_file(self, path):
+        self.stream_to_file(path)
+
+
+class FakeOpenAI:
+    """openai.OpenAI 대체 클래스 (images.generate, audio.speech.create만 지원)"""
+
+    def __init__(self, *args, **kwargs):
+        recorded = load_fixture("openai_responses.json")
+        self._image_url = recorded["images_generate"]["url"]
+        self._speech_bytes = recorded["speech_create"]["bytes"]
+        self._image_count = 0
+        self._image_lock = threading.Lock()
+        self.images = types.SimpleNamespace(generate=self._generate_image)
+        self.audio = types.SimpleNamespace(speech=types.SimpleNamespace(create=self._create_speech))
+
+    def _generate_image(self, *args, size="1024x1024", **kwargs):
+        _simulate("dalle", IMAGE_LATENCY_SCALE.get(size, 1.0))
+        return self._image_response()
+
+    def _image_response(self):
+        with self._image_lock:
+            self._image_count += 1
+            url = self._image_url.format(n=self._image_count)
+        return types.SimpleNamespace(data=[types.SimpleNamespace(url=url, revised_prompt=None)])
+
+    def _create_speech(self, *args, **kwargs):
+        _simulate("tts")
+        return _FakeSpeechResponse(self._speech_bytes)
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """openai.AsyncOpenAI 대체 클래스 (FakeOpenAI와 같은 응답을 코루틴으로 돌려줌)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.images = types.SimpleNamespace(generate=self._generate_image_async)
+        self.audio = types.SimpleNamespace(speech=types.SimpleNamespace(create=self._create_speech_async))
+
+    async def _generate_image_async(self, *args, size="1024x1024", **kwargs):
+        await _simulate_async("dalle", IMAGE_LATENCY_SCALE.get(size, 1.0))
+        return self._image_response()
+
+    async def _create_speech_async(self, *args, **kwargs):
+        await _simulate_async("tts")
+        return _FakeSpeechResponse(self._speech_bytes)
+
+
+def make_fixture_png(size=(256, 256), color=(135, 206, 235)):
+    """단색 PNG 바이트를 생성하는 함수 (업로드 이미지/생성 이미지 대용)"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeHttpResponse:
+    def __init__(self, body, status_code=200):
+        self.content = body
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=8192):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    async def aiter_bytes(self, chunk_size=8192):
+        for chunk in self.iter_content(chunk_size):
+            yield chunk
+
+
+class FakeRequests:
+    """requests.get 대체 함수 객체 (기상청 API와 생성 이미지 URL만 응답)"""
+
+    def __init__(self):
+        self._kma_body = json.dumps(load_fixture("kma_vilage_fcst.json"), ensure_ascii=False).encode("utf-8")
+        self._png = make_fixture_png()
+
+    def __call__(self, url, *args, **kwargs):
+        service, body = self.route(url)
+        _simulate(service)
+        return FakeHttpResponse(body)
+
+    def route(self, url):
+        if "apis.data.go.kr" in url:
+            return "kma", self._kma_body
+        return "image_download", self._png
+
+
+class FakeAsyncHttpClient:
+    """async_services의 HTTP 클라이언트(httpx.AsyncClient의 get/stream만) 대체 클래스"""
+
+    def __init__(self):
+        self._requests = FakeRequests()
+
+    async def get(self, url, params=None, timeout=None):
+        service, body = self._requests.route(url)
+        await _simulate_async(service)
+        return FakeHttpResponse(body)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, params=None, timeout=None):
+        yield await self.get(url, params=params, timeout=timeout)
+
+
+class FakeTrendReq:
+    """pytrends.request.TrendReq 대체 클래스"""
+
+    def __init__(self, *args, **kwargs):
+        self._recorded = load_fixture("trends_interest.json")
+
+    def build_payload(self, *args, **kwargs):
+        pass
+
+    def interest_over_time(self):
+        _simulate("trends")
+        df = pd.DataFrame(self._recorded["data"], columns=self._recorded["columns"],
+                          index=pd.to_datetime(self._recorded["index"]))
+        df["isPartial"] = False
+        return df
+
+
+class FakeUpload(io.BytesIO):
+    """st.file_uploader가 돌려주는 UploadedFile과 같은 속성을 가진 객체"""
+
+    def __init__(self, data, name="fixture.png", mime_type="image/png"):
+        super().__init__(data)
+        self.name = name
+        self.type = mime_type
+        self.size = len(data)
+        self.file_id = f"fixture-{id(self)}"
+
+
+def install_fakes():
+    """각 라이브러리의 진입점을 가짜 구현으로 교체하는 함수 (app.py 실행 전에 호출)"""
+    import google.generativeai as genai
+    import openai
+    import pytrends.request
+    import requests
+
+    genai.configure = lambda *args, **kwargs: None
+    genai.GenerativeModel = FakeGenerativeModel
+    openai.OpenAI = FakeOpenAI
+    openai.AsyncOpenAI = FakeAsyncOpenAI
+    requests.get = FakeRequests()
+    pytrends.request.TrendReq = FakeTrendReq
+    # httpx는 선택 의존성이라 라이브러리 대신 비동기 서비스 계층의 클라이언트 생성 함수를 교체합니다.
+    import async_services
+    async_services.new_http_client = FakeAsyncHttpClient
+    async_services._clients.clear()
+
+
+FAKE_SECRETS = {"KMA_API_KEY": "fixture", "GOOGLE_API_KEY": "fixture", "OPENAI_API_KEY": "fixture"}
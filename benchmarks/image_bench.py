@@ -0,0 +1,151 @@
+"""여러 사용자가 동시에 옷 사진을 올릴 때 이미지 CPU 작업의 처리량과 화면 멈춤을 재는 벤치마크
+
+세션마다 스레드 하나가 서로 다른 사진(JPEG)을 올리고, 사진마다 색상 팔레트 추출 → 임베딩 → 저장소 저장 → 썸네일을
+차례로 기다립니다 (옷 분석/옷장 추가 흐름과 같은 작업).
+    inline       지금까지처럼 세션 스레드에서 바로 처리 (OTTAKU_IMAGE_WORKERS=0, GIL을 나눠 씀)
+    workers=N    image_workers 작업자 프로세스 N개에 공유 메모리로 넘겨 처리
+단계마다 처리량(사진/s), 사진 한 장의 p50/p95 지연 시간, 그리고 같은 프로세스에서 5ms마다 짧은 순수 파이썬 작업을
+돌리는 스레드의 실행 시간(p50/p99)을 기록합니다. 마지막 값은 다른 세션의 화면 그리기가 GIL 때문에 얼마나 밀리는지의 근사치이며,
+부하가 없을 때의 값은 "idle" 행으로 함께 남깁니다.
+
+사용 예:
+    python -m benchmarks.image_bench --sessions 8 --photos 4 --workers 1,2,4
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.run_bench import RESULTS_DIR, git_revision, summarize_latencies  # noqa: E402
+import image_store  # noqa: E402
+import image_workers  # noqa: E402
+
+
+def make_photo(seed, size):
+    """그라데이션과 잡음이 섞인 size x size JPEG 바이트 (사진마다 내용이 달라 캐시가 적중하지 않음)"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    base = rng.uniform(40, 215, 3).astype(np.float32)
+    rgb = base + 40 * np.stack([x, y, x * y], axis=-1) + rng.normal(0, 12, (size, size, 3)).astype(np.float32)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def render_work(n=20000):
+    """스크립트 재실행을 흉내 낸 짧은 순수 파이썬 작업 (GIL이 필요함)"""
+    return sum(len(str(i)) for i in range(n))
+
+
+class RenderProbe:
+    """interval초마다 render_work()를 실행해 걸린 시간을 모으는 객체 (다른 세션의 화면 그리기 근사치)"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.durations = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            t0 = time.perf_counter()
+            render_work()
+            self.durations.append(time.perf_counter() - t0)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        values = np.array(self.durations or [0.0]) * 1000
+        return {"render_p50_ms": float(np.percentile(values, 50)), "render_p99_ms": float(np.percentile(values, 99))}
+
+
+def run_mode(workers, sessions, photos, size):
+    """한 방식으로 sessions개 세션이 photos장씩 올리는 부하를 처리하고 측정값을 반환하는 함수"""
+    store = image_store.ImageStore(tempfile.mkdtemp(prefix="ottaku_image_bench_"))
+    service = image_workers.ImageService(workers=workers, store=store)
+    # 작업자 프로세스 시작 비용은 측정에서 뺍니다.
+    warmup = make_photo(10 ** 6, 64)
+    service.palette(warmup).result()
+    uploads = [[make_photo(s * 1000 + p, size) for p in range(photos)] for s in range(sessions)]
+    latencies = []
+    lock = threading.Lock()
+
+    def session(index):
+        for data in uploads[index]:
+            t0 = time.perf_counter()
+            palette, embedding = service.palette(data), service.embed(data)
+            palette.result()
+            embedding.result()
+            service.thumbnail(store.put(data), 512).result()
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    with RenderProbe() as probe:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            list(pool.map(session, range(sessions)))
+        wall = time.perf_counter() - t0
+    service.shutdown()
+    result = summarize_latencies(latencies, wall)
+    return {"mode": "inline" if workers == 0 else f"workers={workers}", "workers": workers, "sessions": sessions,
+            "photos": sessions * photos, "wall_s": wall, "photos_per_s": sessions * photos / wall,
+            "p50_ms": result["p50_ms"], "p95_ms": result["p95_ms"], **probe.summary()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="옷타쿠 이미지 작업자 프로세스 벤치마크")
+    parser.add_argument("--sessions", type=int, default=8, help="동시에 사진을 올리는 세션 수")
+    parser.add_argument("--photos", type=int, default=4, help="세션마다 올리는 사진 수")
+    parser.add_argument("--size", type=int, default=1600, help="사진 한 변의 픽셀 수")
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})),
+                        help="쉼표로 구분한 작업자 프로세스 수 단계 (inline은 항상 함께 측정)")
+    parser.add_argument("--output", help="결과 JSON 경로 (기본값: benchmarks/results/image_<rev>_<시각>.json)")
+    args = parser.parse_args(argv)
+
+    levels = [0] + [int(n) for n in args.workers.split(",") if n.strip() and int(n) > 0]
+    with RenderProbe() as probe:
+        time.sleep(1.0)
+    results = [{"mode": "idle", **probe.summary()}]
+    print(f"{'idle':<10} 화면 그리기 p50 {results[0]['render_p50_ms']:>5.1f}ms p99 {results[0]['render_p99_ms']:>6.1f}ms")
+    for workers in levels:
+        result = run_mode(workers, args.sessions, args.photos, args.size)
+        results.append(result)
+        print(f"{result['mode']:<10} {result['photos_per_s']:>6.1f} 사진/s, p50 {result['p50_ms']:>7.1f}ms, "
+              f"p95 {result['p95_ms']:>7.1f}ms, 화면 그리기 p50 {result['render_p50_ms']:>5.1f}ms "
+              f"p99 {result['render_p99_ms']:>6.1f}ms")
+
+    report = {
+        "meta": {"git_revision": git_revision(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+                 "cpu_count": os.cpu_count(), "sessions": args.sessions, "photos": args.photos, "size": args.size},
+        "results": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"image_{report['meta']['git_revision']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n결과 저장: {output}")
+
+
+if __name__ == "__main__":
+    main()
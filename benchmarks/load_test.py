@@ -0,0 +1,217 @@
+"""여러 Streamlit 세션이 동시에 접속하는 상황을 한 프로세스 안에서 재현하는 부하 테스트
+
+각 가상 세션은 독립된 AppTest 인스턴스로, 가짜 API(benchmarks/fakes)를 사용해
+메인 → 옷 분석 → 코디 추천 → 옷장 흐름을 순서대로 진행합니다.
+세션 수를 단계적으로 늘리면서 단계별 지연 시간, 세션당 RSS 증가량, 처리량을 측정하고
+p95 지연 시간 목표(SLO)를 지키는 최대 세션 수를 "프로세스당 세션 수"로 보고합니다.
+
+사용 예:
+    python -m benchmarks.load_test --sessions 1,4,8,16 --latency gemini=0.5 --latency dalle=1.0
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fakes  # noqa: E402
+import rate_limit  # noqa: E402
+from benchmarks.run_bench import (RESULTS_DIR, SAMPLE_USER_INFO, click, configure_rate_limits,  # noqa: E402
+                                  git_revision, new_app, parse_latency, summarize_latencies)
+
+STEPS = ("main", "analysis", "recommendation", "closet")
+
+
+def current_rss_bytes():
+    """현재 프로세스의 RSS(바이트)를 반환하는 함수"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # /proc이 없는 플랫폼에서는 최대 RSS로 대신합니다 (macOS는 바이트, Linux는 KB 단위).
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+class VirtualSession:
+    """하나의 브라우저 탭에 해당하는 가상 세션"""
+
+    def __init__(self, session_id, think_time):
+        self.session_id = session_id
+        self.think_time = think_time
+        self.at = None
+        self.timings = {step: [] for step in STEPS}
+        self.errors = []
+
+    def _step(self, name, action):
+        t0 = time.perf_counter()
+        try:
+            action()
+            self.timings[name].append(time.perf_counter() - t0)
+        except Exception as e:
+            self.errors.append(f"{name}: {e}")
+        if self.think_time:
+            time.sleep(random.uniform(0, self.think_time))
+
+    def walk(self):
+        """메인 → 분석 → 추천 → 옷장 흐름을 한 번 진행하는 함수"""
+        upload = fakes.FakeUpload(fakes.make_fixture_png(), name=f"session_{self.session_id}.png")
+
+        def open_main():
+            self.at = new_app("main", user_info=SAMPLE_USER_INFO, cloth_photo_object=upload)
+            self.at.run()
+
+        def analyze():
+            click(self.at, "AI로 옷 분석 시작하기")
+
+        def add_and_recommend():
+            click(self.at, "👚 옷장에 추가하기")
+            click(self.at, "AI 코디 추천 및 이미지 생성")
+
+        def open_closet():
+            self.at.session_state["page"] = "closet"
+            self.at.run()
+
+        self._step("main", open_main)
+        self._step("analysis", analyze)
+        self._step("recommendation", add_and_recommend)
+        self._step("closet", open_closet)
+
+
+def run_level(n_sessions, think_time, walks):
+    """n_sessions개의 세션을 동시에 실행하고 결과를 집계하는 함수"""
+    sessions = [VirtualSession(i, think_time) for i in range(n_sessions)]
+    start_barrier = threading.Barrier(n_sessions)
+
+    def drive(session):
+        start_barrier.wait()
+        for _ in range(walks):
+            session.walk()
+
+    # 실행 중 스레드 수와 RSS의 최댓값을 주기적으로 기록합니다.
+    peaks = {"threads": threading.active_count(), "rss": current_rss_bytes()}
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peaks["threads"] = max(peaks["threads"], threading.active_count())
+            peaks["rss"] = max(peaks["rss"], current_rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    rss_before = current_rss_bytes()
+    sampler.start()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_sessions, thread_name_prefix="vsession") as pool:
+        list(pool.map(drive, sessions))
+    wall = time.perf_counter() - wall_start
+    done.set()
+    sampler.join()
+    # 세션 객체(AppTest와 session_state)를 유지한 상태에서 메모리를 측정합니다.
+    rss_after = current_rss_bytes()
+
+    steps = {}
+    for step in STEPS:
+        latencies = [t for s in sessions for t in s.timings[step]]
+        if latencies:
+            steps[step] = summarize_latencies(latencies, wall)
+    errors = [e for s in sessions for e in s.errors]
+    completed_walks = sum(len(s.timings["closet"]) for s in sessions)
+    result = {
+        "sessions": n_sessions,
+        "wall_s": wall,
+        "walks_per_s": completed_walks / wall if wall else 0.0,
+        "rss_before_mb": rss_before / 2 ** 20,
+        "rss_after_mb": rss_after / 2 ** 20,
+        "rss_per_session_mb": max(0, rss_after - rss_before) / 2 ** 20 / n_sessions,
+        "rss_peak_mb": peaks["rss"] / 2 ** 20,
+        "threads_peak": peaks["threads"],
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "steps": steps,
+    }
+    del sessions
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="옷타쿠 동시 세션 부하 테스트")
+    parser.add_argument("--sessions", default="1,4,8", help="쉼표로 구분한 동시 세션 수 단계")
+    parser.add_argument("--walks", type=int, default=1, help="세션당 전체 흐름 반복 횟수")
+    parser.add_argument("--think-time", type=float, default=0.0, help="단계 사이 최대 대기 시간(초)")
+    parser.add_argument("--slo-p95-ms", type=float, default=5000.0, help="단계별 p95 지연 시간 목표(ms)")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=SECONDS",
+                        help=f"주입할 지연 시간 ({', '.join(fakes.LATENCY)})")
+    parser.add_argument("--output", help="결과 JSON 경로 (기본값: benchmarks/results/load_<rev>_<시각>.json)")
+    parser.add_argument("--rate-limits", default="off", metavar="SPEC",
+                        help="적용할 호출 한도 (OTTAKU_RATE_LIMITS 형식, 기본값 off). 대기열 지표가 결과에 기록됩니다.")
+    args = parser.parse_args(argv)
+    try:
+        levels = [int(n) for n in args.sessions.split(",") if n.strip()]
+    except ValueError:
+        parser.error(f"--sessions에는 쉼표로 구분한 정수를 넣어 주세요: {args.sessions}")
+    if not levels or min(levels) < 1:
+        parser.error(f"--sessions의 각 단계는 1 이상이어야 합니다: {args.sessions}")
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    fakes.configure_latency(**parse_latency(args.latency))
+    fakes.install_fakes()
+
+    results = []
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="ottaku_load_") as workdir:
+        os.chdir(workdir)
+        try:
+            for n in levels:
+                fakes.reset_call_counts()
+                configure_rate_limits(args.rate_limits)
+                level = run_level(n, args.think_time, args.walks)
+                level["fake_calls"] = dict(fakes.CALL_COUNTS)
+                level["rate_limits"] = rate_limit.stats()
+                worst_p95 = max((s["p95_ms"] for s in level["steps"].values()), default=float("inf"))
+                level["worst_step_p95_ms"] = worst_p95
+                level["meets_slo"] = level["errors"] == 0 and worst_p95 <= args.slo_p95_ms
+                results.append(level)
+                print(f"세션 {n:>4}개: {level['walks_per_s']:.2f} 흐름/s, 최악 p95 {worst_p95:.0f}ms, "
+                      f"세션당 RSS {level['rss_per_session_mb']:.2f}MB, 오류 {level['errors']}건")
+        finally:
+            os.chdir(original_cwd)
+
+    sustainable = max((r["sessions"] for r in results if r["meets_slo"]), default=0)
+    report = {
+        "meta": {"git_revision": git_revision(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+                 "walks": args.walks, "think_time_s": args.think_time, "slo_p95_ms": args.slo_p95_ms,
+                 "injected_latency_s": dict(fakes.LATENCY), "cpu_count": os.cpu_count()},
+        "sustainable_sessions_per_process": sustainable,
+        "levels": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load_{report['meta']['git_revision']}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\np95 {args.slo_p95_ms:.0f}ms 목표를 지키는 최대 동시 세션 수: {sustainable}")
+    for step in STEPS:
+        row = [f"{r['steps'][step]['p95_ms']:>9.0f}" if step in r["steps"] else f"{'-':>9}" for r in results]
+        print(f"  {step:<16} p95(ms) " + " ".join(row))
+    print(f"결과 저장: {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""오프라인 벤치마크 실행기
+
+녹화된 API 응답(benchmarks/fixtures)을 가짜 클라이언트로 재생하면서
+순수 함수와 streamlit.testing AppTest로 구동한 각 페이지/흐름의 처리량과 지연 시간 백분위를 측정합니다.
+네트워크가 없는 환경에서도 실행되며, 결과는 커밋 간 비교를 위해 JSON으로 저장됩니다.
+
+사용 예:
+    python -m benchmarks.run_bench --iterations 20 --latency gemini=0.05 --latency dalle=0.1
+    python -m benchmarks.run_bench --compare benchmarks/results/이전결과.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fakes  # noqa: E402
+import rate_limit  # noqa: E402
+import speculation  # noqa: E402
+
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+# 관리자 대시보드를 측정하기 위해 벤치마크 세션이 쓰는 토큰 (OTTAKU_ADMIN_TOKEN이 이미 있으면 그 값을 씁니다)
+os.environ.setdefault("OTTAKU_ADMIN_TOKEN", "ottaku-bench")
+
+SAMPLE_USER_INFO = {"성별": "남자", "키": 175, "몸무게": 68, "피부_톤": "여름 쿨톤", "선호_스타일": ["캐주얼", "미니멀"]}
+SAMPLE_ANALYSIS = {"item_type": "상의", "category": "린넨 셔츠", "color": "스카이 블루", "pattern": "솔리드(단색)",
+                   "style_tags": ["캐주얼", "미니멀"]}
+
+
+def summarize_latencies(latencies_s, wall_s):
+    """지연 시간 목록(초)을 처리량과 백분위(ms) 요약으로 변환하는 함수"""
+    ms = np.asarray(latencies_s, dtype=float) * 1000
+    return {
+        "n": int(ms.size),
+        "throughput_per_s": float(ms.size / wall_s) if wall_s > 0 else 0.0,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def measure(func, iterations, warmup=1):
+    """func(i)를 반복 실행해 지연 시간을 측정하는 함수. func가 값을 반환하면 그 값을 측정 시간(초)으로 사용합니다."""
+    for i in range(warmup):
+        func(i)
+    latencies = []
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        measured = func(i)
+        latencies.append(measured if isinstance(measured, float) else time.perf_counter() - t0)
+    return summarize_latencies(latencies, time.perf_counter() - wall_start)
+
+
+# --- 순수 함수 벤치마크 ---
+
+def bench_pure_functions(iterations):
+    import numpy as np
+
+    import event_journal
+    import kma_grid
+    import recommendation_history
+    import similarity
+    import weather
+
+    fixture_png = fakes.make_fixture_png()
+    index = similarity.EmbeddingIndex(tempfile.mkdtemp(prefix="ottaku_similarity_"))
+    vectors = np.random.default_rng(0).random((2000, similarity.DIM), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for i, vector in enumerate(vectors):
+        index.add(f"item_{i}", vector)
+    # 목표 규모(옷장 + 저장된 코디 1만 개)의 인덱스. 화면에서는 한 사용자의 옷장만 후보로 넘겨 검색합니다.
+    large_index = similarity.EmbeddingIndex(tempfile.mkdtemp(prefix="ottaku_similarity_"))
+    large_vectors = np.random.default_rng(1).random((10_000, similarity.DIM), dtype=np.float32)
+    large_vectors /= np.linalg.norm(large_vectors, axis=1, keepdims=True)
+    for i, vector in enumerate(large_vectors):
+        large_index.add(f"item_{i}", vector)
+    large_ids = large_index.ids()
+    kma = fakes.load_fixture("kma_vilage_fcst.json")
+    items = kma["response"]["body"]["items"]["item"]
+    df = weather.pivot_forecast(items)
+    features = weather.build_daily_features(df)
+    first_day = next(iter(features.values()))
+    forecast = weather.ForecastIndex(df)
+    dates = list(forecast.days)
+    # 전국에 흩어진 좌표 1만 개 (매장/사용자 주소)를 한 번에 격자로 변환하고 칸별로 묶습니다.
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(33.1, 38.6, 10_000), rng.uniform(124.6, 131.0, 10_000)
+    # 긴 기록(1만 건)이 쌓인 세션도 스냅샷 + 짧은 꼬리만 다시 적용하므로 복구 시간이 일정해야 합니다.
+    journal_dir = tempfile.mkdtemp(prefix="ottaku_journal_")
+    journal = event_journal.Journal(journal_dir)
+    for i in range(10_000):
+        journal.append("activity_logged", analysis=SAMPLE_ANALYSIS)
+    # 한 사용자가 쌓은 추천 5천 개에서 짧은 한국어 검색어로 찾는 시간 (이미지 없는 기록)
+    history = recommendation_history.RecommendationHistory(tempfile.mkdtemp(prefix="ottaku_history_"))
+    situations = ["주말 오후 카페에서", "출근", "저녁 약속", "비 오는 날 출근", "도서관에서 공부할 때", "주말 나들이"]
+    pieces = ["린넨 셔츠", "와이드 슬랙스", "화이트 스니커즈", "데님 팬츠", "니트 가디건", "블레이저", "캔버스 토트백",
+              "레더 부츠", "울 코트", "후드 집업", "치노 팬츠", "볼캡"]
+    for i in range(5_000):
+        chosen = [pieces[(i * 7 + j * 5) % len(pieces)] for j in range(3)]
+        history.add("bench", {"text": f"{situations[i % len(situations)]}에 어울리는 코디: " + ", ".join(chosen),
+                              "keywords": chosen, "image_urls": []},
+                    {"situation": situations[i % len(situations)], "garment": SAMPLE_ANALYSIS})
+    queries = ["카페", "린넨 셔츠", "비 오는 날", "부츠", "도서관 니트"]
+    return {
+        "pure.pivot_forecast": measure(lambda i: weather.pivot_forecast(items), iterations),
+        "pure.build_daily_features": measure(lambda i: weather.build_daily_features(df), iterations),
+        "pure.forecast_index": measure(lambda i: weather.ForecastIndex(df), iterations),
+        # 날짜 전환 비용: 예전 방식(전체 스캔) 대비 색인 조회 + 현재 시각 행 찾기
+        "pure.forecast_day_scan": measure(lambda i: df[df['fcstDate'] == dates[i % len(dates)]].iloc[0],
+                                          iterations * 10),
+        "pure.forecast_day_lookup": measure(lambda i: forecast.get(dates[i % len(dates)]).current(),
+                                            iterations * 10),
+        "pure.kma_grid_10k": measure(lambda i: kma_grid.to_grid(lats, lons), iterations),
+        "pure.kma_grid_bucket_10k": measure(lambda i: kma_grid.bucket_by_cell(lats, lons), iterations),
+        "pure.recommend_clothing_by_weather": measure(
+            lambda i: weather.recommend_clothing_by_weather(first_day), iterations * 10),
+        "pure.similarity_embed": measure(lambda i: similarity.embed(fixture_png), iterations),
+        "pure.similarity_search_2k": measure(lambda i: index.search(vectors[i % len(vectors)]), iterations * 10),
+        "pure.similarity_search_10k": measure(lambda i: large_index.search(large_vectors[i % len(large_vectors)]),
+                                              iterations * 10),
+        "pure.similarity_search_10k_candidates": measure(
+            lambda i: large_index.search(large_vectors[i % len(large_vectors)], candidates=large_ids), iterations * 10),
+        "pure.journal_append": measure(lambda i: journal.append("saved_image_added", url=f"outfit_{i}.png"),
+                                       iterations * 10),
+        "pure.journal_restore_10k": measure(lambda i: event_journal.Journal(journal_dir), iterations),
+        "pure.history_search_5k": measure(lambda i: history.search("bench", queries[i % len(queries)]),
+                                          iterations * 10),
+    }
+
+
+# --- AppTest 기반 페이지/흐름 벤치마크 ---
+
+def new_app(page="main", timeout=60, **session_state):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    for key, value in fakes.FAKE_SECRETS.items():
+        at.secrets[key] = value
+    at.query_params["admin"] = os.environ["OTTAKU_ADMIN_TOKEN"]
+    at.session_state["page"] = page
+    for key, value in session_state.items():
+        at.session_state[key] = value
+    return at
+
+
+def click(at, label):
+    """라벨이 일치하는 첫 번째 버튼을 누르고 재실행 시간을 반환하는 함수"""
+    button = next(b for b in at.button if b.label == label)
+    button.click()
+    t0 = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - t0
+    if at.exception:
+        raise RuntimeError(f"'{label}' 실행 중 예외: {at.exception[0].value}")
+    return elapsed
+
+
+def timed_run(at):
+    t0 = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - t0
+    if at.exception:
+        raise RuntimeError(f"페이지 실행 중 예외: {at.exception[0].value}")
+    return elapsed
+
+
+def make_closet(n_items):
+    from image_store import get_store
+
+    store = get_store()
+    return [{"image_id": store.put(fakes.make_fixture_png(color=(i % 256, 120, 200))), "name": f"fixture_{i}.png",
+             "analysis": dict(SAMPLE_ANALYSIS)} for i in range(n_items)]
+
+
+def bench_pages(iterations, closet_size):
+    results = {}
+    state = {"user_info": SAMPLE_USER_INFO, "analysis_result": SAMPLE_ANALYSIS,
+             "user_activity_log": [SAMPLE_ANALYSIS] * 5, "my_closet": make_closet(closet_size)}
+    for page in ("main", "closet", "personal_color", "analytics", "vton", "admin"):
+        results[f"page.{page}"] = measure(lambda i, page=page: timed_run(new_app(page, **state)), iterations)
+    # 관리자 권한이 빠지면 대시보드 대신 빈 페이지를 재게 되므로 실제로 그려졌는지 확인합니다.
+    at = new_app("admin", **state)
+    timed_run(at)
+    if not any("성능 대시보드" in title.value for title in at.title):
+        raise RuntimeError("관리자 대시보드가 그려지지 않았습니다 (OTTAKU_ADMIN_TOKEN 확인)")
+    return results
+
+
+def bench_flows(iterations, closet_size):
+    def weather_flow(i):
+        at = new_app("main")
+        at.run()
+        return click(at, "날씨 조회하기 🚀")
+
+    def analysis_flow(i):
+        at = new_app("main", user_info=SAMPLE_USER_INFO,
+                     cloth_photo_object=fakes.FakeUpload(fakes.make_fixture_png(), name=f"cloth_{i}.png"))
+        at.run()
+        return click(at, "AI로 옷 분석 시작하기")
+
+    def recommendation_flow(i):
+        at = new_app("main", user_info=SAMPLE_USER_INFO, analysis_result=SAMPLE_ANALYSIS)
+        at.run()
+        return click(at, "AI 코디 추천 및 이미지 생성")
+
+    def speculated_recommendation_flow(i):
+        # 분석 직후 미리 만들기 시작한 기본 추천을 받는 시간 (분석 클릭은 측정하지 않음)
+        at = new_app("main", user_info=SAMPLE_USER_INFO,
+                     cloth_photo_object=fakes.FakeUpload(fakes.make_fixture_png(), name=f"spec_{i}.png"))
+        at.run()
+        click(at, "AI로 옷 분석 시작하기")
+        # 사용자가 분석 결과를 읽는 동안 미리 생성이 끝난다고 보고 기다립니다.
+        deadline = time.monotonic() + 60
+        while speculation.get_speculator().stats()["in_flight"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return click(at, "AI 코디 추천 및 이미지 생성")
+
+    def batch_flow(i):
+        at = new_app("main", user_info=SAMPLE_USER_INFO, analysis_result=SAMPLE_ANALYSIS)
+        at.run()
+        return click(at, "한 번에 추천받기")
+
+    def closet_flow(i):
+        at = new_app("closet", my_closet=make_closet(closet_size))
+        at.run()
+        # 첫 번째 아이템 삭제 후 다시 그리는 시간까지 측정
+        return click(at, "삭제")
+
+    return {
+        "flow.weather": measure(weather_flow, iterations),
+        "flow.analysis": measure(analysis_flow, iterations),
+        "flow.recommendation": measure(recommendation_flow, iterations),
+        "flow.recommendation_speculated": measure(speculated_recommendation_flow, iterations),
+        "flow.batch_week": measure(batch_flow, iterations),
+        "flow.closet": measure(closet_flow, iterations),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline_path):
+    """이전 결과 파일과 p50/p95 및 처리량을 비교해 출력하는 함수"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n비교 기준: {baseline['meta'].get('git_revision')} ({baseline_path})")
+    print(f"{'항목':<40}{'p50 변화':>12}{'p95 변화':>12}{'처리량 변화':>14}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        deltas = [(result[k] - before[k]) / before[k] * 100 if before[k] else 0.0
+                  for k in ("p50_ms", "p95_ms", "throughput_per_s")]
+        print(f"{name:<40}{deltas[0]:>+11.1f}%{deltas[1]:>+11.1f}%{deltas[2]:>+13.1f}%")
+
+
+def parse_latency(values):
+    latencies = {}
+    for value in values or []:
+        name, _, seconds = value.partition("=")
+        latencies[name] = float(seconds)
+    return latencies
+
+
+def configure_rate_limits(spec):
+    """--rate-limits 값으로 호출 한도를 설정하는 함수 ("off"면 끔, 가짜 서비스는 한도가 없으므로 기본값)"""
+    if not spec or spec.strip().lower() == "off":
+        rate_limit.configure(enabled=False)
+    else:
+        rate_limit.configure(limits=rate_limit.parse_limits(spec))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="옷타쿠 오프라인 벤치마크")
+    parser.add_argument("--iterations", type=int, default=10, help="항목별 반복 횟수")
+    parser.add_argument("--closet-size", type=int, default=24, help="옷장 페이지에 넣을 아이템 수")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=SECONDS",
+                        help=f"주입할 지연 시간 ({', '.join(fakes.LATENCY)})")
+    parser.add_argument("--only", choices=["pure", "pages", "flows"], action="append", help="일부 그룹만 실행")
+    parser.add_argument("--output", help="결과 JSON 경로 (기본값: benchmarks/results/bench_<rev>_<시각>.json)")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON 경로")
+    parser.add_argument("--rate-limits", default="off", metavar="SPEC",
+                        help="적용할 호출 한도 (OTTAKU_RATE_LIMITS 형식, 기본값 off)")
+    args = parser.parse_args(argv)
+
+    # AppTest를 반복 실행할 때 나오는 bare mode/사용 중단 경고는 측정과 무관하므로 숨깁니다.
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    fakes.configure_latency(**parse_latency(args.latency))
+    fakes.install_fakes()
+    fakes.reset_call_counts()
+    configure_rate_limits(args.rate_limits)
+    groups = args.only or ["pure", "pages", "flows"]
+
+    results = {}
+    # 앱이 audio/, saved_outfits/ 등에 쓰는 파일이 저장소를 더럽히지 않도록 임시 디렉터리에서 실행합니다.
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="ottaku_bench_") as workdir:
+        os.chdir(workdir)
+        try:
+            if "pure" in groups:
+                results.update(bench_pure_functions(args.iterations * 10))
+            if "pages" in groups:
+                results.update(bench_pages(args.iterations, args.closet_size))
+            if "flows" in groups:
+                results.update(bench_flows(args.iterations, args.closet_size))
+        finally:
+            os.chdir(original_cwd)
+
+    revision = git_revision()
+    report = {
+        "meta": {
+            "git_revision": revision,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "closet_size": args.closet_size,
+            "injected_latency_s": dict(fakes.LATENCY),
+        },
+        "fake_calls": dict(fakes.CALL_COUNTS),
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{revision}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'항목':<40}{'n':>6}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<40}{r['n']:>6}{r['throughput_per_s']:>10.1f}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+    print(f"\n결과 저장: {output}")
+    if args.compare:
+        compare(report, args.compare)
+    return report
+
+
+if __name__ == "__main__":
+    main()
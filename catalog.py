@@ -0,0 +1,260 @@
+"""상품 카탈로그 덤프(CSV/Parquet)로 만든 오프라인 상품 검색 색인
+
+추천 결과의 검색 키워드를 무신사 검색 링크 대신 실제 상품 목록으로 바로 보여 주기 위한 모듈입니다.
+상품명/브랜드/카테고리/색상을 단어별 글자 2-gram으로 쪼갠 역색인을 NumPy 배열(CSR)로 두고,
+키워드의 2-gram이 충분히 겹치는 상품을 카테고리·색상·가격 조건으로 거른 뒤 상위 k개를 고릅니다.
+
+카탈로그 파일이 바뀌면 행 해시를 비교해 추가/변경된 행만 새 세그먼트로 덧붙이고 지워진 행은 표시만 해 두며,
+지운 행이 많아지면 그때 전체를 다시 만듭니다.
+
+필수 열은 product_id, name이고 brand, category, color, price, url, image_url은 있으면 씁니다.
+
+환경 변수
+    OTTAKU_CATALOG                 카탈로그 파일 경로 (.csv 또는 .parquet, 없으면 검색 링크만 보여 줌)
+    OTTAKU_CATALOG_RELOAD_SECONDS  파일 변경을 확인하는 간격 (기본값 60)
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+CATALOG_PATH = os.environ.get("OTTAKU_CATALOG")
+RELOAD_SECONDS = float(os.environ.get("OTTAKU_CATALOG_RELOAD_SECONDS", "60"))
+
+COLUMNS = ("product_id", "name", "brand", "category", "color", "price", "url", "image_url")
+TEXT_COLUMNS = ("name", "brand", "category", "color")
+# 지운 행이 이 비율을 넘거나 세그먼트가 이만큼 쌓이면 덧붙이지 않고 전체를 다시 만듭니다.
+REBUILD_DEAD_RATIO = 0.25
+MAX_SEGMENTS = 8
+
+_WORD = re.compile(r"[0-9a-z가-힣]+")
+
+
+def _word_grams(word):
+    return (word,) if len(word) == 1 else tuple(word[i:i + 2] for i in range(len(word) - 1))
+
+
+def words(text):
+    return _WORD.findall(unicodedata.normalize("NFKC", str(text)).lower())
+
+
+def grams(text):
+    """텍스트를 단어별 글자 2-gram 집합으로 바꾸는 함수 (한 글자 단어는 그대로)"""
+    return {gram for word in words(text) for gram in _word_grams(word)}
+
+
+def load_catalog(path):
+    """카탈로그 파일을 읽어 COLUMNS 열을 갖춘 DataFrame으로 반환하는 함수"""
+    df = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, dtype={"product_id": str})
+    missing = {"product_id", "name"} - set(df.columns)
+    if missing:
+        raise ValueError(f"카탈로그에 필수 열이 없습니다: {', '.join(sorted(missing))}")
+    for column in COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan if column == "price" else ""
+    df = df[list(COLUMNS)].drop_duplicates("product_id", keep="last").reset_index(drop=True)
+    df["product_id"] = df["product_id"].astype(str)
+    df["price"] = pd.to_numeric(df["price"], errors="coerce")
+    for column in ("name", "brand", "category", "color", "url", "image_url"):
+        df[column] = df[column].fillna("").astype(str)
+    return df
+
+
+class _Segment:
+    """행 구간 하나의 역색인 (2-gram 번호별로 정렬한 행 번호와 시작 위치)"""
+
+    def __init__(self, texts, first_row, vocab):
+        codes, rows = [], []
+        # 카탈로그에는 같은 단어가 계속 나오므로 단어별 2-gram 번호를 한 번만 계산합니다.
+        word_ids = {}
+        for row, text in enumerate(texts, start=first_row):
+            ids = set()
+            for word in words(text):
+                cached = word_ids.get(word)
+                if cached is None:
+                    cached = word_ids[word] = [vocab.setdefault(gram, len(vocab)) for gram in _word_grams(word)]
+                ids.update(cached)
+            codes.extend(ids)
+            rows.extend([row] * len(ids))
+        codes = np.asarray(codes, dtype=np.int32)
+        order = np.argsort(codes, kind="stable")
+        self.rows = np.asarray(rows, dtype=np.int32)[order]
+        self.offsets = np.searchsorted(codes[order], np.arange(len(vocab) + 1)).astype(np.int64)
+
+    def postings(self, gram_id):
+        if gram_id + 1 >= len(self.offsets):
+            return self.rows[:0]
+        return self.rows[self.offsets[gram_id]:self.offsets[gram_id + 1]]
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + self.offsets.nbytes
+
+
+class ProductIndex:
+    """상품 카탈로그 검색 색인 (여러 세션이 함께 쓰므로 검색과 갱신은 잠금 안에서 합니다)"""
+
+    def __init__(self, df=None, path=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._checked = 0.0
+        self.reloads = []
+        self.last_error = None
+        self._build(load_catalog(path) if df is None else df)
+
+    @classmethod
+    def open(cls, path):
+        index = cls(path=path)
+        index._mtime = os.path.getmtime(path)
+        index._checked = time.monotonic()
+        return index
+
+    def _build(self, df):
+        started = time.perf_counter()
+        self._vocab = {}
+        self._labels = {}
+        self._frame = df.reset_index(drop=True)
+        self._segments = [_Segment(self._texts(self._frame), 0, self._vocab)]
+        self._alive = np.ones(len(self._frame), dtype=bool)
+        self._refresh_arrays()
+        self.build_ms = (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    def _texts(frame):
+        texts = frame[TEXT_COLUMNS[0]]
+        for column in TEXT_COLUMNS[1:]:
+            texts = texts + " " + frame[column]
+        return texts.tolist()
+
+    def _codes(self, values):
+        """카테고리/색상 문자열을 정수 코드로 바꾸는 함수 (조건 비교를 문자열 대신 정수로 합니다)"""
+        inverse, uniques = pd.factorize(values)
+        codes = np.array([self._labels.setdefault(u, len(self._labels)) for u in uniques], dtype=np.int32)
+        return codes[inverse] if len(codes) else np.zeros(len(values), dtype=np.int32)
+
+    def _attributes(self, frame):
+        return (self._codes(frame["category"]), self._codes(frame["color"]),
+                frame["price"].to_numpy(dtype=np.float64), frame["name"].str.len().to_numpy(dtype=np.int64))
+
+    def _refresh_arrays(self):
+        frame = self._frame
+        self._category, self._color, self._price, self._name_len = self._attributes(frame)
+        # 살아 있는 상품 번호 → (행 번호, 행 해시). 다음 갱신 때 바뀐 행을 찾는 데 씁니다.
+        self._ids = pd.Index(frame["product_id"].to_numpy())
+        self._id_rows = np.arange(len(frame))
+        self._id_hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+    def __len__(self):
+        return int(self._alive.sum())
+
+    def search(self, keyword, k=5, category=None, color=None, min_price=None, max_price=None, min_score=0.6):
+        """키워드와 2-gram이 min_score 비율 이상 겹치는 상품을 겹친 정도, 짧은 상품명 순으로 k개 반환하는 함수"""
+        query = grams(keyword)
+        if not query:
+            return []
+        need = max(1, int(np.ceil(min_score * len(query))))
+        with self._lock:
+            postings = [segment.postings(self._vocab[g]) for segment in self._segments for g in query
+                        if g in self._vocab]
+            if not postings:
+                return []
+            counts = np.bincount(np.concatenate(postings), minlength=len(self._frame))
+            rows = np.flatnonzero(counts >= need)
+            counts = counts[rows]
+            mask = self._alive[rows]
+            for value, codes in ((category, self._category), (color, self._color)):
+                if value:
+                    if value not in self._labels:
+                        return []
+                    mask &= codes[rows] == self._labels[value]
+            if min_price is not None:
+                mask &= self._price[rows] >= min_price
+            if max_price is not None:
+                mask &= self._price[rows] <= max_price
+            rows, counts = rows[mask], counts[mask]
+            order = np.lexsort((self._name_len[rows], -counts))[:k]
+            rows, counts = rows[order], counts[order]
+            products = self._frame.iloc[rows].to_dict("records")
+        for product, count in zip(products, counts):
+            product["score"] = float(count / len(query))
+            if pd.isna(product["price"]):
+                product["price"] = None
+        return products
+
+    def resolve(self, keywords, k=3, **filters):
+        """추천 키워드 목록을 {키워드: 상위 k개 상품}으로 바꾸는 함수 (중복 키워드는 한 번만 검색)"""
+        return {keyword: self.search(keyword, k, **filters) for keyword in dict.fromkeys(keywords)}
+
+    def apply(self, df):
+        """새 카탈로그 DataFrame과 비교해 바뀐 행만 반영하고 {added, updated, removed} 수를 반환하는 함수"""
+        started = time.perf_counter()
+        with self._lock:
+            new_ids = pd.Index(df["product_id"].to_numpy())
+            new_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+            positions = self._ids.get_indexer(new_ids)
+            known = positions >= 0
+            changed = ~known
+            changed[known] = self._id_hashes[positions[known]] != new_hashes[known]
+            updated = int((changed & known).sum())
+            # 새 카탈로그에 그대로 남은 행만 살리고, 바뀌었거나 빠진 상품의 예전 행은 지운 것으로 표시합니다.
+            kept = np.zeros(len(self._ids), dtype=bool)
+            kept[positions[known & ~changed]] = True
+            removed = len(self._ids) - int(known.sum())
+            self._alive[self._id_rows[~kept]] = False
+            delta = df[changed].reset_index(drop=True)
+            dead = len(self._frame) - int(self._alive.sum())
+            if (dead + len(delta)) / max(1, len(self._frame) + len(delta)) > REBUILD_DEAD_RATIO \
+                    or len(self._segments) >= MAX_SEGMENTS:
+                self._build(df)
+                mode = "rebuild"
+            else:
+                first_row = len(self._frame)
+                rows = np.empty(len(df), dtype=np.int64)
+                rows[~changed] = self._id_rows[positions[~changed]]
+                rows[changed] = np.arange(first_row, first_row + len(delta))
+                self._ids, self._id_rows, self._id_hashes = new_ids, rows, new_hashes
+                if len(delta):
+                    self._segments.append(_Segment(self._texts(delta), first_row, self._vocab))
+                    self._frame = pd.concat([self._frame, delta], ignore_index=True)
+                    self._alive = np.concatenate([self._alive, np.ones(len(delta), dtype=bool)])
+                    self._category, self._color, self._price, self._name_len = (
+                        np.concatenate([old, new]) for old, new in
+                        zip((self._category, self._color, self._price, self._name_len), self._attributes(delta)))
+                mode = "incremental"
+            result = {"mode": mode, "added": int(changed.sum()) - updated, "updated": updated,
+                      "removed": removed, "ms": (time.perf_counter() - started) * 1000}
+            self.reloads.append(result)
+            return result
+
+    def refresh(self, force=False):
+        """RELOAD_SECONDS마다 카탈로그 파일이 바뀌었는지 확인하고 바뀌었으면 반영하는 함수
+
+        파일이 없거나 덮어쓰는 중이라 읽지 못하면 기존 색인을 그대로 쓰고 다음 확인 때 다시 시도합니다.
+        """
+        if not self.path or (not force and time.monotonic() - self._checked < RELOAD_SECONDS):
+            return None
+        self._checked = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.path)
+            if not force and mtime == self._mtime:
+                return None
+            df = load_catalog(self.path)
+        except (OSError, ValueError) as e:
+            # pandas의 ParserError/EmptyDataError와 pyarrow의 ArrowInvalid도 ValueError입니다.
+            self.last_error = f"{type(e).__name__}: {e}"
+            return None
+        self._mtime = mtime
+        self.last_error = None
+        return self.apply(df)
+
+    def stats(self):
+        with self._lock:
+            return {"products": len(self), "rows": len(self._frame), "segments": len(self._segments),
+                    "grams": len(self._vocab), "index_mb": sum(s.nbytes for s in self._segments) / 2 ** 20,
+                    "build_ms": self.build_ms, "reloads": len(self.reloads),
+                    "last_error": self.last_error}
@@ -0,0 +1,273 @@
+"""세션 상태 변경을 기록하는 append-only 이벤트 저널과 스냅샷 기반 복구
+
+세션마다 디렉터리 하나에 JSONL 세그먼트(한 줄에 이벤트 하나)를 덧붙여 쓰고,
+SNAPSHOT_EVERY개의 이벤트마다 그때까지의 상태를 스냅샷으로 압축한 뒤 새 세그먼트로 넘어가며 이전 세그먼트를 지웁니다.
+복구는 최신 스냅샷을 읽고 그 뒤의 이벤트(최대 SNAPSHOT_EVERY개)만 다시 적용하므로 기록이 길어져도 시간이 일정합니다.
+워커가 재시작되거나 새로 배포되어도 같은 세션 키(URL의 sid)로 접속하면 옷장, 분석 기록, 추천 결과가 돌아옵니다.
+옷장 이미지는 호스트 공유 이미지 저장소(/dev/shm, 재부팅하면 비워짐)에 있으므로, 저널 디렉터리의 images/에도
+원본 바이트를 한 벌 보관해 두고 복구할 때 저장소에 없으면 그 사본으로 다시 넣습니다.
+
+환경 변수
+    OTTAKU_JOURNAL_DIR             저널 위치 (기본값 .ottaku_journal, "off"면 기록하지 않음)
+    OTTAKU_JOURNAL_SNAPSHOT_EVERY  스냅샷 간격 (이벤트 수, 기본값 200)
+    OTTAKU_JOURNAL_FSYNC           1이면 이벤트마다 fsync (기본값 0: 프로세스가 죽어도 OS 버퍼는 남음)
+"""
+import copy
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 개발 환경에서는 프로세스 간 잠금 없이 동작합니다.
+    fcntl = None
+
+JOURNAL_DIR = os.environ.get("OTTAKU_JOURNAL_DIR", ".ottaku_journal")
+SNAPSHOT_EVERY = int(os.environ.get("OTTAKU_JOURNAL_SNAPSHOT_EVERY", "200"))
+FSYNC = os.environ.get("OTTAKU_JOURNAL_FSYNC", "0") == "1"
+
+# 저널이 관리하는 세션 상태 키 (그 밖의 화면 상태는 기록하지 않습니다)
+STATE_KEYS = ("user_info", "analysis_result", "user_activity_log", "my_closet", "saved_images",
+              "recommendation_output")
+
+_SEGMENT = re.compile(r"^segment-(\d{12})\.jsonl$")
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def apply(state, kind, data):
+    """이벤트 하나를 상태 딕셔너리에 적용하는 함수 (기록과 복구가 같은 규칙을 씁니다)"""
+    if kind == "user_info_set":
+        state["user_info"] = data["user_info"]
+    elif kind == "analysis_set":
+        state["analysis_result"] = data["analysis"]
+    elif kind == "activity_logged":
+        state.setdefault("user_activity_log", []).append(data["analysis"])
+    elif kind == "closet_added":
+        state.setdefault("my_closet", []).append(data["item"])
+    elif kind == "closet_removed":
+        closet = state.get("my_closet", [])
+        if 0 <= data["index"] < len(closet):
+            closet.pop(data["index"])
+    elif kind == "saved_image_added":
+        state.setdefault("saved_images", []).append(data["url"])
+    elif kind == "saved_image_removed":
+        saved = state.get("saved_images", [])
+        if 0 <= data["index"] < len(saved):
+            saved.pop(data["index"])
+    elif kind == "recommendation_set":
+        state["recommendation_output"] = data["output"]
+    else:
+        raise ValueError(f"알 수 없는 이벤트: {kind}")
+    return state
+
+
+def valid_session_id(session_id):
+    return bool(session_id and _SESSION_ID.match(session_id))
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.f = open(self.path, "a")
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+
+class Journal:
+    """세션 하나의 이벤트 저널 (같은 세션을 연 다른 워커의 기록도 덧붙이기 전에 따라 읽습니다)"""
+
+    def __init__(self, directory, snapshot_every=SNAPSHOT_EVERY, fsync=FSYNC):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._snapshot_path = os.path.join(directory, "snapshot.json")
+        self._lock_path = os.path.join(directory, "lock")
+        self._thread_lock = threading.Lock()
+        self.state = {}
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.replayed = 0
+        self._segment = None
+        self._offset = 0
+        started = time.perf_counter()
+        with self._thread_lock, _FileLock(self._lock_path):
+            self._load()
+        self.restore_ms = (time.perf_counter() - started) * 1000
+        self.replayed_on_restore = self.replayed
+
+    def _segments(self):
+        names = sorted(name for name in os.listdir(self.directory) if _SEGMENT.match(name))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"segment-{first_seq:012d}.jsonl")
+
+    def _load(self):
+        """스냅샷을 읽고 그 뒤의 이벤트를 모든 세그먼트에서 순서대로 다시 적용하는 함수"""
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.state, self.seq = snapshot["state"], snapshot["seq"]
+            self.snapshot_seq = self.seq
+        segments = self._segments()
+        for path in segments:
+            self._segment, self._offset = path, 0
+            self._read_tail()
+        if self._segment is None:
+            self._segment = self._segment_path(self.seq + 1)
+
+    def _read_tail(self):
+        """현재 세그먼트에서 마지막으로 읽은 위치 이후의 완전한 줄만 적용하는 함수"""
+        if not os.path.exists(self._segment):
+            return
+        with open(self._segment, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # 쓰는 도중 끊긴 마지막 줄은 건너뜁니다 (다음 기록이 그 뒤에 이어 쓰지 않도록 잘라 냅니다).
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8").splitlines():
+            event = json.loads(line)
+            if event["seq"] <= self.seq:
+                continue
+            apply(self.state, event["type"], event["data"])
+            self.seq = event["seq"]
+            self.replayed += 1
+        self._offset += len(complete)
+        if len(complete) < len(chunk):
+            with open(self._segment, "r+b") as f:
+                f.truncate(self._offset)
+
+    def _catch_up(self):
+        """다른 워커가 같은 세션에 기록했거나 스냅샷을 만들었으면 그 내용까지 따라 읽는 함수"""
+        segments = self._segments()
+        if segments and self._segment not in segments:
+            # 다른 워커가 스냅샷 후 세그먼트를 교체했습니다. 처음부터 다시 읽습니다.
+            self.state, self.seq, self._segment = {}, 0, None
+            self._load()
+            return
+        self._read_tail()
+        for path in segments:
+            if path > self._segment:
+                self._segment, self._offset = path, 0
+                self._read_tail()
+
+    def append(self, kind, **data):
+        """이벤트를 기록하고 상태에 적용한 뒤 새 일련번호를 반환하는 함수"""
+        with self._thread_lock, _FileLock(self._lock_path):
+            self._catch_up()
+            apply(self.state, kind, copy.deepcopy(data))
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "ts": time.time(), "type": kind, "data": data},
+                              ensure_ascii=False, default=str) + "\n"
+            with open(self._segment, "ab") as f:
+                f.write(line.encode("utf-8"))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                self._offset = f.tell()
+            if self.seq - self.snapshot_seq >= self.snapshot_every:
+                self._snapshot()
+            return self.seq
+
+    def _snapshot(self):
+        """현재 상태를 스냅샷으로 원자적으로 저장하고 새 세그먼트로 넘어간 뒤 이전 세그먼트를 지우는 함수"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".snapshot_")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"seq": self.seq, "ts": time.time(), "state": self.state}, f,
+                          ensure_ascii=False, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._snapshot_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # 스냅샷이 먼저 자리 잡은 뒤에 지우므로, 중간에 멈춰도 복구 시 스냅샷 이전 이벤트는 건너뜁니다.
+        old_segments = self._segments()
+        self.snapshot_seq = self.seq
+        self._segment, self._offset = self._segment_path(self.seq + 1), 0
+        open(self._segment, "ab").close()
+        for path in old_segments:
+            if path != self._segment:
+                os.remove(path)
+
+    def compact(self):
+        """지금까지의 이벤트를 바로 스냅샷으로 압축하는 함수"""
+        with self._thread_lock, _FileLock(self._lock_path):
+            self._catch_up()
+            self._snapshot()
+
+    # --- 옷장 이미지 사본 ---
+
+    def image_path(self, digest):
+        return os.path.join(self.directory, "images", digest)
+
+    def keep_image(self, digest, data):
+        """옷장 이미지 원본을 저널 옆에 보관하는 함수 (이미 있으면 건너뜀)"""
+        target = self.image_path(digest)
+        if os.path.exists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load_image(self, digest):
+        """보관해 둔 옷장 이미지 바이트 (없으면 None)"""
+        try:
+            with open(self.image_path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def drop_image(self, digest):
+        try:
+            os.remove(self.image_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def restored_state(self):
+        """세션 상태에 넣을 수 있도록 복사한 상태 딕셔너리"""
+        with self._thread_lock:
+            return copy.deepcopy({k: v for k, v in self.state.items() if k in STATE_KEYS})
+
+    def stats(self):
+        segments = self._segments()
+        return {"seq": self.seq, "snapshot_seq": self.snapshot_seq, "tail_events": self.seq - self.snapshot_seq,
+                "segments": len(segments), "segment_bytes": sum(os.path.getsize(p) for p in segments),
+                "restore_ms": self.restore_ms, "replayed_on_restore": self.replayed_on_restore}
+
+
+def enabled():
+    return JOURNAL_DIR.lower() != "off"
+
+
+def open_session(session_id, root=None):
+    """세션 키에 해당하는 저널을 여는 함수 (저널이 꺼져 있으면 None)"""
+    if not enabled():
+        return None
+    if not valid_session_id(session_id):
+        raise ValueError(f"잘못된 세션 키: {session_id!r}")
+    return Journal(os.path.join(root or JOURNAL_DIR, session_id))
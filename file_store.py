@@ -0,0 +1,309 @@
+"""audio/, captured_images/, saved_outfits/ 폴더의 파일 수명을 관리하는 저장소
+
+같은 초에 두 번 저장해도 이름이 겹치지 않도록 시각 + 임의 문자열로 파일 이름을 만들고,
+임시 파일에 다 쓴 뒤 이름을 바꿔(원자적 쓰기) 다른 워커가 반쯤 쓰인 파일을 보지 않게 합니다.
+파일마다 주인(세션)과 크기, 마지막 접근 시각을 SQLite 인덱스에 기록하고,
+사용자별/전체 용량 상한을 넘으면 마지막 접근이 오래된 파일부터(LRU) 지웁니다.
+
+백그라운드 정리 스레드는 주기적으로
+    - 쓰다가 멈춘 임시 파일과 인덱스에 없는 파일(예전 버전이 남긴 파일은 주인 없이 인덱스에 편입)
+    - 파일은 지워졌는데 인덱스에 남은 행
+    - 폴더별 보관 기간(AREAS)이 지난 파일
+을 정리합니다.
+
+환경 변수
+    OTTAKU_FILE_ROOT              관리 폴더들의 상위 경로 (기본값: 현재 작업 디렉터리)
+    OTTAKU_FILE_QUOTA_MB          전체 용량 상한 (기본값 1024)
+    OTTAKU_FILE_USER_QUOTA_MB     사용자(세션)별 용량 상한 (기본값 100)
+    OTTAKU_FILE_SWEEP_SECONDS     정리 스레드 실행 간격 (기본값 600, 0이면 끔)
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+FILE_ROOT = os.environ.get("OTTAKU_FILE_ROOT", ".")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("OTTAKU_FILE_QUOTA_MB", "1024")) * 2 ** 20)
+DEFAULT_USER_MAX_BYTES = int(float(os.environ.get("OTTAKU_FILE_USER_QUOTA_MB", "100")) * 2 ** 20)
+SWEEP_SECONDS = float(os.environ.get("OTTAKU_FILE_SWEEP_SECONDS", "600"))
+
+# 관리 폴더 → 마지막 접근 후 보관 기간(초, None이면 용량 상한으로만 지움)
+AREAS = {
+    "audio": 24 * 60 * 60,
+    "captured_images": 7 * 24 * 60 * 60,
+    "saved_outfits": None,
+}
+# 이 시간보다 오래된 임시 파일은 쓰다가 멈춘 것으로 보고 지웁니다.
+TMP_GRACE_SECONDS = 60 * 60
+_TMP_PREFIX = ".tmp_"
+
+
+def unique_name(prefix, ext):
+    """같은 초에 여러 번 불려도 겹치지 않는 파일 이름 (예: saved_20250826_153012_1a2b3c4d.png)"""
+    return f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}{ext}"
+
+
+class FileStore:
+    """관리 폴더의 파일을 주인/마지막 접근 시각과 함께 인덱스에 기록하고 용량을 관리하는 저장소"""
+
+    def __init__(self, root=FILE_ROOT, max_bytes=DEFAULT_MAX_BYTES, user_max_bytes=DEFAULT_USER_MAX_BYTES,
+                 areas=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.user_max_bytes = user_max_bytes
+        self.areas = dict(AREAS if areas is None else areas)
+        self.evicted = {"files": 0, "bytes": 0}
+        self.last_sweep = None
+        self._sweeper = None
+        self._stop = threading.Event()
+        index_dir = os.path.join(self.root, ".ottaku_files")
+        os.makedirs(index_dir, exist_ok=True)
+        self._db_path = os.path.join(index_dir, "index.sqlite")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                area TEXT NOT NULL, name TEXT NOT NULL, owner TEXT, size INTEGER NOT NULL,
+                                created REAL NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (area, name))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_lru ON files (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_owner ON files (owner, last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def directory(self, area):
+        if area not in self.areas:
+            raise ValueError(f"관리하지 않는 폴더입니다: {area}")
+        return os.path.join(self.root, area)
+
+    def _locate(self, path):
+        """파일 경로를 (폴더, 이름)으로 바꾸는 함수 (관리 폴더 밖이면 None)"""
+        area = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        if area not in self.areas or os.path.abspath(os.path.dirname(path)) != os.path.abspath(self.directory(area)):
+            return None
+        return area, os.path.basename(path)
+
+    # --- 쓰기 ---
+
+    def write_with(self, area, ext, writer, owner=None, prefix="file"):
+        """writer(임시 경로)가 파일을 다 쓰면 겹치지 않는 이름으로 바꿔 등록하고 최종 경로를 반환하는 함수"""
+        directory = self.directory(area)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=_TMP_PREFIX, suffix=ext)
+        os.close(fd)
+        try:
+            writer(tmp_path)
+            name = unique_name(prefix, ext)
+            target = os.path.join(directory, name)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                         (area, name, owner, os.path.getsize(target), now, now))
+        self._evict_if_needed(owner, keep=(area, name))
+        return target
+
+    def put_bytes(self, area, data, ext, owner=None, prefix="file"):
+        def write(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        return self.write_with(area, ext, write, owner=owner, prefix=prefix)
+
+    def copy(self, area, source, owner=None, prefix="file"):
+        ext = os.path.splitext(source)[1]
+        return self.write_with(area, ext, lambda path: shutil.copyfile(source, path), owner=owner, prefix=prefix)
+
+    # --- 접근/삭제 ---
+
+    def touch(self, path):
+        """파일을 읽었음을 기록하는 함수 (LRU 순서와 보관 기간의 기준)"""
+        located = self._locate(path)
+        if located:
+            with self._connect() as conn:
+                conn.execute("UPDATE files SET last_access = ? WHERE area = ? AND name = ?", (time.time(), *located))
+
+    def paths(self, area, owner=None):
+        """폴더의 파일 경로 목록 (owner를 주면 그 주인의 파일만, 오래된 순)"""
+        with self._connect() as conn:
+            if owner is None:
+                rows = conn.execute("SELECT name FROM files WHERE area = ? ORDER BY created", (area,)).fetchall()
+            else:
+                rows = conn.execute("SELECT name FROM files WHERE area = ? AND owner = ? ORDER BY created",
+                                    (area, owner)).fetchall()
+        return [os.path.join(self.directory(area), name) for (name,) in rows]
+
+    def delete(self, path):
+        located = self._locate(path)
+        if located:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM files WHERE area = ? AND name = ?", located)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, victims):
+        for area, name, size in victims:
+            try:
+                os.remove(os.path.join(self.directory(area), name))
+            except FileNotFoundError:
+                pass
+            self.evicted["files"] += 1
+            self.evicted["bytes"] += size
+
+    def _evict_if_needed(self, owner=None, keep=None):
+        """주인별 상한, 전체 상한 순으로 넘친 만큼 마지막 접근이 오래된 파일부터 지우는 함수"""
+        victims = []
+        with self._transaction() as conn:
+            limits = [("owner = ?", (owner,), self.user_max_bytes)] if owner is not None else []
+            limits.append(("1", (), self.max_bytes))
+            for where, params, limit in limits:
+                total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM files WHERE {where}", params).fetchone()[0]
+                if total <= limit:
+                    continue
+                candidates = conn.execute(f"SELECT area, name, size FROM files WHERE {where} ORDER BY last_access",
+                                          params).fetchall()
+                for area, name, size in candidates:
+                    if total <= limit:
+                        break
+                    if (area, name) == keep:
+                        continue
+                    conn.execute("DELETE FROM files WHERE area = ? AND name = ?", (area, name))
+                    total -= size
+                    victims.append((area, name, size))
+        self._remove(victims)
+        return victims
+
+    # --- 정리 ---
+
+    def sweep(self):
+        """임시 파일/인덱스 밖 파일/사라진 파일/보관 기간이 지난 파일을 정리하고 처리 수를 반환하는 함수"""
+        now = time.time()
+        result = {"tmp_removed": 0, "adopted": 0, "missing": 0, "expired": 0, "evicted": 0}
+        for area, ttl in self.areas.items():
+            directory = self.directory(area)
+            with self._transaction() as conn:
+                # 폴더는 쓰기 잠금을 잡은 뒤에 읽습니다. 먼저 읽으면 그 사이 저장·등록된 파일이 "사라진 파일"로 지워졌다가
+                # 주인 없이 다시 편입됩니다. 이름만 바꾸고 아직 등록 전인 파일은 편입되더라도 쓰는 쪽의
+                # INSERT OR REPLACE가 주인을 되돌려 놓습니다.
+                on_disk = {}
+                if os.path.isdir(directory):
+                    for entry in os.scandir(directory):
+                        try:
+                            if entry.is_file():
+                                on_disk[entry.name] = entry.stat()
+                        except FileNotFoundError:
+                            # 읽는 사이 이름이 바뀐 임시 파일 등은 다음 정리 때 봅니다.
+                            continue
+                indexed = {name for (name,) in conn.execute("SELECT name FROM files WHERE area = ?", (area,))}
+                for name in indexed - set(on_disk):
+                    conn.execute("DELETE FROM files WHERE area = ? AND name = ?", (area, name))
+                    result["missing"] += 1
+                for name, stat in on_disk.items():
+                    if name in indexed:
+                        continue
+                    if name.startswith(_TMP_PREFIX):
+                        if now - stat.st_mtime > TMP_GRACE_SECONDS:
+                            os.remove(os.path.join(directory, name))
+                            result["tmp_removed"] += 1
+                        continue
+                    # 관리 이전에 만들어진 파일은 주인 없이 편입해 용량 상한과 보관 기간을 똑같이 적용합니다.
+                    conn.execute("INSERT INTO files VALUES (?, ?, NULL, ?, ?, ?)",
+                                 (area, name, stat.st_size, stat.st_mtime, stat.st_mtime))
+                    result["adopted"] += 1
+                expired = []
+                if ttl is not None:
+                    expired = conn.execute("SELECT area, name, size FROM files WHERE area = ? AND last_access < ?",
+                                           (area, now - ttl)).fetchall()
+                    conn.executemany("DELETE FROM files WHERE area = ? AND name = ?",
+                                     [(a, n) for a, n, _ in expired])
+            self._remove(expired)
+            result["expired"] += len(expired)
+        result["evicted"] = len(self._evict_if_needed())
+        self.last_sweep = {"at": now, "ms": (time.time() - now) * 1000, **result}
+        return result
+
+    def start_sweeper(self, interval=SWEEP_SECONDS):
+        """interval초마다 sweep()을 실행하는 데몬 스레드를 시작하는 함수 (이미 실행 중이면 무시)"""
+        if interval <= 0 or (self._sweeper and self._sweeper.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while True:
+                try:
+                    self.sweep()
+                except Exception:
+                    pass
+                if self._stop.wait(interval):
+                    return
+
+        self._sweeper = threading.Thread(target=loop, name="ottaku-file-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    # --- 지표 ---
+
+    def stats(self):
+        """폴더별 파일 수/크기, 상한, 누적 제거량, 디스크 여유 공간을 반환하는 함수"""
+        with self._connect() as conn:
+            rows = conn.execute("""SELECT area, COUNT(*), COALESCE(SUM(size), 0), COUNT(DISTINCT owner),
+                                          MIN(last_access) FROM files GROUP BY area""").fetchall()
+            top_owner = conn.execute("""SELECT COALESCE(SUM(size), 0) FROM files WHERE owner IS NOT NULL
+                                        GROUP BY owner ORDER BY 1 DESC LIMIT 1""").fetchone()
+        by_area = {area: {"area": area, "files": 0, "bytes": 0, "owners": 0, "oldest_access": None}
+                   for area in self.areas}
+        for area, count, size, owners, oldest in rows:
+            by_area[area] = {"area": area, "files": count, "bytes": size, "owners": owners, "oldest_access": oldest}
+        disk = shutil.disk_usage(self.root)
+        return {
+            "areas": list(by_area.values()),
+            "bytes": sum(a["bytes"] for a in by_area.values()),
+            "max_bytes": self.max_bytes,
+            "user_max_bytes": self.user_max_bytes,
+            "largest_user_bytes": top_owner[0] if top_owner else 0,
+            "evicted_files": self.evicted["files"],
+            "evicted_bytes": self.evicted["bytes"],
+            "disk_free_bytes": disk.free,
+            "disk_total_bytes": disk.total,
+            "last_sweep": self.last_sweep,
+        }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_store():
+    """프로세스에서 공유하는 기본 저장소를 반환하는 함수 (처음 부를 때 정리 스레드도 시작합니다)"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FileStore()
+            _default_store.start_sweeper()
+        return _default_store
@@ -0,0 +1,233 @@
+"""의류 사진의 대표 색상 팔레트 추출과 옷장 전체 색상 인덱스
+
+축소한 이미지에서 배경을 제외한 픽셀을 Lab 색공간으로 옮겨 벡터화된 k-means로 군집화하고,
+(Lab, RGB, 비율, 기본 색 이름)으로 이루어진 작은 팔레트를 만듭니다.
+ColorIndex는 옷장 전체 팔레트를 NumPy 배열에 모아 두고 "이 색과 비슷한 아이템" 검색과
+색상 분포 집계를 LLM 호출이나 문자열 그룹핑 없이 배열 연산으로 처리합니다.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+from personal_color import srgb_to_lab
+
+SAMPLE_SIZE = 64
+DEFAULT_K = 4
+KMEANS_ITERATIONS = 12
+# 테두리 색(배경)과 이 거리(ΔE) 안에 있는 픽셀은 배경으로 보고 제외합니다.
+BACKGROUND_DELTA_E = 12.0
+MERGE_DELTA_E = 10.0
+
+# 기본 색 이름표 (sRGB). 팔레트의 각 색은 Lab 거리가 가장 가까운 이름을 받습니다.
+NAMED_COLORS = {
+    "검정": (20, 20, 20), "흰색": (245, 245, 245), "아이보리": (240, 234, 214), "회색": (128, 128, 128),
+    "차콜": (64, 64, 68), "네이비": (31, 42, 84), "파랑": (40, 90, 200), "하늘색": (135, 206, 235),
+    "민트": (152, 222, 200), "초록": (40, 130, 70), "카키": (110, 110, 60), "노랑": (245, 210, 50),
+    "주황": (240, 130, 40), "빨강": (200, 30, 40), "와인": (115, 25, 45), "분홍": (240, 160, 180),
+    "보라": (120, 70, 160), "베이지": (215, 195, 160), "갈색": (120, 75, 40),
+}
+_NAMES = list(NAMED_COLORS)
+_NAMED_LAB = srgb_to_lab(np.array([NAMED_COLORS[n] for n in _NAMES], dtype=np.float32))
+
+
+def _load_pixels(image):
+    """파일 객체/바이트/PIL 이미지를 SAMPLE_SIZE 이하로 축소한 (H, W, 3) RGB 배열로 변환하는 함수"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    img = image if isinstance(image, Image.Image) else Image.open(image)
+    img.draft("RGB", (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+    if img.mode in ("RGBA", "LA", "P"):
+        # 투명 배경은 흰색으로 합성한 뒤 배경 제거 단계에서 걸러냅니다.
+        rgba = img.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, rgba)
+    img = img.convert("RGB")
+    img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+    if hasattr(image, "seek"):
+        image.seek(0)
+    return np.asarray(img)
+
+
+def _foreground(lab_image):
+    """이미지 테두리의 중앙값 색을 배경으로 보고, 그와 다른 픽셀만 (N, 3)으로 반환하는 함수"""
+    border = np.concatenate([lab_image[0], lab_image[-1], lab_image[:, 0], lab_image[:, -1]])
+    background = np.median(border, axis=0)
+    pixels = lab_image.reshape(-1, 3)
+    keep = np.linalg.norm(pixels - background, axis=1) > BACKGROUND_DELTA_E
+    # 옷이 화면을 가득 채워 배경이 거의 없으면 전체 픽셀을 사용합니다.
+    return pixels[keep] if keep.mean() >= 0.15 else pixels
+
+
+def kmeans(points, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """(N, D) 점들을 k개로 군집화해 (중심, 라벨)을 반환하는 벡터화 k-means (k-means++ 초기화)"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(points))
+    centers = np.empty((k, points.shape[1]), dtype=np.float32)
+    centers[0] = points[rng.integers(len(points))]
+    closest = np.sum((points - centers[0]) ** 2, axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        idx = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers[i] = points[idx]
+        closest = np.minimum(closest, np.sum((points - centers[i]) ** 2, axis=1))
+    labels = np.zeros(len(points), dtype=np.intp)
+    for iteration in range(iterations):
+        distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        nonempty = counts > 0
+        centers[nonempty] = sums[nonempty] / counts[nonempty, None]
+    return centers, labels
+
+
+def lab_to_srgb(lab):
+    """(..., 3) Lab 배열을 0~255 sRGB 정수 배열로 변환하는 함수"""
+    lab = np.asarray(lab, dtype=np.float32)
+    fy = (lab[..., 0] + 16.0) / 116.0
+    fx = fy + lab[..., 1] / 500.0
+    fz = fy - lab[..., 2] / 200.0
+    f = np.stack([fx, fy, fz], axis=-1)
+    xyz = np.where(f ** 3 > 0.008856, f ** 3, (f - 16.0 / 116.0) / 7.787) * np.array([0.95047, 1.0, 1.08883])
+    m_inv = np.array([[3.2404542, -1.5371385, -0.4985314],
+                      [-0.9692660, 1.8760108, 0.0415560],
+                      [0.0556434, -0.2040259, 1.0572252]], dtype=np.float32)
+    linear = np.clip(xyz @ m_inv.T, 0, 1)
+    srgb = np.where(linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055)
+    return np.round(np.clip(srgb, 0, 1) * 255).astype(int)
+
+
+def color_name(lab):
+    """Lab 색에 가장 가까운 기본 색 이름을 반환하는 함수"""
+    return _NAMES[int(np.linalg.norm(_NAMED_LAB - np.asarray(lab), axis=1).argmin())]
+
+
+def extract_palette(image, k=DEFAULT_K):
+    """의류 이미지에서 비율이 큰 순서대로 정렬된 대표 색 팔레트(list of dict)를 추출하는 함수"""
+    lab_image = srgb_to_lab(_load_pixels(image))
+    points = _foreground(lab_image).astype(np.float32)
+    centers, labels = kmeans(points, k)
+    weights = np.bincount(labels, minlength=len(centers)) / len(labels)
+    # 음영 차이로 갈라진 거의 같은 색 군집은 비율 가중 평균으로 합칩니다.
+    merged_labs, merged_weights = [], []
+    for i in np.argsort(-weights):
+        if weights[i] <= 0:
+            continue
+        for j, lab in enumerate(merged_labs):
+            if np.linalg.norm(lab - centers[i]) < MERGE_DELTA_E:
+                total = merged_weights[j] + weights[i]
+                merged_labs[j] = (lab * merged_weights[j] + centers[i] * weights[i]) / total
+                merged_weights[j] = total
+                break
+        else:
+            merged_labs.append(centers[i].copy())
+            merged_weights.append(weights[i])
+    rgbs = lab_to_srgb(np.array(merged_labs))
+    palette = []
+    for lab, weight, rgb in zip(merged_labs, merged_weights, rgbs):
+        r, g, b = (int(v) for v in rgb)
+        palette.append({"lab": [round(float(v), 2) for v in lab], "rgb": [r, g, b],
+                        "hex": f"#{r:02x}{g:02x}{b:02x}", "weight": round(float(weight), 4),
+                        "name": color_name(lab)})
+    return palette
+
+
+def hex_to_lab(hex_color):
+    hex_color = hex_color.lstrip("#")
+    rgb = [int(hex_color[i:i + 2], 16) for i in (0, 2, 4)]
+    return srgb_to_lab(np.array(rgb, dtype=np.float32))
+
+
+class ColorIndex:
+    """옷장 전체 팔레트를 배열로 보관하는 최근접 색상 검색 인덱스"""
+
+    def __init__(self, capacity=256):
+        self._labs = np.zeros((capacity, 3), dtype=np.float32)
+        self._weights = np.zeros(capacity, dtype=np.float32)
+        self._owners = np.full(capacity, -1, dtype=np.int64)
+        self._size = 0
+        self._item_ids = []      # owner 번호 -> 아이템 id
+        self._owner_of = {}      # 아이템 id -> owner 번호
+
+    def __len__(self):
+        return len(self._owner_of)
+
+    def __contains__(self, item_id):
+        return item_id in self._owner_of
+
+    def _grow(self, needed):
+        capacity = len(self._weights)
+        if self._size + needed <= capacity:
+            return
+        new_capacity = max(capacity * 2, self._size + needed)
+        self._labs = np.resize(self._labs, (new_capacity, 3))
+        self._weights = np.resize(self._weights, new_capacity)
+        owners = np.full(new_capacity, -1, dtype=np.int64)
+        owners[:self._size] = self._owners[:self._size]
+        self._owners = owners
+
+    def add(self, item_id, palette):
+        """아이템 팔레트를 인덱스에 추가하는 함수 (같은 id가 있으면 교체)"""
+        if item_id in self._owner_of:
+            self.remove(item_id)
+        if not palette:
+            return
+        owner = len(self._item_ids)
+        self._item_ids.append(item_id)
+        self._owner_of[item_id] = owner
+        n = len(palette)
+        self._grow(n)
+        self._labs[self._size:self._size + n] = [c["lab"] for c in palette]
+        self._weights[self._size:self._size + n] = [c["weight"] for c in palette]
+        self._owners[self._size:self._size + n] = owner
+        self._size += n
+
+    def remove(self, item_id):
+        """아이템을 인덱스에서 제거하는 함수 (배열을 압축해 빈 칸을 남기지 않습니다)"""
+        owner = self._owner_of.pop(item_id, None)
+        if owner is None:
+            return
+        keep = self._owners[:self._size] != owner
+        n_keep = int(keep.sum())
+        self._labs[:n_keep] = self._labs[:self._size][keep]
+        self._weights[:n_keep] = self._weights[:self._size][keep]
+        self._owners[:n_keep] = self._owners[:self._size][keep]
+        self._owners[n_keep:self._size] = -1
+        self._size = n_keep
+        self._item_ids[owner] = None
+
+    def query(self, lab, top_k=8, min_weight=0.1, max_delta_e=25.0):
+        """주어진 Lab 색과 가장 가까운 색을 가진 아이템을 [(item_id, ΔE)] 형태로 반환하는 함수"""
+        if self._size == 0:
+            return []
+        labs, weights, owners = self._labs[:self._size], self._weights[:self._size], self._owners[:self._size]
+        distances = np.linalg.norm(labs - np.asarray(lab, dtype=np.float32), axis=1)
+        # 아주 작은 비율의 색(단추, 로고 등)은 매칭에서 제외합니다.
+        distances = np.where(weights >= min_weight, distances, np.inf)
+        best = np.full(len(self._item_ids), np.inf, dtype=np.float32)
+        np.minimum.at(best, owners, distances)
+        order = np.argsort(best)[:top_k]
+        return [(self._item_ids[i], float(best[i])) for i in order if best[i] <= max_delta_e]
+
+    def color_distribution(self):
+        """기본 색 이름별 누적 비율을 {이름: 비율}로 반환하는 함수 (아이템마다 합이 1)"""
+        if self._size == 0:
+            return {}
+        labs, weights = self._labs[:self._size], self._weights[:self._size]
+        distances = np.linalg.norm(labs[:, None, :] - _NAMED_LAB[None, :, :], axis=2)
+        totals = np.bincount(distances.argmin(axis=1), weights=weights, minlength=len(_NAMES))
+        return {_NAMES[i]: float(totals[i]) for i in np.argsort(-totals) if totals[i] > 0}
+
+
+def build_index(items, id_key="image_id"):
+    """palette 키가 있는 아이템 목록으로 ColorIndex를 만드는 함수"""
+    index = ColorIndex(capacity=max(256, len(items) * DEFAULT_K))
+    for item in items:
+        if item.get("palette"):
+            index.add(item[id_key], item["palette"])
+    return index
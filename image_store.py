@@ -0,0 +1,234 @@
+"""호스트 단위로 공유되는 콘텐츠 주소 기반 이미지 저장소
+
+같은 호스트의 여러 Streamlit 워커가 업로드/생성 이미지를 한 벌만 보관하도록
+이미지 바이트를 SHA-256 해시 이름의 파일로 저장하고, 읽을 때는 mmap으로 매핑해 복사 없이 사용합니다.
+참조 수와 마지막 접근 시각은 SQLite 인덱스에 기록되며(프로세스 간 잠금은 SQLite가 처리),
+holder(세션 키)를 넘긴 참조는 주인마다 한 번만 세므로 같은 세션을 여러 번 되살려도 참조 수가 늘지 않습니다.
+용량 상한을 넘으면 참조가 없는 이미지만 LRU 순서로 제거합니다. 옷장에 담긴 이미지는 삭제(release)될 때까지
+지우지 않으므로, 참조 중인 이미지만으로 상한을 넘으면 상한보다 커질 수 있습니다.
+
+환경 변수
+    OTTAKU_IMAGE_STORE_DIR     저장 위치 (기본값: /dev/shm/ottaku_images, 없으면 임시 디렉터리)
+    OTTAKU_IMAGE_STORE_MAX_MB  전체 용량 상한 (기본값: 512)
+"""
+import hashlib
+import io
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("OTTAKU_IMAGE_STORE_MAX_MB", "512")) * 2 ** 20)
+
+
+def _default_root():
+    configured = os.environ.get("OTTAKU_IMAGE_STORE_DIR")
+    if configured:
+        return configured
+    base = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, "ottaku_images")
+
+
+class ImageStore:
+    """콘텐츠 해시로 이미지를 저장하고 참조 수로 수명을 관리하는 저장소"""
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or _default_root()
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        self._db_path = os.path.join(self.root, "index.sqlite")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                                digest TEXT PRIMARY KEY, size INTEGER NOT NULL, refcount INTEGER NOT NULL DEFAULT 0,
+                                last_access REAL NOT NULL, parent TEXT)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS blobs_lru ON blobs (refcount, last_access)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS holders (
+                                digest TEXT NOT NULL, holder TEXT NOT NULL, PRIMARY KEY (digest, holder))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS thumbnails (
+                                source TEXT NOT NULL, max_size INTEGER NOT NULL, digest TEXT NOT NULL,
+                                PRIMARY KEY (source, max_size))""")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def path(self, digest):
+        """해시에 해당하는 파일 경로 (st.image에 그대로 전달할 수 있습니다)"""
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def contains(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def _write_blob(self, digest, data):
+        target = self.path(digest)
+        if os.path.exists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # 다른 워커가 읽는 도중 반쯤 쓰인 파일을 보지 않도록 임시 파일에 쓴 뒤 이름을 바꿉니다.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put(self, data, parent=None, acquire=True, holder=None):
+        """이미지 바이트를 저장하고 해시를 반환하는 함수. 기본적으로 참조 수를 1 올립니다 (holder는 acquire() 참고)."""
+        data = bytes(data) if not isinstance(data, bytes) else data
+        digest = hashlib.sha256(data).hexdigest()
+        with self._transaction() as conn:
+            # 제거(_evict_if_needed)도 같은 쓰기 잠금 안에서 파일을 지우므로, 잠금을 쥔 채 파일을 확인하고 써야
+            # 다른 워커가 행과 파일을 지운 직후에 파일 없는 참조 행을 남기지 않습니다.
+            self._write_blob(digest, data)
+            conn.execute("""INSERT INTO blobs (digest, size, refcount, last_access, parent) VALUES (?, ?, 0, ?, ?)
+                            ON CONFLICT(digest) DO UPDATE SET last_access = excluded.last_access""",
+                         (digest, len(data), time.time(), parent))
+            if acquire:
+                self._acquire(conn, digest, holder)
+        self._evict_if_needed()
+        return digest
+
+    @staticmethod
+    def _acquire(conn, digest, holder):
+        if holder is not None and not conn.execute("INSERT OR IGNORE INTO holders (digest, holder) VALUES (?, ?)",
+                                                   (digest, holder)).rowcount:
+            conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), digest))
+            return
+        conn.execute("UPDATE blobs SET refcount = refcount + 1, last_access = ? WHERE digest = ?",
+                     (time.time(), digest))
+
+    def acquire(self, digest, holder=None):
+        """이미 저장된 이미지의 참조 수를 1 올리는 함수 (다른 세션이 같은 이미지를 쓰게 될 때)
+
+        holder를 넘기면 그 주인이 아직 참조하지 않은 이미지일 때만 올립니다 (세션을 다시 열 때 중복 방지).
+        """
+        with self._transaction() as conn:
+            self._acquire(conn, digest, holder)
+
+    def release(self, digest, holder=None):
+        """참조 수를 1 내리는 함수. 0이 되어도 바로 지우지 않고 용량이 필요할 때 제거합니다."""
+        with self._transaction() as conn:
+            if holder is not None and not conn.execute("DELETE FROM holders WHERE digest = ? AND holder = ?",
+                                                       (digest, holder)).rowcount:
+                return
+            conn.execute("UPDATE blobs SET refcount = MAX(refcount - 1, 0) WHERE digest = ?", (digest,))
+            # 원본이 더 이상 쓰이지 않으면 그로부터 만든 썸네일도 함께 놓아줍니다.
+            conn.execute("""UPDATE blobs SET refcount = 0 WHERE parent = ?
+                            AND (SELECT refcount FROM blobs WHERE digest = ?) = 0""", (digest, digest))
+
+    def _touch(self, digest):
+        with self._connect() as conn:
+            conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (time.time(), digest))
+
+    @contextmanager
+    def open_buffer(self, digest):
+        """이미지 파일을 읽기 전용 mmap으로 여는 컨텍스트 매니저 (페이지 캐시를 워커 간에 공유)"""
+        with open(self.path(digest), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+        self._touch(digest)
+
+    def get_bytes(self, digest):
+        """이미지 바이트 복사본을 반환하는 함수 (가능하면 path()나 open_buffer()를 사용하세요)"""
+        with self.open_buffer(digest) as mapped:
+            return mapped[:]
+
+    def cached_thumbnail(self, digest, max_size=256):
+        """이미 만들어 둔 썸네일의 해시를 반환하는 함수 (없으면 None)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT digest FROM thumbnails WHERE source = ? AND max_size = ?",
+                               (digest, max_size)).fetchone()
+        if row and self.contains(row[0]):
+            self._touch(row[0])
+            return row[0]
+        return None
+
+    def thumbnail(self, digest, max_size=256):
+        """원본을 mmap에서 바로 디코딩해 썸네일을 만들고, 결과도 저장소에 캐시한 뒤 그 해시를 반환하는 함수"""
+        cached = self.cached_thumbnail(digest, max_size)
+        if cached:
+            return cached
+        with self.open_buffer(digest) as mapped:
+            img = Image.open(mapped)
+            img.thumbnail((max_size, max_size))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG" if img.mode == "RGBA" else "JPEG", quality=85)
+        thumb_digest = self.put(buffer.getvalue(), parent=digest, acquire=False)
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO thumbnails (source, max_size, digest) VALUES (?, ?, ?)",
+                         (digest, max_size, thumb_digest))
+        return thumb_digest
+
+    def _evict_if_needed(self):
+        with self._transaction() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return []
+            # 참조 중인 이미지는 옷장 화면이 여전히 쓰므로 오래 열어 보지 않았더라도 지우지 않습니다.
+            candidates = conn.execute("""SELECT digest, size FROM blobs WHERE refcount = 0
+                                         ORDER BY last_access""").fetchall()
+            evicted = []
+            for digest, size in candidates:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                conn.execute("DELETE FROM holders WHERE digest = ?", (digest,))
+                conn.execute("DELETE FROM thumbnails WHERE source = ? OR digest = ?", (digest, digest))
+                total -= size
+                evicted.append(digest)
+            # 커밋 전에 파일까지 지워야 그 사이 put()이 "이미 있는 파일"로 보고 쓰기를 건너뛰지 않습니다.
+            for digest in evicted:
+                try:
+                    os.remove(self.path(digest))
+                except FileNotFoundError:
+                    pass
+        return evicted
+
+    def stats(self):
+        """저장된 이미지 수, 전체 크기, 참조 중인 이미지 수를 반환하는 함수"""
+        with self._connect() as conn:
+            count, total, referenced = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount > 0), 0) FROM blobs").fetchone()
+        return {"images": count, "bytes": total, "referenced": referenced, "max_bytes": self.max_bytes}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_store():
+    """프로세스에서 공유하는 기본 저장소를 반환하는 함수"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ImageStore()
+        return _default_store
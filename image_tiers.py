@@ -0,0 +1,127 @@
+"""코디 이미지 생성 품질 단계(미리보기/전체 해상도) 정의와 옷장 썸네일 콜라주
+
+추천 화면에는 먼저 싸고 빠른 미리보기 단계로 이미지를 만들고,
+사용자가 저장하거나 크게 볼 때만 전체 해상도 단계로 다시 생성합니다.
+미리보기 단계를 collage로 두면 API를 호출하지 않고 옷장 썸네일을 이어 붙인 이미지를 보여 줍니다.
+
+환경 변수
+    OTTAKU_IMAGE_PREVIEW_TIER  추천 직후 보여 줄 단계 (기본값 preview, full이면 예전처럼 바로 고화질)
+    OTTAKU_IMAGE_FULL_TIER     저장/크게 보기에 쓸 단계 (기본값 full)
+    OTTAKU_IMAGE_TIERS         단계 재정의 "이름=모델/크기[/품질]"을 쉼표로 나열.
+                               예: "preview=dall-e-2/256x256,full=dall-e-3/1024x1024/hd"
+"""
+import io
+import os
+
+from PIL import Image, ImageOps
+
+LOCAL_MODEL = "local"
+
+# OpenAI 이미지 생성 단가 (USD, 이미지 1장). 추세 비교용 추정치입니다.
+PRICES = {
+    ("dall-e-2", "256x256", None): 0.016,
+    ("dall-e-2", "512x512", None): 0.018,
+    ("dall-e-2", "1024x1024", None): 0.020,
+    ("dall-e-3", "1024x1024", "standard"): 0.040,
+    ("dall-e-3", "1024x1792", "standard"): 0.080,
+    ("dall-e-3", "1792x1024", "standard"): 0.080,
+    ("dall-e-3", "1024x1024", "hd"): 0.080,
+    ("dall-e-3", "1024x1792", "hd"): 0.120,
+    ("dall-e-3", "1792x1024", "hd"): 0.120,
+}
+
+
+class Tier:
+    """이미지 생성 단계 하나 (모델, 크기, 품질)"""
+
+    def __init__(self, name, model, size, quality=None, label=None):
+        self.name = name
+        self.model = model
+        self.size = size
+        self.quality = quality
+        self.label = label or name
+
+    @property
+    def local(self):
+        return self.model == LOCAL_MODEL
+
+    @property
+    def price(self):
+        return 0.0 if self.local else PRICES.get((self.model, self.size, self.quality), 0.0)
+
+    @property
+    def pixels(self):
+        width, _, height = self.size.partition("x")
+        return int(width), int(height)
+
+    def request_kwargs(self):
+        """openai images.generate에 넘길 인자 (dall-e-2는 quality를 받지 않습니다)"""
+        kwargs = {"model": self.model, "size": self.size, "n": 1}
+        if self.quality:
+            kwargs["quality"] = self.quality
+        return kwargs
+
+    def to_dict(self):
+        return {"tier": self.name, "model": self.model, "size": self.size, "quality": self.quality,
+                "price_usd": self.price}
+
+
+DEFAULT_TIERS = {
+    "collage": Tier("collage", LOCAL_MODEL, "512x512", label="옷장 콜라주"),
+    "preview": Tier("preview", "dall-e-2", "512x512", label="미리보기"),
+    "full": Tier("full", "dall-e-3", "1024x1024", "standard", label="고화질"),
+    "hd": Tier("hd", "dall-e-3", "1024x1024", "hd", label="최고화질"),
+}
+
+
+def parse_tiers(spec):
+    """OTTAKU_IMAGE_TIERS 형식 문자열로 기본 단계를 재정의한 {이름: Tier}를 반환하는 함수"""
+    tiers = dict(DEFAULT_TIERS)
+    for entry in (spec or "").split(","):
+        if "=" not in entry:
+            continue
+        name, value = entry.strip().split("=", 1)
+        model, size, *quality = value.split("/")
+        label = tiers[name].label if name in tiers else name
+        tiers[name] = Tier(name, model, size, quality[0] if quality else None, label)
+    return tiers
+
+
+TIERS = parse_tiers(os.environ.get("OTTAKU_IMAGE_TIERS"))
+PREVIEW_TIER = os.environ.get("OTTAKU_IMAGE_PREVIEW_TIER", "preview")
+FULL_TIER = os.environ.get("OTTAKU_IMAGE_FULL_TIER", "full")
+
+
+def get(name=None):
+    """이름에 해당하는 단계를 반환하는 함수 (없는 이름이면 전체 해상도 단계)"""
+    return TIERS.get(name or FULL_TIER) or TIERS.get(FULL_TIER) or DEFAULT_TIERS["full"]
+
+
+def needs_upgrade(name):
+    """저장/크게 보기 전에 전체 해상도로 다시 만들어야 하는 단계인지 판별하는 함수"""
+    return get(name).name != get(FULL_TIER).name
+
+
+def collage(images, size=512, background=(255, 255, 255)):
+    """이미지(경로/바이트/PIL) 여러 장을 정사각형 격자로 이어 붙인 PNG 바이트를 반환하는 함수"""
+    images = list(images)[:4]
+    if not images:
+        raise ValueError("콜라주에 쓸 이미지가 없습니다.")
+    columns = 1 if len(images) == 1 else 2
+    rows = -(-len(images) // columns)
+    cell = size // columns
+    canvas = Image.new("RGB", (size, size), background)
+    top = (size - rows * cell) // 2
+    for i, image in enumerate(images):
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+        img = image if isinstance(image, Image.Image) else Image.open(image)
+        img.draft("RGB", (cell, cell))
+        tile = ImageOps.pad(img.convert("RGB"), (cell, cell), color=background)
+        row, col = divmod(i, columns)
+        # 마지막 줄이 한 장뿐이면 가운데에 둡니다.
+        left = (size - cell) // 2 if row == rows - 1 and len(images) % columns else col * cell
+        canvas.paste(tile, (left, top + row * cell))
+    buffer = io.BytesIO()
+    canvas.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,235 @@
+"""이미지 디코딩/색상 추출/임베딩/썸네일 같은 CPU 작업을 별도 프로세스에서 처리하는 이미지 작업 서비스
+
+Streamlit은 모든 세션의 스크립트를 한 프로세스의 스레드로 실행하므로, 한 사용자의 사진 디코딩과
+NumPy 계산이 GIL을 잡고 있는 동안 다른 세션의 화면 그리기가 멈춥니다. 그래서 이런 작업은
+ProcessPoolExecutor 작업자에게 넘기고 스크립트 스레드는 Future만 들고 있다가 필요할 때 결과를 받습니다.
+
+이미지 바이트는 피클로 복사해 보내지 않습니다.
+    - 공유 저장소(image_store)에 있는 이미지는 해시만 넘기고, 작업자가 /dev/shm의 파일을 mmap으로 엽니다.
+    - 아직 저장소에 없는 업로드 사진은 공유 메모리(multiprocessing.shared_memory) 블록에 한 번 복사해
+      이름만 넘기고, 작업이 끝나면 부모 프로세스가 블록을 지웁니다.
+같은 이미지와 같은 작업은 최근 Future를 다시 돌려주므로, 업로드 직후 미리 시작한 작업을 분석/옷장 추가가 이어받습니다.
+
+환경 변수
+    OTTAKU_IMAGE_WORKERS  작업자 프로세스 수 (기본값: CPU 수 - 1, 최대 4). 0이면 호출한 스레드에서 바로 처리합니다.
+"""
+import hashlib
+import io
+import mmap
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import garment_color
+import image_store
+import personal_color
+import similarity
+
+WORKERS = int(os.environ.get("OTTAKU_IMAGE_WORKERS", str(min(4, (os.cpu_count() or 1) - 1))))
+# 같은 작업을 다시 요청하면 재사용할 최근 Future 수
+RECENT_FUTURES = 256
+
+# 작업 이름 → 이미지 파일 객체를 받는 함수 (작업자에는 함수 대신 이름을 넘깁니다)
+OPERATIONS = {
+    "palette": garment_color.extract_palette,
+    "embed": similarity.embed,
+    "personal_color": personal_color.analyze,
+}
+
+
+# --- 작업자 프로세스에서 실행되는 함수 ---
+
+_worker_stores = {}
+
+
+def _store(root):
+    if root not in _worker_stores:
+        _worker_stores[root] = image_store.ImageStore(root)
+    return _worker_stores[root]
+
+
+def _open_source(source):
+    """작업에 넘긴 이미지 위치를 파일 객체로 여는 함수 (mmap/공유 메모리는 닫는 함수와 함께 반환)"""
+    kind, value = source[0], source[1]
+    if kind == "path":
+        with open(value, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped, mapped.close
+    if kind == "shm":
+        # 작업자는 부모 프로세스의 자원 추적기를 함께 쓰므로 블록 등록/해제는 부모의 unlink()가 맡습니다.
+        block = shared_memory.SharedMemory(name=value)
+        data = io.BytesIO(block.buf[:source[2]])
+        block.close()
+        return data, data.close
+    raise ValueError(f"알 수 없는 이미지 위치입니다: {kind}")
+
+
+def _run_on_image(operation, source, *args):
+    image, close = _open_source(source)
+    try:
+        return OPERATIONS[operation](image, *args)
+    finally:
+        close()
+
+
+def _thumbnail(root, digest, max_size):
+    return _store(root).thumbnail(digest, max_size)
+
+
+# --- 부모 프로세스 쪽 서비스 ---
+
+def _completed(value=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
+    return future
+
+
+class ImageService:
+    """이미지 CPU 작업을 작업자 프로세스에 맡기고 Future로 결과를 돌려주는 서비스 (workers가 0이면 바로 처리)"""
+
+    def __init__(self, workers=WORKERS, store=None):
+        self.workers = workers
+        self.store = store or image_store.get_store()
+        self._pool = None
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self.metrics = {"submitted": 0, "reused": 0, "inline": 0, "failed": 0, "restarts": 0, "shm_bytes": 0}
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # 여러 스레드가 도는 Streamlit 프로세스를 fork하지 않도록 forkserver(없으면 spawn)로 작업자를 띄웁니다.
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def _submit(self, func, *args):
+        if self.workers <= 0:
+            with self._lock:
+                self.metrics["inline"] += 1
+            try:
+                return _completed(func(*args))
+            except Exception as e:
+                return _completed(error=e)
+        try:
+            return self._executor().submit(func, *args)
+        except BrokenProcessPool:
+            # 작업자가 비정상 종료되었으면 풀을 새로 만들어 한 번 더 시도합니다.
+            with self._lock:
+                self._pool = None
+                self.metrics["restarts"] += 1
+            return self._executor().submit(func, *args)
+
+    def _remember(self, key, factory, reuse_done=True):
+        """같은 키의 최근 Future가 있으면 돌려주고, 없으면 factory()로 만들어 보관하는 함수
+
+        reuse_done이 False면 아직 실행 중인 Future만 나눠 쓰고, 끝난 것은 다시 만듭니다.
+        """
+        with self._lock:
+            future = self._recent.get(key)
+            if future is not None and future.done() and (not reuse_done or future.exception() is not None):
+                future = None
+            if future is not None:
+                self._recent.move_to_end(key)
+                self.metrics["reused"] += 1
+                return future
+        future = factory()
+        future.add_done_callback(self._count_failure)
+        with self._lock:
+            self.metrics["submitted"] += 1
+            self._recent[key] = future
+            while len(self._recent) > RECENT_FUTURES:
+                self._recent.popitem(last=False)
+        return future
+
+    def _count_failure(self, future):
+        if future.exception() is not None:
+            with self._lock:
+                self.metrics["failed"] += 1
+
+    def _submit_bytes(self, operation, data, args):
+        """업로드 바이트를 공유 메모리 블록에 한 번 복사해 작업자에 넘기는 함수 (작업이 끝나면 블록을 지움)"""
+        if self.workers <= 0:
+            return self._submit(OPERATIONS[operation], io.BytesIO(data), *args)
+        block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        block.buf[:len(data)] = data
+
+        def release(_future=None):
+            block.close()
+            block.unlink()
+        try:
+            future = self._submit(_run_on_image, operation, ("shm", block.name, len(data)), *args)
+        except BaseException:
+            release()
+            raise
+        with self._lock:
+            self.metrics["shm_bytes"] += len(data)
+        future.add_done_callback(release)
+        return future
+
+    def submit(self, operation, image, *args):
+        """OPERATIONS의 operation을 image(파일 경로/저장소 해시/바이트/업로드 파일)에 실행하는 Future를 반환하는 함수"""
+        if operation not in OPERATIONS:
+            raise ValueError(f"알 수 없는 이미지 작업입니다: {operation}")
+        if isinstance(image, str):
+            path = image if os.path.exists(image) else self.store.path(image)
+            if not os.path.exists(path):
+                return _completed(error=FileNotFoundError(image))
+            # 저장소 파일 이름은 내용의 SHA-256이므로 같은 사진의 업로드 바이트와 같은 키를 씁니다.
+            digest = os.path.basename(path)
+            key = digest if self.store.path(digest) == path else f"{os.path.abspath(path)}:{os.path.getmtime(path)}"
+            return self._remember((operation, key, args),
+                                  lambda: self._submit(_run_on_image, operation, ("path", path), *args))
+        data = image.getvalue() if hasattr(image, "getvalue") else bytes(image)
+        key = hashlib.sha256(data).hexdigest()
+        return self._remember((operation, key, args), lambda: self._submit_bytes(operation, data, args))
+
+    def palette(self, image):
+        return self.submit("palette", image)
+
+    def embed(self, image):
+        return self.submit("embed", image)
+
+    def personal_color(self, image):
+        return self.submit("personal_color", image)
+
+    def thumbnail(self, digest, max_size=256):
+        """저장소 이미지의 썸네일 해시를 돌려주는 Future (이미 만든 썸네일이면 작업자를 거치지 않음)"""
+        cached = self.store.cached_thumbnail(digest, max_size)
+        if cached:
+            return _completed(cached)
+        # 끝난 결과는 저장소가 용량 때문에 지웠을 수 있으므로 cached_thumbnail()로만 재사용합니다.
+        return self._remember(("thumbnail", digest, max_size),
+                              lambda: self._submit(_thumbnail, self.store.root, digest, max_size), reuse_done=False)
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, "workers": self.workers,
+                    "pending": sum(not future.done() for future in self._recent.values())}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+def get_service():
+    """프로세스에서 공유하는 기본 이미지 작업 서비스를 반환하는 함수"""
+    global _default_service
+    with _default_service_lock:
+        if _default_service is None:
+            _default_service = ImageService()
+        return _default_service
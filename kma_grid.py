@@ -0,0 +1,158 @@
+"""위경도를 기상청 단기예보 격자(nx, ny)로 바꾸는 변환기와 오프라인 지명 사전
+
+기상청 동네예보 격자는 람베르트 정각원추도법(표준위도 30°/60°, 기준점 38°N 126°E, 5km 간격)을 씁니다.
+변환 함수는 NumPy 배열을 그대로 받아 매장 목록이나 사용자 주소 수천 개를 한 번에 변환합니다.
+bucket_by_cell()로 좌표들을 같은 격자 칸끼리 묶으면, 가까운 사용자들은 같은 칸의 예보 하나를 함께 씁니다.
+
+지명 사전은 "이름,시도,위도,경도" 형식의 CSV 파일이며, 입력한 주소에서 가장 구체적인 지명을 찾습니다.
+
+환경 변수
+    OTTAKU_GAZETTEER  지명 사전 CSV 경로 (기본값 data/gazetteer_kr.csv)
+"""
+import csv
+import os
+
+import numpy as np
+
+GAZETTEER_PATH = os.environ.get("OTTAKU_GAZETTEER", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  "data", "gazetteer_kr.csv"))
+
+# 기상청 격자 상수 (단기예보 조회서비스 활용 가이드)
+EARTH_RADIUS_KM = 6371.00877
+GRID_KM = 5.0
+SLAT1, SLAT2 = 30.0, 60.0
+OLON, OLAT = 126.0, 38.0
+XO, YO = 43, 136
+
+_DEGRAD = np.pi / 180.0
+_RE = EARTH_RADIUS_KM / GRID_KM
+_SLAT1, _SLAT2 = SLAT1 * _DEGRAD, SLAT2 * _DEGRAD
+_OLON, _OLAT = OLON * _DEGRAD, OLAT * _DEGRAD
+_SN = np.log(np.cos(_SLAT1) / np.cos(_SLAT2)) / np.log(
+    np.tan(np.pi * 0.25 + _SLAT2 * 0.5) / np.tan(np.pi * 0.25 + _SLAT1 * 0.5))
+_SF = np.tan(np.pi * 0.25 + _SLAT1 * 0.5) ** _SN * np.cos(_SLAT1) / _SN
+_RO = _RE * _SF / np.tan(np.pi * 0.25 + _OLAT * 0.5) ** _SN
+
+
+def to_grid(lat, lon):
+    """위도/경도(스칼라 또는 배열)를 격자 (nx, ny)로 변환하는 함수 (입력이 스칼라면 int 두 개를 반환)"""
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    ra = _RE * _SF / np.tan(np.pi * 0.25 + lat * _DEGRAD * 0.5) ** _SN
+    theta = lon * _DEGRAD - _OLON
+    theta = (theta + np.pi) % (2 * np.pi) - np.pi
+    theta *= _SN
+    nx = np.floor(ra * np.sin(theta) + XO + 0.5).astype(np.int32)
+    ny = np.floor(_RO - ra * np.cos(theta) + YO + 0.5).astype(np.int32)
+    if nx.ndim == 0:
+        return int(nx), int(ny)
+    return nx, ny
+
+
+def to_latlon(nx, ny):
+    """격자 (nx, ny)를 칸 중심의 위도/경도로 되돌리는 함수"""
+    xn = np.asarray(nx, dtype=np.float64) - XO
+    yn = _RO - np.asarray(ny, dtype=np.float64) + YO
+    ra = np.hypot(xn, yn)
+    if _SN < 0:
+        ra = -ra
+    lat = 2.0 * np.arctan((_RE * _SF / ra) ** (1.0 / _SN)) - np.pi * 0.5
+    lon = np.arctan2(xn, yn) / _SN + _OLON
+    lat, lon = lat / _DEGRAD, lon / _DEGRAD
+    if lat.ndim == 0:
+        return float(lat), float(lon)
+    return lat, lon
+
+
+def bucket_by_cell(lat, lon):
+    """좌표 배열을 격자 칸별로 묶어 {(nx, ny): 입력 순번 배열}을 반환하는 함수"""
+    nx, ny = to_grid(np.atleast_1d(lat), np.atleast_1d(lon))
+    keys = nx.astype(np.int64) * 1000 + ny
+    cells, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+    return {(int(key // 1000), int(key % 1000)): group for key, group in zip(cells, groups)}
+
+
+# 주소에 흔히 쓰는 시도 이름의 긴 형태 → 사전의 짧은 이름
+REGION_ALIASES = {
+    "서울특별시": "서울", "서울시": "서울", "부산광역시": "부산", "부산시": "부산", "대구광역시": "대구", "대구시": "대구",
+    "인천광역시": "인천", "인천시": "인천", "광주광역시": "광주", "대전광역시": "대전", "대전시": "대전",
+    "울산광역시": "울산", "울산시": "울산", "세종특별자치시": "세종", "세종시": "세종", "경기도": "경기",
+    "강원도": "강원", "강원특별자치도": "강원", "충청북도": "충북", "충청남도": "충남", "전라북도": "전북",
+    "전북특별자치도": "전북", "전라남도": "전남", "경상북도": "경북", "경상남도": "경남", "제주도": "제주",
+    "제주특별자치도": "제주",
+}
+_SUFFIXES = ("특별자치시", "특별자치도", "광역시", "특별시", "시", "군", "구")
+
+
+class Place:
+    """지명 사전의 항목 하나 (또는 브라우저 위치처럼 이름 붙인 좌표)"""
+
+    def __init__(self, name, region, lat, lon):
+        self.name = name
+        self.region = region
+        self.lat = float(lat)
+        self.lon = float(lon)
+
+    @property
+    def label(self):
+        return self.name if self.name == self.region else f"{self.region} {self.name}"
+
+    @property
+    def grid(self):
+        return to_grid(self.lat, self.lon)
+
+
+def _stem(name):
+    for suffix in _SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix) + 1:
+            return name[:-len(suffix)]
+    return name
+
+
+class Gazetteer:
+    """오프라인 지명 사전 (주소 검색과 좌표에서 가장 가까운 지명 찾기)"""
+
+    def __init__(self, places):
+        self.places = list(places)
+        self._by_stem = {}
+        for place in self.places:
+            self._by_stem.setdefault(_stem(place.name), []).append(place)
+        self._lat = np.array([p.lat for p in self.places])
+        self._lon = np.array([p.lon for p in self.places])
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls(Place(row["name"], row["region"], row["lat"], row["lon"]) for row in csv.DictReader(f))
+
+    def regions(self):
+        """시도 대표 지명 (이름과 시도가 같은 항목) 목록"""
+        return [place for place in self.places if place.name == place.region]
+
+    def get(self, name):
+        for place in self._by_stem.get(_stem(REGION_ALIASES.get(name, name)), []):
+            if place.name == place.region or place.label == name:
+                return place
+        return None
+
+    def search(self, address):
+        """주소 문자열에서 가장 구체적인 지명을 찾는 함수 (시도가 함께 적혀 있으면 그 시도의 지명을 우선)"""
+        tokens = [REGION_ALIASES.get(token, token) for token in address.replace(",", " ").split()]
+        regions = {token for token in tokens if token in REGION_ALIASES.values()}
+        best, best_score = None, None
+        for position, token in enumerate(tokens):
+            for place in self._by_stem.get(_stem(token), []):
+                # 시도가 맞는 항목 > 시도 대표가 아닌 구체적인 지명 > 주소 뒤쪽에 나온 지명 순으로 고릅니다.
+                score = (not regions or place.region in regions, place.name != place.region, position)
+                if best_score is None or score > best_score:
+                    best, best_score = place, score
+        return best
+
+    def nearest(self, lat, lon):
+        """좌표에서 가장 가까운 지명 (시도 대표보다 시군구 지명을 우선)"""
+        scale = np.cos(np.radians(lat))
+        distance = (self._lat - lat) ** 2 + ((self._lon - lon) * scale) ** 2
+        specific = np.array([p.name != p.region for p in self.places])
+        distance = np.where(specific, distance, distance + 1e-4)
+        return self.places[int(np.argmin(distance))]
@@ -0,0 +1,190 @@
+"""NumPy 기반 로컬 퍼스널 컬러 사전 분류기
+
+정면 얼굴 사진에서 피부/머리카락/눈 영역을 추정해 Lab 색공간으로 변환한 뒤,
+언더톤(피부 색상각)과 명도 대비를 계산해 계절 타입을 판정합니다.
+판정 여유가 충분하면 수 밀리초 안에 결과를 돌려주고, 애매하면 "uncertain"을 반환해
+그 경우에만 Gemini 비전 모델을 호출하도록 합니다.
+"""
+import re
+
+import numpy as np
+from PIL import Image
+
+SEASONS = ["봄 웜톤", "여름 쿨톤", "가을 웜톤", "겨울 쿨톤"]
+UNCERTAIN = "uncertain"
+
+# 판정 기준값. 피부 색상각(h = atan2(b*, a*))이 클수록 노란 기(웜), 작을수록 붉은/핑크 기(쿨)입니다.
+WARM_HUE_THRESHOLD = 58.0
+HUE_MARGIN = 4.0
+# 피부와 머리카락/눈동자의 명도(L*) 차이. 클수록 선명한 대비(겨울/가을), 작을수록 부드러운 대비(봄/여름)입니다.
+CONTRAST_THRESHOLD = 45.0
+CONTRAST_MARGIN = 6.0
+MIN_CONFIDENCE = 0.35
+MIN_SKIN_PIXELS = 400
+ANALYSIS_SIZE = 256
+
+
+def srgb_to_lab(rgb):
+    """(..., 3) 형태의 0~255 sRGB 배열을 D65 기준 CIE Lab 배열로 변환하는 함수"""
+    c = np.asarray(rgb, dtype=np.float32) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    m = np.array([[0.4124564, 0.3575761, 0.1804375],
+                  [0.2126729, 0.7151522, 0.0721750],
+                  [0.0193339, 0.1191920, 0.9503041]], dtype=np.float32)
+    xyz = linear @ m.T / np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    lab = np.empty_like(f)
+    lab[..., 0] = 116.0 * f[..., 1] - 16.0
+    lab[..., 1] = 500.0 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200.0 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+def _skin_mask(rgb):
+    """YCrCb 범위 규칙으로 피부색 픽셀을 찾는 함수"""
+    rgb = rgb.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    return (cr >= 133) & (cr <= 173) & (cb >= 77) & (cb <= 127) & (r > 60)
+
+
+def _largest_band(indices):
+    """불리언 배열에서 True가 몰려 있는 구간의 양 끝(하위/상위 5%)을 반환하는 함수"""
+    if indices.size == 0:
+        return None
+    return int(np.percentile(indices, 5)), int(np.percentile(indices, 95))
+
+
+def sample_regions(rgb):
+    """얼굴 사진 배열에서 피부, 머리카락, 눈 영역의 픽셀을 추출하는 함수"""
+    h, w, _ = rgb.shape
+    mask = _skin_mask(rgb)
+    # 정면 사진은 얼굴이 가운데에 오므로 중앙 영역의 피부 픽셀로 얼굴 범위를 추정합니다.
+    center = np.zeros_like(mask)
+    center[h // 8: h * 7 // 8, w // 5: w * 4 // 5] = True
+    ys, xs = np.nonzero(mask & center)
+    rows, cols = _largest_band(ys), _largest_band(xs)
+    if rows is None or cols is None:
+        return None
+    top, bottom = rows
+    left, right = cols
+    face_h = max(bottom - top, 1)
+
+    # 피부: 얼굴 높이 45~75% 구간(볼 부근)의 피부 픽셀
+    cheek = np.zeros_like(mask)
+    cheek[top + int(face_h * 0.45): top + int(face_h * 0.75), left:right] = True
+    skin = rgb[mask & cheek]
+
+    # 머리카락: 얼굴 윗부분과 그 바로 위 영역의 비피부 픽셀 중 어두운 절반
+    hair_zone = np.zeros_like(mask)
+    hair_zone[max(0, top - int(face_h * 0.25)): top + int(face_h * 0.1), left:right] = True
+    hair = rgb[hair_zone & ~mask]
+
+    # 눈: 얼굴 높이 25~45% 구간의 비피부 픽셀 중 가장 어두운 픽셀들
+    eye_zone = np.zeros_like(mask)
+    eye_zone[top + int(face_h * 0.25): top + int(face_h * 0.45), left:right] = True
+    eyes = rgb[eye_zone & ~mask]
+    return {"skin": skin, "hair": hair, "eyes": eyes}
+
+
+def _darkest(lab, fraction):
+    if lab.shape[0] == 0:
+        return None
+    k = max(1, int(lab.shape[0] * fraction))
+    idx = np.argpartition(lab[:, 0], k - 1)[:k]
+    return np.median(lab[idx], axis=0)
+
+
+def extract_features(rgb):
+    """피부/머리카락/눈 영역의 Lab 통계에서 언더톤과 대비 특징을 계산하는 함수"""
+    regions = sample_regions(rgb)
+    if regions is None or regions["skin"].shape[0] < MIN_SKIN_PIXELS:
+        return None
+    skin_lab = np.median(srgb_to_lab(regions["skin"]), axis=0)
+    hair_lab = _darkest(srgb_to_lab(regions["hair"]), 0.5)
+    eye_lab = _darkest(srgb_to_lab(regions["eyes"]), 0.1)
+    darks = [v[0] for v in (hair_lab, eye_lab) if v is not None]
+    dark_l = min(darks) if darks else skin_lab[0]
+    return {
+        "skin_L": float(skin_lab[0]),
+        "skin_a": float(skin_lab[1]),
+        "skin_b": float(skin_lab[2]),
+        "skin_hue": float(np.degrees(np.arctan2(skin_lab[2], skin_lab[1]))),
+        "skin_chroma": float(np.hypot(skin_lab[1], skin_lab[2])),
+        "hair_L": None if hair_lab is None else float(hair_lab[0]),
+        "eye_L": None if eye_lab is None else float(eye_lab[0]),
+        "contrast": float(skin_lab[0] - dark_l),
+        "skin_pixels": int(regions["skin"].shape[0]),
+    }
+
+
+def classify_features(features):
+    """특징값으로 계절 타입과 확신도(0~1)를 계산하는 함수. 확신도가 낮으면 UNCERTAIN을 반환합니다."""
+    if features is None or features["eye_L"] is None or features["contrast"] <= 0:
+        # 눈동자 영역을 찾지 못했거나 피부보다 어두운 영역이 없으면 대비 값을 신뢰할 수 없습니다.
+        return UNCERTAIN, 0.0
+    warm = features["skin_hue"] >= WARM_HUE_THRESHOLD
+    high_contrast = features["contrast"] >= CONTRAST_THRESHOLD
+    if warm:
+        season = "가을 웜톤" if high_contrast else "봄 웜톤"
+    else:
+        season = "겨울 쿨톤" if high_contrast else "여름 쿨톤"
+    # 두 기준선에서 얼마나 떨어져 있는지를 각각 0~1로 정규화하고, 더 애매한 쪽을 확신도로 사용합니다.
+    hue_conf = min(1.0, abs(features["skin_hue"] - WARM_HUE_THRESHOLD) / (HUE_MARGIN * 2))
+    contrast_conf = min(1.0, abs(features["contrast"] - CONTRAST_THRESHOLD) / (CONTRAST_MARGIN * 2))
+    confidence = min(hue_conf, contrast_conf)
+    if abs(features["skin_hue"] - WARM_HUE_THRESHOLD) < HUE_MARGIN \
+            or abs(features["contrast"] - CONTRAST_THRESHOLD) < CONTRAST_MARGIN \
+            or confidence < MIN_CONFIDENCE:
+        return UNCERTAIN, confidence
+    return season, confidence
+
+
+def load_rgb(image_file, size=ANALYSIS_SIZE):
+    """업로드 파일을 분석용으로 축소한 RGB 배열로 읽는 함수"""
+    img = Image.open(image_file)
+    img.draft("RGB", (size, size))
+    img = img.convert("RGB")
+    img.thumbnail((size, size))
+    if hasattr(image_file, "seek"):
+        image_file.seek(0)
+    return np.asarray(img)
+
+
+def analyze(image_file):
+    """얼굴 사진 파일을 로컬에서 분석해 {season, confidence, features}를 반환하는 함수"""
+    features = extract_features(load_rgb(image_file))
+    season, confidence = classify_features(features)
+    return {"season": season, "confidence": confidence, "features": features}
+
+
+def describe(result):
+    """로컬 분석 결과를 Gemini 응답과 같은 형식의 Markdown 설명으로 만드는 함수"""
+    f = result["features"]
+    season = result["season"]
+    undertone = "노란 기가 도는 웜" if f["skin_hue"] >= WARM_HUE_THRESHOLD else "붉은/핑크 기가 도는 쿨"
+    contrast = "또렷한" if f["contrast"] >= CONTRAST_THRESHOLD else "부드러운"
+    brightness = "밝은" if f["skin_L"] >= 65 else "차분한"
+    return (f"**진단 결과**: {season}\n"
+            f"**진단 근거**:\n"
+            f"* 피부 톤: {brightness} 피부에 {undertone} 언더톤이 보입니다. (색상각 {f['skin_hue']:.0f}°)\n"
+            f"* 헤어/눈동자 컬러: 피부와 헤어/눈동자의 명도 차이가 {contrast} 편입니다. (명도 차 {f['contrast']:.0f})\n"
+            f"* 전체적인 조화: {season}의 컬러 팔레트가 얼굴빛을 가장 자연스럽게 살려줍니다.")
+
+
+def parse_season(text):
+    """Gemini 응답에서 '진단 결과' 줄을 찾아 계절 타입을 추출하는 함수 (굵게 표시, 이모지, 대괄호 등 허용)"""
+    if not text:
+        return None
+
+    def seasons_in(candidate):
+        normalized = re.sub(r"\s+", "", candidate)
+        return [season for season in SEASONS if season.replace(" ", "") in normalized]
+
+    match = re.search(r"진단\s*결과\W*[:：]\s*(.+)", text)
+    if match and seasons_in(match.group(1)):
+        return seasons_in(match.group(1))[0]
+    # 형식이 어긋났더라도 본문에 계절 타입이 하나만 언급되었다면 그것을 결과로 봅니다.
+    mentioned = seasons_in(text)
+    return mentioned[0] if len(mentioned) == 1 else None
@@ -0,0 +1,266 @@
+"""버전이 붙은 Gemini 프롬프트 레지스트리
+
+각 프롬프트는 매 호출마다 같은 고정 지시문(system)과, 호출마다 값이 바뀌는 짧은 템플릿으로 나뉩니다.
+템플릿은 등록할 때 한 번만 파싱해 두고 렌더링은 조각을 이어 붙이기만 합니다.
+고정 지시문은 Gemini의 system_instruction으로 전달되어 (길이가 충분하면) 명시적 컨텍스트 캐시에 올라가고,
+같은 이름에 여러 변형(A/B)을 등록해 세션별로 고정된 비율로 나눠 쓸 수 있습니다.
+캐시 키와 트레이싱 기록에는 항상 "이름@버전/변형" 키가 포함되어 프롬프트를 바꾸면 캐시도 함께 바뀝니다.
+
+환경 변수
+    OTTAKU_PROMPT_VARIANTS          변형 지정. 예: "cody_recommendation=B" (고정), "cody_recommendation=A:1,B:1" (비율)
+    OTTAKU_GEMINI_CONTEXT_CACHE     1이면 고정 지시문을 명시적 컨텍스트 캐시에 올립니다 (기본값 0)
+    OTTAKU_GEMINI_CACHE_MIN_TOKENS  명시적 캐시를 만들 최소 토큰 수 (기본값 4096, 모델의 최소 길이보다 짧으면 API가 거부)
+"""
+import hashlib
+import os
+import re
+import string
+import threading
+import time
+from datetime import timedelta
+
+import google.generativeai as genai
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+CONTEXT_CACHE = os.environ.get("OTTAKU_GEMINI_CONTEXT_CACHE", "0") == "1"
+CACHE_MIN_TOKENS = int(os.environ.get("OTTAKU_GEMINI_CACHE_MIN_TOKENS", "4096"))
+CACHE_TTL_SECONDS = 60 * 60
+HIGHLIGHT_COLOR = "#87CEEB"
+
+_formatter = string.Formatter()
+
+
+def estimate_tokens(text):
+    """모델 호출 없이 토큰 수를 대략 추정하는 함수 (한글은 글자당 약 0.5~1토큰, 영문은 4글자당 1토큰)"""
+    hangul = sum(1 for ch in text if "가" <= ch <= "힣")
+    return hangul + (len(text) - hangul + 3) // 4
+
+
+class PromptTemplate:
+    """고정 지시문과 미리 파싱된 가변 템플릿으로 이루어진 프롬프트 한 벌"""
+
+    def __init__(self, name, version, template, system="", variant="A", weight=1.0, postprocess=None):
+        self.name = name
+        self.version = version
+        self.variant = variant
+        self.weight = weight
+        self.system = system.strip()
+        self.template = template.strip()
+        self.postprocess = postprocess
+        self._segments = [(literal, field) for literal, field, _, _ in _formatter.parse(self.template)]
+        self.fields = [field for _, field in self._segments if field]
+        self._token_counts = None
+
+    @property
+    def key(self):
+        return f"{self.name}@{self.version}/{self.variant}"
+
+    def render(self, **values):
+        """가변 부분을 채운 문자열을 반환하는 함수"""
+        parts = []
+        for literal, field in self._segments:
+            parts.append(literal)
+            if field:
+                parts.append(str(values[field]))
+        return "".join(parts)
+
+    def full_text(self, **values):
+        """고정 지시문과 가변 부분을 합친 하나의 프롬프트 (system_instruction을 쓰지 않는 호출용)"""
+        return f"{self.system}\n{self.render(**values)}" if self.system else self.render(**values)
+
+    def cache_key(self, *parts):
+        """프롬프트 키와 고정 지시문 내용, 추가 값으로 만든 캐시 키"""
+        digest = hashlib.sha256(self.key.encode("utf-8"))
+        digest.update(self.system.encode("utf-8"))
+        for part in parts:
+            digest.update(b"\0" + str(part).encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def token_counts(self, counter=None):
+        """고정 지시문과 빈 템플릿의 토큰 수 {system, template}을 반환하는 함수 (counter가 있으면 실제 측정)"""
+        if self._token_counts is None or counter is not None:
+            count = counter or estimate_tokens
+            empty = self.render(**{field: "" for field in self.fields})
+            self._token_counts = {"system": count(self.system) if self.system else 0, "template": count(empty)}
+        return self._token_counts
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def register(template):
+    with _registry_lock:
+        variants = _registry.setdefault(template.name, {})
+        variants[template.variant] = template
+    return template
+
+
+def variants(name):
+    return list(_registry[name].values())
+
+
+def all_templates():
+    return [t for name in sorted(_registry) for t in _registry[name].values()]
+
+
+def _variant_overrides():
+    """OTTAKU_PROMPT_VARIANTS를 {이름: 고정 변형 또는 {변형: 비율}}로 해석하는 함수"""
+    overrides = {}
+    for entry in re.split(r"[;\s]+", os.environ.get("OTTAKU_PROMPT_VARIANTS", "").strip()):
+        if "=" not in entry:
+            continue
+        name, spec = entry.split("=", 1)
+        if ":" in spec:
+            overrides[name] = {v: float(w) for v, w in (part.split(":", 1) for part in spec.split(","))}
+        else:
+            overrides[name] = spec
+    return overrides
+
+
+def get(name, session_key=None, variant=None):
+    """이름에 해당하는 프롬프트를 반환하는 함수. 변형이 여러 개면 session_key별로 고정된 가중 추첨을 합니다."""
+    candidates = _registry[name]
+    override = variant or _variant_overrides().get(name)
+    if isinstance(override, str) and override in candidates:
+        return candidates[override]
+    weights = {v: t.weight for v, t in candidates.items()}
+    if isinstance(override, dict):
+        weights = {v: w for v, w in override.items() if v in candidates}
+    weights = {v: w for v, w in weights.items() if w > 0}
+    if not weights:
+        return next(iter(candidates.values()))
+    if session_key is None or len(weights) == 1:
+        return candidates[max(weights, key=weights.get)]
+    # 같은 세션은 항상 같은 변형을 받도록 해시로 [0, 1) 구간의 위치를 정합니다.
+    point = int(hashlib.sha256(f"{name}:{session_key}".encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+    total = sum(weights.values())
+    cumulative = 0.0
+    for v in sorted(weights):
+        cumulative += weights[v] / total
+        if point < cumulative:
+            return candidates[v]
+    return candidates[sorted(weights)[-1]]
+
+
+# --- 모델 (고정 지시문별 system_instruction / 컨텍스트 캐시) ---
+
+_models = {}
+_cache_status = {}
+_models_lock = threading.Lock()
+
+
+def _create_cached_model(template, model_name):
+    """고정 지시문을 명시적 컨텍스트 캐시에 올린 모델을 만드는 함수. 다른 워커가 만든 캐시가 있으면 재사용합니다."""
+    display_name = f"ottaku-{template.name}-{template.cache_key()}"[:128]
+    for cached in genai.caching.CachedContent.list():
+        if cached.display_name == display_name and cached.model.endswith(model_name):
+            expires = cached.expire_time.timestamp()
+            if expires - time.time() > 60:
+                return genai.GenerativeModel.from_cached_content(cached), expires
+    cached = genai.caching.CachedContent.create(model=model_name, display_name=display_name,
+                                                system_instruction=template.system,
+                                                ttl=timedelta(seconds=CACHE_TTL_SECONDS))
+    return genai.GenerativeModel.from_cached_content(cached), time.time() + CACHE_TTL_SECONDS
+
+
+def model_for(template, model_name=DEFAULT_MODEL):
+    """템플릿의 고정 지시문을 system_instruction으로 둔 모델을 반환하는 함수 (프로세스 안에서 재사용)"""
+    key = (model_name, template.cache_key())
+    with _models_lock:
+        entry = _models.get(key)
+        if entry and entry[1] - time.time() > 60:
+            return entry[0]
+        model, expires = None, float("inf")
+        if CONTEXT_CACHE and template.system and template.token_counts()["system"] >= CACHE_MIN_TOKENS:
+            try:
+                model, expires = _create_cached_model(template, model_name)
+                _cache_status[template.key] = "cached"
+            except Exception as e:
+                _cache_status[template.key] = f"실패: {type(e).__name__}"
+        if model is None:
+            # 짧은 지시문은 명시적 캐시 대상이 아니므로 system_instruction으로만 분리해 둡니다.
+            model = genai.GenerativeModel(model_name, system_instruction=template.system or None)
+            _cache_status.setdefault(template.key, "system_instruction")
+        _models[key] = (model, expires)
+        return model
+
+
+def registry_table(counter=None):
+    """관리자 페이지용 프롬프트 목록 (이름, 버전, 변형, 비율, 고정/가변 토큰 수, 캐시 상태)"""
+    rows = []
+    for t in all_templates():
+        tokens = t.token_counts(counter)
+        rows.append({"prompt": t.key, "weight": t.weight, "system_tokens": tokens["system"],
+                     "template_tokens": tokens["template"], "context_cache": _cache_status.get(t.key, "-")})
+    return rows
+
+
+def highlight_keywords(text):
+    """**키워드** 표시를 화면용 색상 강조 태그로 바꾸는 함수 (프롬프트에 HTML 규칙을 싣지 않기 위함)"""
+    return re.sub(r"\*\*(.+?)\*\*", rf"<span style='color: {HIGHLIGHT_COLOR};'>\1</span>", text)
+
+
+# --- 등록된 프롬프트 ---
+
+register(PromptTemplate("clothing_analysis", "v2", system="""
+당신은 패션 스타일리스트이자 의류 분석 전문가입니다. 사진 속 옷을 분석해 각 항목에 가장 적절한 값 하나만 답합니다.
+item_type: 상의, 하의, 아우터, 신발, 액세서리 중 하나 / category: 티셔츠, 셔츠, 청바지처럼 구체적으로 / color: 가장 주된 색상 / pattern: 솔리드(단색), 스트라이프, 체크 등 / style_tags: 캐주얼, 미니멀, 스트리트, 포멀, 스포티 중 어울리는 것
+""", template="이 사진의 옷을 분석해주세요."))
+
+register(PromptTemplate("clothing_analysis_text", "v1", system="""
+당신은 패션 스타일리스트이자 의류 분석 전문가입니다. 이 이미지에 있는 옷을 분석해서 아래 JSON 형식에 맞춰 답변해주세요. 각 항목에 대해 가장 적절한 단 하나의 값만 선택해주세요. **중요: 답변에는 JSON 코드 외에 어떤 설명이나 인사도 포함하지 말고, 오직 JSON 객체만 응답해야 합니다.**
+{"item_type": "상의, 하의, 아우터, 신발, 액세서리 중 하나", "category": "티셔츠, 셔츠, 청바지 등 구체적인 카테고리", "color": "옷의 가장 주된 색상", "pattern": "솔리드(단색), 스트라이프, 체크 등", "style_tags": ["캐주얼", "미니멀", "스트리트", "포멀", "스포티"]}
+""", template="이 이미지의 옷을 분석해주세요."))
+
+_CODY_SYSTEM = """
+당신은 친절하고 스타일리시한 AI 패션 어드바이저입니다. 고객 정보, 의류 아이템, 상황(날씨가 주어지면 기온·강수·바람 포함)에 맞는 완성된 코디 두 가지를 outfits로 추천합니다.
+title: 이모티콘을 포함한 짧은 제목 / description: 코디 설명과 추천 이유. 이모티콘(👕,👖,👟,✨ 등)을 쓰고 핵심 아이템·색상·스타일 키워드는 **굵게** 표시 / search_keywords: 추천한 각 아이템의 검색 키워드 / image_prompt: 고객 성별과 상황을 반영해 그 코디를 입은 모델을 상세하고 사실적으로 묘사한 영어 이미지 프롬프트
+"""
+_CODY_TEMPLATE = """
+고객: {gender}, {height}cm, {weight}kg, 피부 톤 {skin_tone}, 선호 스타일 {styles}
+아이템: {item_type} / {category} / {color} / {pattern}
+상황: {situation}
+날씨: {weather}
+"""
+
+register(PromptTemplate("cody_recommendation", "v2", system=_CODY_SYSTEM, template=_CODY_TEMPLATE,
+                        postprocess=highlight_keywords))
+# B: 설명 길이를 줄여 출력 토큰과 응답 시간을 비교하기 위한 변형 (기본 비율 0, OTTAKU_PROMPT_VARIANTS로 사용)
+register(PromptTemplate("cody_recommendation", "v2", variant="B", weight=0.0,
+                        system=_CODY_SYSTEM + "description은 코디마다 3문장 이내로 간결하게 씁니다.",
+                        template=_CODY_TEMPLATE, postprocess=highlight_keywords))
+
+register(PromptTemplate("cody_recommendation_batch", "v1", system=_CODY_SYSTEM + """
+요청이 여러 개 주어지면 각 요청마다 [번호]를 index로 하여 items 배열에 하나씩 답합니다. 요청끼리 코디가 겹치지 않게 다양하게 구성합니다.
+""", template="""
+고객: {gender}, {height}cm, {weight}kg, 피부 톤 {skin_tone}, 선호 스타일 {styles}
+요청:
+{requests}
+""", postprocess=highlight_keywords))
+
+register(PromptTemplate("cody_recommendation_text", "v1", system="""
+당신은 친절하고 스타일리시한 AI 패션 어드바이저입니다. 고객 정보, 의류 아이템, 주어진 상황을 바탕으로 최고의 코디를 추천해주세요. **중요: 답변의 가독성을 높이기 위해 다음 규칙을 반드시 지켜주세요.** 1. 각 코디 제안의 제목은 Markdown의 `##`를 사용하여 크고 굵게 표시해주세요. 2. 설명에 어울리는 이모티콘(👕,👖,👟,✨ 등)을 자유롭게 사용해주세요. 3. 의류 아이템, 색상, 스타일 등 중요한 키워드는 `<span style='color: #87CEEB;'>키워드</span>` 와 같이 HTML 태그를 사용해 색상을 입혀 강조해주세요. 4. 추천된 각 아이템 뒤에는 검색 가능한 키워드를 `(검색 키워드: [키워드])` 형식으로 추가해주세요.
+## 요청 사항:
+1. 주어진 정보를 종합하여, 총 **두 가지 스타일의 완성된 코디**를 추천하고, 각 코디를 추천한 이유를 친절하게 설명해주세요. 날씨 정보가 있다면 기온, 강수, 바람에 맞는 코디여야 합니다.
+2. 각 코디 설명 후, DALL-E가 이미지를 생성할 수 있도록, **고객의 성별을 반영**하고 **주어진 상황을 반영**하여 해당 코디를 입은 모델의 모습을 상세하고 사실적으로 묘사하는 **영어 프롬프트**를 다음 형식으로 제공해주세요: `IMAGE_PROMPT_1: [첫 번째 코디에 대한 상세한 영어 묘사]`, `IMAGE_PROMPT_2: [두 번째 코디에 대한 상세한 영어 묘사]`
+""", template="""
+## 🧑‍💻 고객 정보:
+- 성별: {gender}; - 키: {height}cm, 몸무게: {weight}kg; - 피부 톤: {skin_tone}; - 선호 스타일: {styles}
+## 👚 분석된 의류 아이템:
+- 종류: {item_type}, 카테고리: {category}, 색상: {color}, 패턴: {pattern}
+## 🏞️ 주어진 상황:
+- {situation}
+## 🌤️ 날씨 정보:
+- {weather}
+"""))
+
+register(PromptTemplate("personal_color", "v2", system="""
+당신은 전문 퍼스널 컬러 컨설턴트입니다. 얼굴 사진의 피부 언더톤, 머리카락과 눈동자 색의 대비 등을 종합해 가장 가능성이 높은 퍼스널 컬러를 진단합니다.
+답변은 아래 형식을 지키고, 진단 근거는 핵심 이유를 간결한 불릿 포인트로 씁니다.
+**진단 결과**: [🌱봄 웜톤, 🌊여름 쿨톤, 🍂가을 웜톤, ❄️겨울 쿨톤 중 하나]
+**진단 근거**:
+* 피부 톤: [분석]
+* 헤어/눈동자 컬러: [분석]
+* 전체적인 조화: [분석]
+""", template="이 사진 속 인물의 퍼스널 컬러를 진단해주세요.{local_hint}"))
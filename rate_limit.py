@@ -0,0 +1,331 @@
+"""OpenAI/Gemini 호출 한도를 지키기 위한 토큰 버킷 속도 제한기와 우선순위 대기열
+
+모델/엔드포인트마다 분당 요청 수 한도의 토큰 버킷을 두고, 토큰이 없으면 호출 전에 기다립니다.
+기다리는 요청은 (우선순위, 최근 1분간 해당 세션이 받은 호출 수, 도착 순서)로 정렬되어
+대화형 분석이 배치/미리 생성 작업보다 먼저, 그리고 여러 세션이 고르게 차례를 받습니다.
+사용자가 미리 생성 중인 결과를 기다리기 시작하면 promote()로 그 세션의 미리 생성 호출을 대화형으로 올립니다.
+OTTAKU_RATE_LIMIT_DIR을 지정하면 버킷 상태를 파일 잠금으로 공유해 같은 호스트의 모든 워커가 한 한도를 나눠 씁니다.
+(대기열 순서는 프로세스 안에서만 적용되고, 프로세스 사이에서는 버킷을 먼저 잡는 쪽이 가져갑니다.)
+
+환경 변수
+    OTTAKU_RATE_LIMITS     "이름=분당요청수[/버스트]"를 쉼표로 나열. 예: "dall-e-3=5,gemini-1.5-flash=300/20"
+                           "off"면 제한하지 않습니다.
+    OTTAKU_RATE_LIMIT_DIR  호스트 단위로 버킷을 공유할 디렉터리 (없으면 프로세스 단위)
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 개발 환경에서는 프로세스 단위로만 동작합니다.
+    fcntl = None
+
+INTERACTIVE = 0
+BATCH = 1
+PREFETCH = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch", PREFETCH: "prefetch"}
+
+# 제공자 기본 한도보다 약간 낮게 잡은 기본값 (분당 요청 수, 버스트)
+DEFAULT_LIMITS = {
+    "gemini-1.5-flash": (300, 20),
+    "dall-e-2": (50, 5),
+    "dall-e-3": (5, 2),
+    "tts-1": (50, 5),
+}
+FAIR_SHARE_WINDOW_SECONDS = 60
+
+_context = contextvars.ContextVar("ottaku_rate_context", default=(INTERACTIVE, None))
+# 세션 → promote() 횟수 (사용자가 기다리는 동안 그 세션의 PREFETCH 호출을 INTERACTIVE로 처리합니다)
+_promoted = {}
+_promoted_lock = threading.Lock()
+
+
+class RateLimitTimeout(TimeoutError):
+    """대기 시간 한도 안에 호출 차례를 받지 못했을 때 발생하는 예외"""
+
+
+@contextmanager
+def context(priority=None, session=None):
+    """with 블록 안의 호출에 우선순위와 세션을 지정하는 컨텍스트 매니저 (작업 스레드 안에서도 사용)"""
+    current_priority, current_session = _context.get()
+    token = _context.set((current_priority if priority is None else priority,
+                          current_session if session is None else session))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def bind_session(session):
+    """현재 스레드의 이후 호출을 session의 호출로 기록하는 함수 (스크립트 실행 시작 시 호출)"""
+    _context.set((_context.get()[0], session))
+
+
+class _MemoryBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_take(self, cost=1.0):
+        """토큰을 가져가면 0, 아니면 다시 시도할 때까지 기다릴 초를 반환합니다."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def penalize(self, seconds):
+        self.try_take(0)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class _FileBucket:
+    """버킷 상태("토큰 수 갱신시각")를 파일에 두고 flock으로 프로세스 간에 공유하는 버킷"""
+
+    def __init__(self, path, rate_per_second, capacity):
+        self.path = path
+        self.rate = rate_per_second
+        self.capacity = capacity
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @contextmanager
+    def _locked_state(self):
+        with open(self.path, "a+") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                parts = f.read().split()
+                now = time.time()
+                tokens, updated = (float(parts[0]), float(parts[1])) if len(parts) == 2 else (self.capacity, now)
+                state = {"tokens": min(self.capacity, tokens + max(0.0, now - updated) * self.rate), "now": now}
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(f"{state['tokens']:.6f} {now:.6f}")
+                f.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_take(self, cost=1.0):
+        with self._locked_state() as state:
+            if state["tokens"] >= cost:
+                state["tokens"] -= cost
+                return 0.0
+            return (cost - state["tokens"]) / self.rate
+
+    def penalize(self, seconds):
+        with self._locked_state() as state:
+            state["tokens"] = min(state["tokens"], 0.0) - seconds * self.rate
+
+
+class _Waiter:
+    __slots__ = ("priority", "session", "seq")
+
+    def __init__(self, priority, session, seq):
+        self.priority = priority
+        self.session = session
+        self.seq = seq
+
+
+class Limiter:
+    """엔드포인트 하나의 토큰 버킷과 우선순위/공정 분배 대기열"""
+
+    def __init__(self, name, per_minute, burst=None, state_dir=None):
+        self.name = name
+        self.per_minute = per_minute
+        capacity = float(burst or max(1, per_minute // 10))
+        rate = per_minute / 60.0
+        self._bucket = (_FileBucket(os.path.join(state_dir, f"{name}.bucket"), rate, capacity) if state_dir
+                        else _MemoryBucket(rate, capacity))
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = 0
+        self._recent = deque()          # (시각, 세션) - 최근 1분간 호출 기록
+        self._recent_counts = {}
+        # 지표
+        self.granted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.timeouts = 0
+        self.throttled = 0
+        self.max_depth = 0
+        self._waits = deque(maxlen=2000)
+
+    def _share(self, session):
+        return self._recent_counts.get(session, 0)
+
+    def _forget_old(self, now):
+        while self._recent and now - self._recent[0][0] > FAIR_SHARE_WINDOW_SECONDS:
+            _, session = self._recent.popleft()
+            self._recent_counts[session] -= 1
+            if not self._recent_counts[session]:
+                del self._recent_counts[session]
+
+    def _head(self):
+        return min(self._waiters, key=lambda w: (w.priority, self._share(w.session), w.seq))
+
+    def acquire(self, priority=INTERACTIVE, session=None, timeout=None, cost=1.0):
+        """호출 차례를 받을 때까지 기다리고 기다린 시간(초)을 반환하는 함수"""
+        start = time.monotonic()
+        with self._cond:
+            # promote()는 이 잠금을 잡고 대기열을 훑으므로, 여기서 확인하면 승격을 놓치지 않습니다.
+            if priority == PREFETCH and session in _promoted:
+                priority = INTERACTIVE
+            self._seq += 1
+            waiter = _Waiter(priority, session, self._seq)
+            self._waiters.append(waiter)
+            self.max_depth = max(self.max_depth, len(self._waiters))
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._forget_old(now)
+                    delay = None
+                    if self._head() is waiter:
+                        delay = self._bucket.try_take(cost)
+                        if delay == 0:
+                            break
+                    remaining = None if timeout is None else timeout - (now - start)
+                    if remaining is not None and remaining <= 0:
+                        self.timeouts += 1
+                        raise RateLimitTimeout(f"{self.name}: {timeout:.0f}초 안에 호출 차례를 받지 못했습니다.")
+                    # 맨 앞 요청은 토큰이 찰 때까지, 나머지는 앞 요청이 빠질 때까지 기다립니다.
+                    waits = [w for w in (delay, remaining) if w is not None]
+                    self._cond.wait(min(waits) if waits else None)
+            finally:
+                self._waiters.remove(waiter)
+                self._cond.notify_all()
+            waited = time.monotonic() - start
+            self._recent.append((time.monotonic(), session))
+            self._recent_counts[session] = self._recent_counts.get(session, 0) + 1
+            label = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+            self.granted[label] = self.granted.get(label, 0) + 1
+            self._waits.append(waited)
+            return waited
+
+    def _promote(self, session):
+        with self._cond:
+            for waiter in self._waiters:
+                if waiter.session == session and waiter.priority == PREFETCH:
+                    waiter.priority = INTERACTIVE
+            self._cond.notify_all()
+
+    def penalize(self, seconds):
+        """제공자가 한도 초과(429)를 알려 오면 그만큼 버킷을 비워 재시도 폭주를 막는 함수"""
+        with self._cond:
+            self.throttled += 1
+            self._bucket.penalize(seconds)
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            depth = len(self._waiters)
+
+        def pct(q):
+            return waits[min(len(waits) - 1, int(q * len(waits)))] * 1000 if waits else 0.0
+        return {"limiter": self.name, "per_minute": self.per_minute, "queue_depth": depth,
+                "max_queue_depth": self.max_depth, "wait_p50_ms": pct(0.50), "wait_p95_ms": pct(0.95),
+                "wait_max_ms": waits[-1] * 1000 if waits else 0.0, "timeouts": self.timeouts,
+                "throttled": self.throttled, **{f"granted_{k}": v for k, v in self.granted.items()}}
+
+
+def parse_limits(spec):
+    """OTTAKU_RATE_LIMITS 형식 문자열을 {이름: (분당 요청 수, 버스트)}로 해석하는 함수 (기본값과 병합)"""
+    limits = dict(DEFAULT_LIMITS)
+    for entry in spec.split(","):
+        if "=" not in entry:
+            continue
+        name, value = entry.strip().split("=", 1)
+        per_minute, _, burst = value.partition("/")
+        limits[name] = (float(per_minute), float(burst) if burst else None)
+    return limits
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_config = None
+
+
+def _load_config():
+    global _config
+    if _config is None:
+        spec = os.environ.get("OTTAKU_RATE_LIMITS", "").strip()
+        _config = {"enabled": spec.lower() != "off", "limits": parse_limits(spec),
+                   "state_dir": os.environ.get("OTTAKU_RATE_LIMIT_DIR")}
+    return _config
+
+
+def configure(limits=None, enabled=True, state_dir=None):
+    """코드에서 한도를 다시 설정하는 함수 (벤치마크 등). 기존 대기 지표는 초기화됩니다."""
+    global _config
+    with _limiters_lock:
+        _config = {"enabled": enabled, "limits": {**DEFAULT_LIMITS, **(limits or {})}, "state_dir": state_dir}
+        _limiters.clear()
+
+
+def get_limiter(name):
+    """이름에 해당하는 제한기를 반환하는 함수 (한도가 설정되지 않았거나 꺼져 있으면 None)"""
+    config = _load_config()
+    if not config["enabled"] or name not in config["limits"]:
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            per_minute, burst = config["limits"][name]
+            limiter = Limiter(name, per_minute, burst, config["state_dir"])
+            _limiters[name] = limiter
+        return limiter
+
+
+def acquire(name, priority=None, session=None, timeout=None):
+    """현재 컨텍스트의 우선순위/세션으로 name의 호출 차례를 기다리고 기다린 초를 반환하는 함수"""
+    limiter = get_limiter(name)
+    if limiter is None:
+        return 0.0
+    context_priority, context_session = _context.get()
+    return limiter.acquire(context_priority if priority is None else priority,
+                           context_session if session is None else session, timeout)
+
+
+def promote(session):
+    """session의 미리 생성 호출(대기 중인 것 포함)을 demote()할 때까지 대화형 우선순위로 올리는 함수"""
+    with _promoted_lock:
+        _promoted[session] = _promoted.get(session, 0) + 1
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    for limiter in limiters:
+        limiter._promote(session)
+
+
+def demote(session):
+    """promote()를 되돌리는 함수 (승격을 요청한 쪽이 기다림을 끝냈을 때)"""
+    with _promoted_lock:
+        if _promoted.get(session, 0) <= 1:
+            _promoted.pop(session, None)
+        else:
+            _promoted[session] -= 1
+
+
+def penalize(name, seconds):
+    limiter = get_limiter(name)
+    if limiter is not None:
+        limiter.penalize(seconds)
+
+
+def stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+def is_rate_limit_error(error):
+    """제공자의 한도 초과 오류인지 판별하는 함수 (OpenAI RateLimitError, Gemini ResourceExhausted, HTTP 429)"""
+    text = f"{type(error).__name__} {error}"
+    return any(marker in text for marker in ("RateLimit", "ResourceExhausted", "429", "rate limit"))
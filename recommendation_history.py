@@ -0,0 +1,251 @@
+"""지난 코디 추천을 보관하고 한국어 글자 2-gram 색인으로 찾아 주는 추천 기록 저장소
+
+새 추천을 받으면 세션 상태의 recommendation_output은 덮어써지므로, 추천마다 설명/검색 키워드/이미지/입력값
+(상황, 날씨, 분석한 옷)을 SQLite에 한 행으로 남기고 "카페", "린넨 셔츠" 같은 검색어로 다시 찾습니다.
+
+SQLite FTS5의 기본 토크나이저는 띄어쓰기 단위로 나누므로 "카페에서"에서 "카페"를 찾지 못하고,
+trigram 토크나이저는 두 글자 검색어를 찾지 못합니다. 그래서 상품 카탈로그(catalog.grams)와 같은
+단어별 글자 2-gram 역색인을 (주인, 2-gram, 추천 번호) 테이블로 두고, 검색어의 2-gram을 모두 가진 추천 중
+검색어 단어가 실제로 들어 있는 것만 최근 순으로 돌려줍니다.
+
+추천 이미지(DALL-E URL은 한 시간 정도 뒤 만료, 콜라주는 로컬 파일)는 백그라운드에서 images/<해시> 파일로
+복사해 두므로 기록을 다시 볼 때 이미지를 새로 생성하지 않습니다.
+
+환경 변수
+    OTTAKU_HISTORY_DIR            저장 위치 (기본값 .ottaku_history)
+    OTTAKU_HISTORY_MAX_PER_USER   사용자(세션)별 보관 개수 (기본값 5000, 넘으면 오래된 추천부터 지움)
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import async_services
+import catalog
+
+HISTORY_DIR = os.environ.get("OTTAKU_HISTORY_DIR", ".ottaku_history")
+MAX_PER_USER = int(os.environ.get("OTTAKU_HISTORY_MAX_PER_USER", "5000"))
+
+# 추천 설명의 색상 강조 태그(<span style=...>)는 검색 대상에서 뺍니다.
+_TAG = re.compile(r"<[^>]+>")
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", str(text or "")).lower()
+
+
+class RecommendationHistory:
+    """사용자(세션)별 추천 기록과 2-gram 검색 색인, 복사해 둔 추천 이미지"""
+
+    def __init__(self, root=HISTORY_DIR, max_per_user=MAX_PER_USER, fetch=None):
+        self.root = root
+        self.max_per_user = max_per_user
+        self._fetch = fetch or async_services.download
+        self._images_dir = os.path.join(self.root, "images")
+        os.makedirs(self._images_dir, exist_ok=True)
+        self._db_path = os.path.join(self.root, "history.sqlite")
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ottaku-history")
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS recommendations (
+                                id INTEGER PRIMARY KEY, owner TEXT NOT NULL, created REAL NOT NULL,
+                                situation TEXT, text TEXT NOT NULL, keywords TEXT NOT NULL, images TEXT NOT NULL,
+                                inputs TEXT NOT NULL, search_text TEXT NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS recommendations_owner ON recommendations (owner, created)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS grams (
+                                owner TEXT NOT NULL, gram TEXT NOT NULL, rec_id INTEGER NOT NULL,
+                                PRIMARY KEY (owner, gram, rec_id)) WITHOUT ROWID""")
+            conn.execute("CREATE INDEX IF NOT EXISTS grams_rec ON grams (rec_id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    # --- 기록 ---
+
+    def add(self, owner, output, inputs=None):
+        """추천 결과(text, keywords, image_urls, image_tiers)를 기록하고 추천 번호를 반환하는 함수
+
+        inputs는 추천을 만든 입력값(situation, weather, garment 등) 딕셔너리입니다.
+        이미지는 백그라운드에서 복사하며, 끝나기 전에 검색되면 원래 주소를 보여 줍니다.
+        """
+        inputs = dict(inputs or {})
+        urls = list(output.get("image_urls") or [])
+        tiers = list(output.get("image_tiers") or [None] * len(urls))
+        images = [{"source": url, "path": None, "tier": tier} for url, tier in zip(urls, tiers)]
+        garment = inputs.get("garment") or {}
+        searchable = [inputs.get("situation"), _TAG.sub(" ", output.get("text") or ""),
+                      " ".join(output.get("keywords") or []),
+                      *(garment.get(key) for key in ("item_type", "category", "color", "pattern"))]
+        search_text = normalize(" ".join(str(part) for part in searchable if part))
+        with self._transaction() as conn:
+            rec_id = conn.execute(
+                "INSERT INTO recommendations (owner, created, situation, text, keywords, images, inputs, search_text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (owner, time.time(), inputs.get("situation"), output.get("text") or "",
+                 json.dumps(output.get("keywords") or [], ensure_ascii=False), json.dumps(images, ensure_ascii=False),
+                 json.dumps(inputs, ensure_ascii=False, default=str), search_text)).lastrowid
+            conn.executemany("INSERT OR IGNORE INTO grams VALUES (?, ?, ?)",
+                             [(owner, gram, rec_id) for gram in catalog.grams(search_text)])
+            removed = self._prune(conn, owner)
+        self._remove_unused_images(removed)
+        if any(url for url in urls):
+            future = self._pool.submit(self._copy_images, rec_id, images)
+            with self._pending_lock:
+                self._pending.add(future)
+            future.add_done_callback(self._done)
+        return rec_id
+
+    def _done(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def _prune(self, conn, owner):
+        """보관 개수를 넘은 오래된 추천을 지우고 그 추천들의 이미지 경로를 반환하는 함수 (트랜잭션 안에서 호출)"""
+        rows = conn.execute("SELECT id, images FROM recommendations WHERE owner = ? ORDER BY created DESC LIMIT -1 "
+                            "OFFSET ?", (owner, self.max_per_user)).fetchall()
+        if not rows:
+            return []
+        ids = [(row["id"],) for row in rows]
+        conn.executemany("DELETE FROM grams WHERE rec_id = ?", ids)
+        conn.executemany("DELETE FROM recommendations WHERE id = ?", ids)
+        return [image["path"] for row in rows for image in json.loads(row["images"]) if image["path"]]
+
+    def _remove_unused_images(self, paths):
+        """다른 추천이 함께 쓰지 않는 이미지 파일을 지우는 함수"""
+        if not paths:
+            return
+        with self._connect() as conn:
+            for path in set(paths):
+                # 같은 이미지를 쓰는 추천이 남아 있으면 (해시 이름이므로 경로 문자열로 찾습니다) 지우지 않습니다.
+                used = conn.execute("SELECT 1 FROM recommendations WHERE images LIKE ? LIMIT 1",
+                                    (f"%{os.path.basename(path)}%",)).fetchone()
+                if not used and os.path.exists(path):
+                    os.remove(path)
+
+    def _store_image(self, source):
+        """이미지를 내려받거나 복사해 images/<SHA-256><확장자>로 저장하고 경로를 반환하는 함수"""
+        ext = os.path.splitext(urlparse(source).path)[1].lower() or ".png"
+        fd, tmp_path = tempfile.mkstemp(dir=self._images_dir, prefix=".tmp_", suffix=ext)
+        os.close(fd)
+        try:
+            if os.path.exists(source):
+                with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+                    dst.write(src.read())
+            else:
+                self._fetch(source, tmp_path)
+            digest = hashlib.sha256()
+            with open(tmp_path, "rb") as f:
+                for chunk in iter(lambda: f.read(2 ** 20), b""):
+                    digest.update(chunk)
+            target = os.path.join(self._images_dir, digest.hexdigest() + ext)
+            os.replace(tmp_path, target)
+            return target
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _exists(self, rec_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM recommendations WHERE id = ?", (rec_id,)).fetchone() is not None
+
+    def _copy_images(self, rec_id, images):
+        for image in images:
+            # 복사를 기다리는 사이 보관 개수를 넘어 지워진 추천이면 남은 이미지는 받지 않습니다.
+            if image["source"] and self._exists(rec_id):
+                try:
+                    image["path"] = self._store_image(image["source"])
+                except Exception:
+                    # 이미 만료된 주소 등은 원래 주소만 남깁니다.
+                    image["path"] = None
+        with self._transaction() as conn:
+            updated = conn.execute("UPDATE recommendations SET images = ? WHERE id = ?",
+                                   (json.dumps(images, ensure_ascii=False), rec_id)).rowcount
+        if not updated:
+            # 복사하는 동안 지워진 추천의 이미지는 가리키는 기록이 없으므로 바로 정리합니다.
+            self._remove_unused_images([image["path"] for image in images if image["path"]])
+
+    def wait(self, timeout=None):
+        """진행 중인 이미지 복사가 끝날 때까지 기다리는 함수"""
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result(timeout)
+
+    # --- 검색 ---
+
+    @staticmethod
+    def _entry(row):
+        images = json.loads(row["images"])
+        for image in images:
+            # 복사해 둔 파일이 있으면 그것을, 없으면 원래 주소를 보여 줍니다.
+            image["display"] = image["path"] if image["path"] and os.path.exists(image["path"]) else image["source"]
+        return {"id": row["id"], "created": row["created"], "situation": row["situation"], "text": row["text"],
+                "keywords": json.loads(row["keywords"]), "images": images, "inputs": json.loads(row["inputs"])}
+
+    def search(self, owner, query="", limit=20):
+        """owner의 추천 중 query의 단어가 모두 들어 있는 것을 최근 순으로 limit개 반환하는 함수 (빈 검색어는 최근 추천)"""
+        query_grams = catalog.grams(query)
+        with self._connect() as conn:
+            if not query_grams:
+                rows = conn.execute("SELECT * FROM recommendations WHERE owner = ? ORDER BY created DESC LIMIT ?",
+                                    (owner, limit))
+                return [self._entry(row) for row in rows]
+            placeholders = ", ".join("?" * len(query_grams))
+            rows = conn.execute(
+                f"SELECT r.* FROM recommendations r JOIN ("
+                f"    SELECT rec_id FROM grams WHERE owner = ? AND gram IN ({placeholders})"
+                f"    GROUP BY rec_id HAVING COUNT(*) = ?) g ON g.rec_id = r.id "
+                f"ORDER BY g.rec_id DESC", (owner, *query_grams, len(query_grams)))
+            # 2-gram이 모두 있어도 떨어져 있을 수 있으므로 단어가 실제로 들어 있는지 한 번 더 확인합니다.
+            words = catalog.words(query)
+            results = []
+            for row in rows:
+                if all(word in row["search_text"] for word in words):
+                    results.append(self._entry(row))
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def count(self, owner):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM recommendations WHERE owner = ?", (owner,)).fetchone()[0]
+
+
+_default_history = None
+_default_history_lock = threading.Lock()
+
+
+def get_history():
+    """프로세스에서 공유하는 기본 추천 기록 저장소를 반환하는 함수"""
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            _default_history = RecommendationHistory()
+        return _default_history
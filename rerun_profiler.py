@@ -0,0 +1,193 @@
+"""Streamlit 스크립트 재실행 한 번이 어느 구간에서 시간을 쓰는지 재는 프로파일러
+
+외부 API 호출은 tracing 모듈이 따로 기록하므로, 여기서는 app.py를 위에서 아래로 다시 실행하는
+UI 계층의 시간(클라이언트 준비, 사이드바, 페이지 그리기, 옷장 이미지 등)만 구간별로 나눠 잽니다.
+mark()는 이전 구간을 끝내고 새 구간을 시작하며, section()은 그 안에 중첩 구간을 만듭니다.
+모드에 따라 cProfile 함수별 통계나 주기적인 스택 샘플도 함께 모읍니다.
+
+실행이 끝나면 기록을 JSONL 파일에 한 줄씩 추가하고, 파일이 상한을 넘으면 <파일>.1로 바꿔 한 벌만 남깁니다. st.rerun()/st.stop()으로 중간에 끝난 실행은
+다음 실행이 시작될 때 "interrupted"로 기록되고, 조각(fragment)만 다시 실행될 때는 그 구간만 "fragment"로 기록됩니다.
+
+환경 변수 (또는 관리자 세션의 ?profile= 쿼리 파라미터)
+    OTTAKU_PROFILE            1/sections: 구간 시간만, cprofile: cProfile 함수 통계, sample: 스택 샘플링
+    OTTAKU_PROFILE_FILE       기록 파일 (기본값 .ottaku_profile/reruns.jsonl)
+    OTTAKU_PROFILE_FILE_MAX_MB  기록 파일 크기 상한 (기본값 50, 넘으면 이전 기록 한 벌만 남기고 새로 씀)
+    OTTAKU_PROFILE_SAMPLE_MS  sample 모드의 샘플 간격 (기본값 5)
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_FILE = os.environ.get("OTTAKU_PROFILE_FILE", os.path.join(".ottaku_profile", "reruns.jsonl"))
+MAX_FILE_BYTES = int(float(os.environ.get("OTTAKU_PROFILE_FILE_MAX_MB", "50")) * 2 ** 20)
+SAMPLE_SECONDS = float(os.environ.get("OTTAKU_PROFILE_SAMPLE_MS", "5")) / 1000
+MODES = {"1": "sections", "sections": "sections", "cprofile": "cprofile", "sample": "sample"}
+TOP_N = 20
+_file_lock = threading.Lock()
+
+
+def resolve_mode(*values):
+    """환경 변수/쿼리 파라미터 값 중 처음으로 유효한 것을 모드 이름으로 바꾸는 함수 (없으면 None)"""
+    for value in values:
+        if value and str(value).lower() in MODES:
+            return MODES[str(value).lower()]
+    return None
+
+
+def append_record(record, path=None, max_bytes=None):
+    path = path or PROFILE_FILE
+    max_bytes = MAX_FILE_BYTES if max_bytes is None else max_bytes
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _file_lock:
+        try:
+            if os.path.getsize(path) >= max_bytes:
+                os.replace(path, path + ".1")
+        except FileNotFoundError:
+            pass
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def _frame_label(frame):
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+class _Sampler(threading.Thread):
+    """대상 스레드의 호출 스택을 interval초마다 읽어 (바깥→안쪽) 스택별 횟수를 세는 스레드"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="ottaku-profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < 64:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class RerunProfile:
+    """스크립트 실행 한 번의 구간별 시간 (enabled가 False면 모든 메서드가 아무것도 하지 않습니다)"""
+
+    def __init__(self, mode=None, session=None, page=None):
+        self.mode = mode
+        self.enabled = mode is not None
+        self.session = session
+        self.page = page
+        self.sections = []
+        self.finished = None
+        self._current = None
+        self._depth = 0
+        self._profiler = None
+        self._sampler = None
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        if self.mode == "cprofile":
+            try:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            except ValueError:  # 다른 프로파일러가 이미 켜져 있으면 구간 시간만 잽니다.
+                self._profiler = None
+        elif self.mode == "sample":
+            self._sampler = _Sampler(threading.get_ident(), SAMPLE_SECONDS)
+            self._sampler.start()
+
+    def _now_ms(self):
+        return (time.perf_counter() - self._t0) * 1000
+
+    def _close_current(self):
+        if self._current is not None:
+            self._current["ms"] = self._now_ms() - self._current["start_ms"]
+            self._current = None
+
+    def mark(self, name):
+        """이전 최상위 구간을 끝내고 name 구간을 시작하는 함수"""
+        if not self.enabled or self.finished is not None:
+            return
+        self._close_current()
+        self._current = {"name": name, "start_ms": self._now_ms(), "ms": None, "depth": 0}
+        self.sections.append(self._current)
+
+    @contextmanager
+    def section(self, name):
+        """with 블록 하나를 현재 구간 안의 중첩 구간으로 재는 컨텍스트 매니저"""
+        if not self.enabled:
+            yield
+            return
+        if self.finished is not None:
+            # 조각(fragment)만 다시 실행될 때는 그 구간만 따로 기록합니다.
+            t0 = time.perf_counter()
+            try:
+                yield
+            finally:
+                append_record({"kind": "fragment", "ts": time.time(), "session": self.session, "page": self.page,
+                               "section": name, "ms": (time.perf_counter() - t0) * 1000})
+            return
+        self._depth += 1
+        entry = {"name": name, "start_ms": self._now_ms(), "ms": None, "depth": self._depth}
+        self.sections.append(entry)
+        try:
+            yield
+        finally:
+            entry["ms"] = self._now_ms() - entry["start_ms"]
+            self._depth -= 1
+
+    def finish(self, status="complete"):
+        """프로파일을 끝내고 기록을 파일에 추가한 뒤 그 기록을 반환하는 함수 (두 번째 호출부터는 None)"""
+        if not self.enabled or self.finished is not None:
+            return None
+        if status == "complete":
+            self._close_current()
+            total_ms = self._now_ms()
+        else:
+            # 중간에 끝난 실행은 마지막으로 기록된 시점까지를 잽니다.
+            ends = [s["start_ms"] + (s["ms"] or 0) for s in self.sections]
+            total_ms = max(ends, default=0.0)
+        self.finished = time.time()
+        record = {"kind": "rerun", "ts": self.started_at, "session": self.session, "page": self.page,
+                  "mode": self.mode, "status": status, "total_ms": total_ms,
+                  "sections": [dict(s, ms=s["ms"] or 0.0) for s in self.sections]}
+        if self._profiler is not None:
+            self._profiler.disable()
+            record["functions"] = self._top_functions()
+        if self._sampler is not None:
+            self._sampler.stop()
+            record["samples"] = sum(self._sampler.stacks.values())
+            record["stacks"] = [{"stack": stack, "samples": count}
+                                for stack, count in self._sampler.stacks.most_common(TOP_N)]
+        append_record(record)
+        return record
+
+    def _top_functions(self):
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({"function": f"{os.path.basename(filename)}:{line}({func})", "calls": calls,
+                         "self_ms": tottime * 1000, "cumulative_ms": cumtime * 1000})
+        rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+        return rows[:TOP_N]
+
+
+def start(mode, session=None, page=None, previous=None):
+    """새 실행의 프로파일을 시작하는 함수. previous가 끝나지 않았으면 중단된 실행으로 먼저 기록합니다."""
+    if previous is not None and previous.enabled and previous.finished is None:
+        previous.finish(status="interrupted")
+    return RerunProfile(mode, session=session, page=page)
@@ -0,0 +1,260 @@
+"""옷장 아이템과 저장된 코디 이미지의 시각적 유사도 검색
+
+이미지마다 CPU에서 바로 계산할 수 있는 작은 특징 벡터(Lab 색 히스토그램 + 경사 방향 히스토그램)를 만들고,
+이를 메모리 매핑된 float32 행렬 파일에 쌓아 두고 코사인 유사도 top-k를 한 번의 행렬 곱으로 계산합니다.
+추가/삭제는 append-only 저널에 기록되어 여러 워커가 같은 인덱스를 점진적으로 공유할 수 있습니다.
+삭제로 비워진 행은 다음 추가 때 다시 쓰고, 저널이 살아 있는 항목보다 훨씬 길어지면 살아 있는 항목만 남도록
+새 파일로 바꿔 씁니다 (다른 워커는 파일이 바뀐 것을 보고 처음부터 다시 읽습니다).
+"""
+import io
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from personal_color import srgb_to_lab
+
+try:
+    import fcntl
+except ImportError:  # Windows 개발 환경에서는 프로세스 간 잠금 없이 동작합니다.
+    fcntl = None
+
+EMBED_SIZE = 64
+COLOR_BINS = (4, 4, 4)
+GRADIENT_CELLS = 4
+GRADIENT_ORIENTATIONS = 8
+DIM = int(np.prod(COLOR_BINS)) + GRADIENT_CELLS * GRADIENT_CELLS * GRADIENT_ORIENTATIONS
+INITIAL_CAPACITY = 1024
+# 저널 줄 수가 이 값과 (살아 있는 항목 수 × JOURNAL_COMPACT_RATIO)를 모두 넘으면 저널을 압축합니다.
+JOURNAL_COMPACT_MIN_LINES = 4096
+JOURNAL_COMPACT_RATIO = 4
+
+
+def _load_rgb(image):
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    img = image if isinstance(image, Image.Image) else Image.open(image)
+    img.draft("RGB", (EMBED_SIZE * 2, EMBED_SIZE * 2))
+    img = img.convert("RGB").resize((EMBED_SIZE, EMBED_SIZE), Image.BILINEAR)
+    if hasattr(image, "seek"):
+        image.seek(0)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _color_histogram(rgb):
+    lab = srgb_to_lab(rgb).reshape(-1, 3)
+    # L: 0~100, a/b: 대략 -80~80 범위를 균등 구간으로 나눕니다.
+    lows, highs = np.array([0.0, -80.0, -80.0]), np.array([100.0, 80.0, 80.0])
+    bins = np.array(COLOR_BINS)
+    idx = np.clip(((lab - lows) / (highs - lows) * bins).astype(int), 0, bins - 1)
+    flat = np.ravel_multi_index(idx.T, COLOR_BINS)
+    return np.bincount(flat, minlength=int(np.prod(COLOR_BINS))).astype(np.float32)
+
+
+def _gradient_histogram(rgb):
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, 1:-1] = gray[:, 2:] - gray[:, :-2]
+    gy[1:-1, :] = gray[2:, :] - gray[:-2, :]
+    magnitude = np.hypot(gx, gy)
+    orientation = (np.arctan2(gy, gx) % np.pi) / np.pi * GRADIENT_ORIENTATIONS
+    orientation = np.minimum(orientation.astype(int), GRADIENT_ORIENTATIONS - 1)
+    cell = EMBED_SIZE // GRADIENT_CELLS
+    rows, cols = np.indices(gray.shape) // cell
+    flat = (rows * GRADIENT_CELLS + cols) * GRADIENT_ORIENTATIONS + orientation
+    return np.bincount(flat.ravel(), weights=magnitude.ravel(),
+                       minlength=GRADIENT_CELLS * GRADIENT_CELLS * GRADIENT_ORIENTATIONS).astype(np.float32)
+
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def embed(image):
+    """이미지(파일 객체/바이트/PIL)를 L2 정규화된 DIM차원 float32 벡터로 변환하는 함수"""
+    rgb = _load_rgb(image)
+    # 색 분포와 형태(윤곽) 정보가 비슷한 비중을 갖도록 각 블록을 따로 정규화한 뒤 이어 붙입니다.
+    color = _normalize(np.sqrt(_color_histogram(rgb)))
+    shape = _normalize(np.sqrt(_gradient_histogram(rgb)))
+    return _normalize(np.concatenate([color, shape])).astype(np.float32)
+
+
+class EmbeddingIndex:
+    """메모리 매핑된 float32 행렬과 append-only 저널로 구성된 코사인 유사도 인덱스"""
+
+    def __init__(self, directory, dim=DIM):
+        self.directory = directory
+        self.dim = dim
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._journal_path = os.path.join(directory, "journal.log")
+        self._lock_path = os.path.join(directory, "lock")
+        self._thread_lock = threading.RLock()
+        self._row_of = {}
+        self._ids = []
+        self._valid = np.zeros(0, dtype=bool)
+        self._journal_offset = 0
+        self._journal_lines = 0
+        self._journal_inode = None
+        self._matrix = None
+        if not os.path.exists(self._vectors_path):
+            with open(self._vectors_path, "wb") as f:
+                f.truncate(INITIAL_CAPACITY * dim * 4)
+        open(self._journal_path, "a").close()
+        self._sync()
+
+    class _FileLock:
+        def __init__(self, path):
+            self.path = path
+
+        def __enter__(self):
+            self.f = open(self.path, "a")
+            if fcntl:
+                fcntl.flock(self.f, fcntl.LOCK_EX)
+            return self
+
+        def __exit__(self, *exc):
+            if fcntl:
+                fcntl.flock(self.f, fcntl.LOCK_UN)
+            self.f.close()
+
+    def _remap(self):
+        rows = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def _sync(self):
+        """다른 워커가 추가한 저널 항목을 읽어 들이는 함수 (새로 추가된 부분만 읽습니다)"""
+        with self._thread_lock:
+            with open(self._journal_path, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._journal_inode:
+                    # 다른 워커가 저널을 압축해 새 파일로 바꿨으면 처음부터 다시 읽습니다.
+                    self._journal_inode = inode
+                    self._journal_offset = 0
+                    self._journal_lines = 0
+                    self._ids = []
+                    self._row_of = {}
+                    self._matrix = None
+                f.seek(self._journal_offset)
+                chunk = f.read()
+            # 다른 워커가 아직 쓰는 중인 마지막 줄은 다음 동기화 때 읽습니다.
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+            if not complete and self._matrix is not None:
+                return
+            self._journal_offset += len(complete)
+            lines = complete.decode("utf-8").splitlines()
+            self._journal_lines += len(lines)
+            for line in lines:
+                op, row, *rest = line.split("\t")
+                row = int(row)
+                if op == "A":
+                    while len(self._ids) <= row:
+                        self._ids.append(None)
+                    self._ids[row] = rest[0]
+                    self._row_of[rest[0]] = row
+                elif op == "D" and row < len(self._ids) and self._ids[row] is not None:
+                    self._row_of.pop(self._ids[row], None)
+                    self._ids[row] = None
+            if len(self._valid) != len(self._ids):
+                self._valid = np.resize(self._valid, len(self._ids))
+            self._valid[:] = [item_id is not None for item_id in self._ids]
+            self._remap()
+
+    def __len__(self):
+        self._sync()
+        return len(self._row_of)
+
+    def __contains__(self, item_id):
+        self._sync()
+        return item_id in self._row_of
+
+    def ids(self):
+        self._sync()
+        return list(self._row_of)
+
+    def _compact_if_needed(self):
+        """저널이 살아 있는 항목보다 지나치게 길면 살아 있는 항목만 담은 새 저널로 바꾸는 함수 (파일 잠금 안에서 호출)"""
+        if self._journal_lines <= max(JOURNAL_COMPACT_MIN_LINES, len(self._row_of) * JOURNAL_COMPACT_RATIO):
+            return
+        # 행 번호는 그대로 두므로 벡터 파일은 건드리지 않습니다.
+        tmp_path = self._journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row, item_id in enumerate(self._ids):
+                if item_id is not None:
+                    f.write(f"A\t{row}\t{item_id}\n")
+        os.replace(tmp_path, self._journal_path)
+        self._sync()
+
+    def add(self, item_id, vector):
+        """벡터를 추가하는 함수 (이미 있는 id면 무시, 삭제로 비워진 행이 있으면 그 행을 다시 씁니다)"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._thread_lock, self._FileLock(self._lock_path):
+            self._sync()
+            if item_id in self._row_of:
+                return
+            free = np.flatnonzero(~self._valid)
+            row = int(free[0]) if free.size else len(self._ids)
+            if row >= self._matrix.shape[0]:
+                with open(self._vectors_path, "r+b") as f:
+                    f.truncate(self._matrix.shape[0] * 2 * self.dim * 4)
+                self._matrix = None
+                self._remap()
+            self._matrix[row] = vector
+            self._matrix.flush()
+            with open(self._journal_path, "a", encoding="utf-8") as f:
+                f.write(f"A\t{row}\t{item_id}\n")
+            self._sync()
+            self._compact_if_needed()
+
+    def remove(self, item_id):
+        """벡터를 삭제하는 함수 (행은 비워 두고 검색에서 제외하며, 다음 add()가 그 행을 다시 씁니다)"""
+        with self._thread_lock, self._FileLock(self._lock_path):
+            self._sync()
+            row = self._row_of.get(item_id)
+            if row is None:
+                return
+            self._matrix[row] = 0
+            with open(self._journal_path, "a", encoding="utf-8") as f:
+                f.write(f"D\t{row}\n")
+            self._sync()
+            self._compact_if_needed()
+
+    def vector(self, item_id):
+        self._sync()
+        row = self._row_of.get(item_id)
+        return None if row is None else np.array(self._matrix[row])
+
+    def search(self, queries, top_k=8, candidates=None, exclude=()):
+        """질의 벡터(1개 또는 (Q, dim) 배치)별로 [(id, 코사인 유사도)] top-k 목록을 반환하는 함수
+
+        candidates를 주면 그 id들 안에서만 검색합니다 (예: 한 사용자의 옷장).
+        """
+        self._sync()
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = queries.reshape(-1, self.dim)
+        if candidates is None:
+            rows = np.flatnonzero(self._valid)
+        else:
+            rows = np.array([self._row_of[c] for c in candidates if c in self._row_of], dtype=np.intp)
+        excluded = {self._row_of[e] for e in exclude if e in self._row_of}
+        if excluded:
+            rows = rows[~np.isin(rows, list(excluded))]
+        if rows.size == 0:
+            return [] if single else [[] for _ in queries]
+        n = len(self._ids)
+        matrix = self._matrix[:n]
+        scores = queries @ (matrix.T if candidates is None else matrix[rows].T)
+        if candidates is None:
+            scores = scores[:, rows]
+        k = min(top_k, rows.size)
+        results = []
+        for q_scores in scores:
+            top = np.argpartition(-q_scores, k - 1)[:k]
+            top = top[np.argsort(-q_scores[top])]
+            results.append([(self._ids[rows[i]], float(q_scores[i])) for i in top])
+        return results[0] if single else results
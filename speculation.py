@@ -0,0 +1,187 @@
+"""옷 분석 직후 기본 상황의 코디 추천을 백그라운드에서 미리 만들어 두는 추측 실행기
+
+분석을 마친 사용자는 대부분 곧바로 코디 추천 탭에서 상황을 비워 둔 채(일상적인 상황) 추천을 받습니다.
+그래서 분석이 끝나면 그 요청을 미리 시작하고, 결과를 (세션, 추천 요청 키(request_key))로 보관해 두었다가
+같은 세션이 같은 키의 추천을 누르면 바로 돌려줍니다. 입력이 같아도 다른 세션의 결과(음성 파일 등)는 넘겨주지 않습니다. 아직 만드는 중이면 새로 시작하지 않고 그 결과를 기다립니다.
+
+미리 만드는 호출은 호출 한도 대기열에서 가장 낮은 우선순위(PREFETCH)로 줄을 서므로 대화형 요청을 밀어내지 않습니다.
+다만 사용자가 추천을 눌러 아직 만드는 중인 결과를 기다리면, 그동안은 대화형(INTERACTIVE) 요청으로 올려 줍니다.
+사용자가 다른 상황을 입력하거나 옷을 다시 분석하면 취소되어 남은 단계(이미지/음성)를 건너뜁니다.
+적중률과 쓰이지 않고 버려진 호출의 예상 비용(wasted_usd)은 stats()로 확인합니다.
+
+환경 변수
+    OTTAKU_SPECULATION              0이면 미리 생성하지 않습니다 (기본값 1)
+    OTTAKU_SPECULATION_WORKERS      프로세스 전체에서 동시에 미리 만드는 추천 수 (기본값 2)
+    OTTAKU_SPECULATION_TTL_SECONDS  만들어 둔 추천을 보관하는 시간 (기본값 1800)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rate_limit
+import tracing
+
+ENABLED = os.environ.get("OTTAKU_SPECULATION", "1") != "0"
+WORKERS = int(os.environ.get("OTTAKU_SPECULATION_WORKERS", "2"))
+TTL_SECONDS = float(os.environ.get("OTTAKU_SPECULATION_TTL_SECONDS", "1800"))
+
+
+class Cancelled(Exception):
+    """취소된 추측 실행이 남은 단계를 건너뛸 때 발생하는 예외"""
+
+
+def request_key(*parts):
+    """추천 요청을 결정하는 값들(맞춤 정보, 분석 결과, 상황, 날씨, 프롬프트 변형 등)의 해시"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Speculation:
+    """미리 만드는 추천 하나 (job은 단계 사이마다 check()를 불러 취소 여부를 확인합니다)"""
+
+    def __init__(self, key, session):
+        self.key = key
+        self.session = session
+        self.state = "running"
+        self.started = time.monotonic()
+        self.finished = None
+        self.future = None
+        self.records = []
+        self._cancel = threading.Event()
+
+    @property
+    def cost_usd(self):
+        return sum(record.get("cost_usd", 0.0) for record in self.records)
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled(self.key)
+
+
+class Speculator:
+    """세션별 추측 실행과 결과 보관, 적중률/낭비 비용 지표"""
+
+    def __init__(self, workers=WORKERS, ttl_seconds=TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ottaku-speculate")
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.metrics = {"started": 0, "hits": 0, "joined": 0, "misses": 0, "cancelled": 0, "failed": 0,
+                        "expired": 0, "spent_usd": 0.0, "wasted_usd": 0.0, "head_start_s": 0.0}
+
+    def start(self, key, session, job):
+        """job(speculation)을 PREFETCH 우선순위로 실행하는 함수. 같은 세션의 예전 추측은 취소합니다."""
+        with self._lock:
+            self._expire()
+            if (session, key) in self._entries:
+                return self._entries[session, key]
+            for other in [s for s in self._entries.values() if s.session == session]:
+                self._discard(other, "cancelled")
+            spec = Speculation(key, session)
+            self._entries[session, key] = spec
+            self.metrics["started"] += 1
+        spec.future = self._pool.submit(self._run, spec, job)
+        spec.future.add_done_callback(lambda future: self._finished(spec, future))
+        return spec
+
+    @staticmethod
+    def _run(spec, job):
+        spec.check()
+        # 작업 스레드에는 호출 우선순위/세션 컨텍스트가 없으므로 여기서 지정합니다.
+        with rate_limit.context(priority=rate_limit.PREFETCH, session=spec.session), \
+                tracing.tagged(speculative=True) as records:
+            spec.records = records
+            return job(spec)
+
+    def _finished(self, spec, future):
+        with self._lock:
+            spec.finished = time.monotonic()
+            self.metrics["spent_usd"] += spec.cost_usd
+            if spec.state == "cancelled":
+                # 취소 뒤에 끝난 단계의 비용까지 낭비로 셉니다.
+                self.metrics["wasted_usd"] += spec.cost_usd
+            elif future.cancelled() or future.exception() is not None:
+                spec.state = "failed"
+                self.metrics["failed"] += 1
+                self.metrics["wasted_usd"] += spec.cost_usd
+                self._entries.pop((spec.session, spec.key), None)
+            else:
+                spec.state = "done"
+
+    def _discard(self, spec, reason):
+        """쓰이지 않을 추측을 버리는 함수 (잠금 안에서 호출). 이미 끝났으면 그 비용을 낭비로 셉니다."""
+        self._entries.pop((spec.session, spec.key), None)
+        spec._cancel.set()
+        if spec.future is not None:
+            spec.future.cancel()
+        if spec.state == "done":
+            self.metrics["wasted_usd"] += spec.cost_usd
+        spec.state = "cancelled"
+        self.metrics[reason] += 1
+
+    def _expire(self):
+        now = time.monotonic()
+        for spec in [s for s in self._entries.values() if s.finished and now - s.finished > self.ttl_seconds]:
+            self._discard(spec, "expired")
+
+    def cancel(self, session, keep=None):
+        """session의 추측 중 keep 키가 아닌 것을 취소하는 함수 (사용자가 다른 상황을 입력했을 때)"""
+        with self._lock:
+            for spec in [s for s in self._entries.values() if s.session == session and s.key != keep]:
+                self._discard(spec, "cancelled")
+
+    def take(self, key, session, timeout=None):
+        """session이 시작한 key의 추측 결과를 꺼내는 함수. 만드는 중이면 끝날 때까지 기다리고, 없거나 실패했으면 None."""
+        with self._lock:
+            self._expire()
+            spec = self._entries.get((session, key))
+            if spec is None:
+                self.metrics["misses"] += 1
+                return None
+        joined = spec.finished is None
+        head_start = (spec.finished or time.monotonic()) - spec.started
+        if joined:
+            # 사용자가 기다리는 동안 남은 호출이 새 대화형 요청보다 늦게 차례를 받지 않도록 합니다.
+            rate_limit.promote(session)
+        try:
+            result = spec.future.result(timeout)
+        except Exception:
+            with self._lock:
+                self.metrics["misses"] += 1
+            return None
+        finally:
+            if joined:
+                rate_limit.demote(session)
+        with self._lock:
+            if self._entries.get((session, key)) is not spec:
+                self.metrics["misses"] += 1
+                return None
+            del self._entries[session, key]
+            spec.state = "used"
+            self.metrics["hits"] += 1
+            self.metrics["joined"] += joined
+            self.metrics["head_start_s"] += head_start
+        return result
+
+    def stats(self):
+        with self._lock:
+            requests = self.metrics["hits"] + self.metrics["misses"]
+            return {**self.metrics, "hit_rate": self.metrics["hits"] / requests if requests else 0.0,
+                    "in_flight": sum(s.state == "running" for s in self._entries.values()),
+                    "ready": sum(s.state == "done" for s in self._entries.values())}
+
+
+_default_speculator = None
+_default_speculator_lock = threading.Lock()
+
+
+def get_speculator():
+    """프로세스에서 공유하는 기본 추측 실행기를 반환하는 함수"""
+    global _default_speculator
+    with _default_speculator_lock:
+        if _default_speculator is None:
+            _default_speculator = Speculator()
+        return _default_speculator
@@ -0,0 +1,300 @@
+"""Gemini 구조화 응답(JSON 스키마) 정의, 타입이 있는 결과 객체, 관대한 단일 패스 파서
+
+구조화 모드에서는 response_mime_type/response_schema로 스키마에 맞는 JSON만 받도록 요청하고,
+예전 자유 텍스트 형식(IMAGE_PROMPT_n, (검색 키워드: ...))의 응답도 한 번의 줄 단위 순회로 해석합니다.
+일부 필드가 빠졌을 때는 전체를 다시 생성하지 않고 빠진 필드만 묻는 작은 복구 요청을 만들어 줍니다.
+"""
+import json
+import re
+from dataclasses import asdict, dataclass, field
+
+ITEM_TYPES = ["상의", "하의", "아우터", "신발", "액세서리"]
+STYLE_TAGS = ["캐주얼", "미니멀", "스트리트", "포멀", "스포티"]
+
+CLOTHING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "item_type": {"type": "string", "enum": ITEM_TYPES},
+        "category": {"type": "string"},
+        "color": {"type": "string"},
+        "pattern": {"type": "string"},
+        "style_tags": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["item_type", "category", "color", "pattern", "style_tags"],
+}
+
+OUTFIT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "search_keywords": {"type": "array", "items": {"type": "string"}},
+        "image_prompt": {"type": "string"},
+    },
+    "required": ["title", "description", "search_keywords", "image_prompt"],
+}
+
+RECOMMENDATION_SCHEMA = {
+    "type": "object",
+    "properties": {"outfits": {"type": "array", "items": OUTFIT_SCHEMA}},
+    "required": ["outfits"],
+}
+
+BATCH_RECOMMENDATION_SCHEMA = {
+    "type": "object",
+    "properties": {"items": {"type": "array", "items": {
+        "type": "object",
+        "properties": {"index": {"type": "integer"}, "outfits": {"type": "array", "items": OUTFIT_SCHEMA}},
+        "required": ["index", "outfits"],
+    }}},
+    "required": ["items"],
+}
+
+IMAGE_PROMPTS_SCHEMA = {
+    "type": "object",
+    "properties": {"image_prompts": {"type": "array", "items": {"type": "string"}}},
+    "required": ["image_prompts"],
+}
+
+
+class ParseError(ValueError):
+    """응답에서 결과를 전혀 읽어낼 수 없을 때 발생하는 예외"""
+
+
+def generation_config(schema):
+    """스키마에 맞는 JSON만 생성하도록 하는 Gemini generation_config를 만드는 함수"""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def subschema(schema, fields):
+    """객체 스키마에서 일부 필드만 남긴 스키마를 만드는 함수 (부분 복구 요청용)"""
+    return {"type": "object", "properties": {k: schema["properties"][k] for k in fields},
+            "required": list(fields)}
+
+
+_decoder = json.JSONDecoder()
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def extract_json(text):
+    """텍스트에서 첫 번째 JSON 객체를 읽는 함수 (코드 블록, 앞뒤 설명, 끝 쉼표, 둥근 따옴표 허용)"""
+    if not text:
+        raise ParseError("빈 응답")
+    start = text.find("{")
+    if start < 0:
+        raise ParseError("JSON 객체 없음")
+    try:
+        # 탐욕적 정규식 대신 raw_decode로 첫 객체가 끝나는 위치까지만 읽습니다.
+        return _decoder.raw_decode(text, start)[0]
+    except json.JSONDecodeError:
+        pass
+    end = text.rfind("}")
+    cleaned = text[start:end + 1].replace("“", '"').replace("”", '"')
+    cleaned = _TRAILING_COMMA.sub(r"\1", cleaned)
+    try:
+        return _decoder.raw_decode(cleaned)[0]
+    except json.JSONDecodeError as e:
+        raise ParseError(f"JSON 해석 실패: {e}") from e
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+def _string_list(value):
+    if isinstance(value, str):
+        value = re.split(r"[,/]", value)
+    if not isinstance(value, list):
+        return []
+    return [v.strip() for v in value if isinstance(v, str) and v.strip()]
+
+
+@dataclass
+class ClothingAnalysis:
+    item_type: str = ""
+    category: str = ""
+    color: str = ""
+    pattern: str = ""
+    style_tags: list = field(default_factory=list)
+    missing: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        """딕셔너리를 검증해 객체로 만드는 함수. 비어 있거나 형식이 틀린 필드는 missing에 기록합니다."""
+        result = cls(item_type=_text(data.get("item_type")), category=_text(data.get("category")),
+                     color=_text(data.get("color")), pattern=_text(data.get("pattern")),
+                     style_tags=_string_list(data.get("style_tags")))
+        if result.item_type not in ITEM_TYPES:
+            # "상의(셔츠)"처럼 덧붙은 설명은 허용하고, 목록에 없는 값은 복구 대상으로 둡니다.
+            result.item_type = next((t for t in ITEM_TYPES if t in result.item_type), "")
+        result.missing = [name for name in CLOTHING_SCHEMA["required"] if not getattr(result, name)]
+        return result
+
+    @classmethod
+    def from_text(cls, text):
+        return cls.from_dict(extract_json(text))
+
+    def merge(self, data):
+        """부분 복구 응답으로 빠진 필드만 채우는 함수"""
+        repaired = ClothingAnalysis.from_dict({**self.to_dict(), **data})
+        self.__dict__.update(repaired.__dict__)
+        return self
+
+    def to_dict(self):
+        data = asdict(self)
+        data.pop("missing")
+        return data
+
+
+@dataclass
+class Outfit:
+    title: str = ""
+    description: str = ""
+    search_keywords: list = field(default_factory=list)
+    image_prompt: str = ""
+
+
+@dataclass
+class CodyRecommendation:
+    outfits: list = field(default_factory=list)
+    intro: str = ""
+
+    @classmethod
+    def from_dict(cls, data):
+        outfits = []
+        for raw in data.get("outfits") or []:
+            if isinstance(raw, dict):
+                outfits.append(Outfit(title=_text(raw.get("title")), description=_text(raw.get("description")),
+                                      search_keywords=_string_list(raw.get("search_keywords")),
+                                      image_prompt=_text(raw.get("image_prompt"))))
+        if not outfits:
+            raise ParseError("코디 제안 없음")
+        return cls(outfits=outfits)
+
+    @classmethod
+    def from_text(cls, text):
+        """구조화 JSON 응답과 예전 자유 텍스트 응답을 모두 받아들이는 함수"""
+        stripped = (text or "").lstrip()
+        if stripped.startswith(("{", "```")):
+            try:
+                return cls.from_dict(extract_json(stripped))
+            except ParseError:
+                pass
+        return parse_legacy_recommendation(text)
+
+    @property
+    def image_prompts(self):
+        return [o.image_prompt for o in self.outfits if o.image_prompt]
+
+    @property
+    def search_keywords(self):
+        return [k for o in self.outfits for k in o.search_keywords]
+
+    def missing_image_prompts(self):
+        return [i for i, o in enumerate(self.outfits) if not o.image_prompt]
+
+    def display_text(self):
+        """화면 표시용 Markdown (검색 키워드와 이미지 프롬프트는 제외)"""
+        parts = [self.intro] if self.intro else []
+        for outfit in self.outfits:
+            parts.append(f"## {outfit.title}\n{outfit.description}" if outfit.title else outfit.description)
+        return "\n\n".join(p for p in parts if p).strip()
+
+
+def parse_batch_recommendations(text, count):
+    """배치 응답을 요청 순서대로 정렬한 CodyRecommendation 목록으로 바꾸는 함수 (빠지거나 깨진 항목은 None)"""
+    results = [None] * count
+    try:
+        entries = extract_json(text).get("items") or []
+    except (ParseError, AttributeError):
+        return results
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("index", position)
+        if not isinstance(index, int) or not 0 <= index < count or results[index] is not None:
+            continue
+        try:
+            recommendation = CodyRecommendation.from_dict(entry)
+        except ParseError:
+            continue
+        # 이미지 프롬프트가 빠진 항목은 다시 요청하도록 실패로 둡니다.
+        if not recommendation.missing_image_prompts():
+            results[index] = recommendation
+    return results
+
+
+# 한 줄 안의 이미지 프롬프트(굵게/백틱/대괄호 허용)와 검색 키워드를 한 번에 찾는 패턴
+_LEGACY_TOKEN = re.compile(
+    r"[`*]*IMAGE_PROMPT_?(\d+)[`*]*\s*[:：][`*\s]*\[?(?P<prompt>.*?)\]?[`*]*\s*$"
+    r"|\(\s*검색\s*키워드\s*[:：]\s*\[?(?P<keyword>[^)\]]*?)\]?\s*\)")
+_HEADING = re.compile(r"^#{1,3}\s+(.*)")
+
+
+def parse_legacy_recommendation(text):
+    """IMAGE_PROMPT_n / (검색 키워드: ...) 형식의 자유 텍스트를 한 번의 줄 단위 순회로 해석하는 함수"""
+    if not text or not text.strip():
+        raise ParseError("빈 응답")
+    intro, outfits, prompts = [], [], {}
+    # 첫 제목 앞(예: 제목을 **코디 1**처럼 굵게만 쓴 응답)에서 나온 키워드는 첫 코디 앞쪽에 붙입니다.
+    leading_keywords = []
+    current = None
+    lines = []
+    for line in text.splitlines():
+        heading = _HEADING.match(line.strip())
+        if heading:
+            if current is not None:
+                current.description = "\n".join(lines).strip()
+            current = Outfit(title=heading.group(1).strip())
+            outfits.append(current)
+            lines = []
+            continue
+        kept, last = [], 0
+        for match in _LEGACY_TOKEN.finditer(line):
+            kept.append(line[last:match.start()])
+            last = match.end()
+            if match.group("prompt") is not None:
+                prompts[int(match.group(1))] = (match.group("prompt").strip(), current)
+            elif match.group("keyword").strip():
+                (current.search_keywords if current is not None else leading_keywords).append(
+                    match.group("keyword").strip())
+        kept.append(line[last:])
+        line = "".join(kept)
+        (lines if current is not None else intro).append(line)
+    if current is not None:
+        current.description = "\n".join(lines).strip()
+    # 이미지 프롬프트는 번호로 코디에 연결하고, 번호가 범위를 벗어나면 나온 위치의 코디에 연결합니다.
+    for number, (prompt, owner) in sorted(prompts.items()):
+        target = outfits[number - 1] if 0 < number <= len(outfits) else owner
+        if target is None:
+            target = Outfit()
+            outfits.append(target)
+        target.image_prompt = target.image_prompt or prompt
+    recommendation = CodyRecommendation(outfits=outfits, intro="\n".join(intro).strip())
+    if not outfits:
+        # 제목 없이 한 덩어리로 온 응답은 전체를 하나의 설명으로 봅니다.
+        recommendation.outfits = [Outfit(description=recommendation.intro)]
+        recommendation.intro = ""
+    recommendation.outfits[0].search_keywords[:0] = leading_keywords
+    return recommendation
+
+
+def clothing_repair_prompt(partial, missing):
+    """분석 결과 중 빠진 필드만 다시 묻는 짧은 프롬프트"""
+    known = json.dumps({k: v for k, v in partial.to_dict().items() if k not in missing}, ensure_ascii=False)
+    return (f"이 이미지의 옷에 대해 이미 다음 값을 알고 있습니다: {known}\n"
+            f"빠진 항목 {', '.join(missing)}만 JSON으로 답해주세요. item_type은 {', '.join(ITEM_TYPES)} 중 하나입니다.")
+
+
+def reformat_prompt(raw_text, schema):
+    """형식이 깨진 응답을 다시 생성하지 않고 JSON으로만 옮겨 적게 하는 텍스트 전용 프롬프트"""
+    return (f"다음 답변의 내용을 바꾸지 말고 주어진 JSON 스키마에 맞게 옮겨 적어주세요.\n"
+            f"스키마: {json.dumps(schema, ensure_ascii=False)}\n답변:\n{raw_text}")
+
+
+def image_prompt_repair_prompt(recommendation, indices, gender, situation):
+    """이미지 프롬프트가 빠진 코디에 대해서만 영어 이미지 묘사를 요청하는 프롬프트"""
+    outfits = "\n".join(f"- {recommendation.outfits[i].title}: {recommendation.outfits[i].description}"
+                        for i in indices)
+    return (f"다음 코디 각각에 대해 {gender} 모델이 '{situation}' 상황에서 그 코디를 입은 모습을 "
+            f"상세하고 사실적으로 묘사하는 영어 이미지 프롬프트를 순서대로 image_prompts 배열로 답해주세요.\n{outfits}")
@@ -1,6 +1,7 @@
 import streamlit as st
 from PIL import Image
 import google.generativeai as genai
+import prompts
 import json
 from openai import OpenAI
 import re
@@ -129,10 +130,7 @@ def generate_image_with_dalle(prompt, retries=3, delay=5):
 
 def analyze_clothing_image(uploaded_image):
     img = Image.open(uploaded_image)
-    prompt = """
-    당신은 패션 스타일리스트이자 의류 분석 전문가입니다. 이 이미지에 있는 옷을 분석해서 아래 JSON 형식에 맞춰 답변해주세요. 각 항목에 대해 가장 적절한 단 하나의 값만 선택해주세요. **중요: 답변에는 JSON 코드 외에 어떤 설명이나 인사도 포함하지 말고, 오직 JSON 객체만 응답해야 합니다.**
-    {"item_type": "상의, 하의, 아우터, 신발, 액세서리 중 하나", "category": "티셔츠, 셔츠, 청바지 등 구체적인 카테고리", "color": "옷의 가장 주된 색상", "pattern": "솔리드(단색), 스트라이프, 체크 등", "style_tags": ["캐주얼", "미니멀", "스트리트", "포멀", "스포티"]}
-    """
+    prompt = prompts.get("clothing_analysis_text").full_text()
     try:
         response = llm_model.generate_content([prompt, img])
         match = re.search(r"\{.*\}", response.text, re.DOTALL)
@@ -148,21 +146,11 @@ def analyze_clothing_image(uploaded_image):
 
 
 def get_cody_recommendation_with_image(user_info, clothing_info, situation):
-    prompt = f"""
-    당신은 친절하고 스타일리시한 AI 패션 어드바이저입니다. 고객 정보, 의류 아이템, 주어진 상황을 바탕으로 최고의 코디를 추천해주세요. **중요: 답변의 가독성을 높이기 위해 다음 규칙을 반드시 지켜주세요.** 1. 각 코디 제안의 제목은 Markdown의 `##`를 사용하여 크고 굵게 표시해주세요. 2. 설명에 어울리는 이모티콘(👕,👖,👟,✨ 등)을 자유롭게 사용해주세요. 3. 의류 아이템, 색상, 스타일 등 중요한 키워드는 `<span style='color: #87CEEB;'>키워드</span>` 와 같이 HTML 태그를 사용해 색상을 입혀 강조해주세요. 4. 추천된 각 아이템 뒤에는 검색 가능한 키워드를 `(검색 키워드: [키워드])` 형식으로 추가해주세요.
-    ## 🧑‍💻 고객 정보:
-    - 성별: {user_info['성별']}
-    - 키: {user_info['키']}cm, 몸무게: {user_info['몸무게']}kg
-    - 피부 톤: {user_info['피부_톤']}
-    - 선호 스타일: {', '.join(user_info['선호_스타일'])}
-    ## 👚 분석된 의류 아이템:
-    - 종류: {clothing_info['item_type']}, 카테고리: {clothing_info['category']}, 색상: {clothing_info['color']}, 패턴: {clothing_info['pattern']}
-    ## 🏞️ 주어진 상황:
-    - {situation}
-    ## 요청 사항:
-    1. 위 정보를 종합하여, 총 **두 가지 스타일의 완성된 코디**를 추천하고, 각 코디를 추천한 이유를 친절하게 설명해주세요.
-    2. 각 코디 설명 후, DALL-E가 이미지를 생성할 수 있도록, **고객의 성별을 반영**하고 **주어진 상황을 반영**하여 해당 코디를 입은 모델의 모습을 상세하고 사실적으로 묘사하는 **영어 프롬프트**를 다음 형식으로 제공해주세요: `IMAGE_PROMPT_1: [첫 번째 코디에 대한 상세한 영어 묘사]`, `IMAGE_PROMPT_2: [두 번째 코디에 대한 상세한 영어 묘사]`
-    """
+    prompt = prompts.get("cody_recommendation_text").full_text(
+        gender=user_info['성별'], height=user_info['키'], weight=user_info['몸무게'], skin_tone=user_info['피부_톤'],
+        styles=', '.join(user_info['선호_스타일']), item_type=clothing_info['item_type'],
+        category=clothing_info['category'], color=clothing_info['color'], pattern=clothing_info['pattern'],
+        situation=situation, weather="정보 없음")
     try:
         response = llm_model.generate_content(prompt)
         recommendation_text = response.text
@@ -178,15 +166,7 @@ def get_cody_recommendation_with_image(user_info, clothing_info, situation):
 
 def analyze_personal_color(face_image):
     img = Image.open(face_image)
-    prompt = """
-    당신은 전문 퍼스널 컬러 컨설턴트입니다. 이 인물의 얼굴 사진을 보고, 피부의 언더톤, 머리카락과 눈동자 색의 대비 등을 종합적으로 분석하여 가장 가능성이 높은 퍼스널 컬러를 진단해주세요.
-    답변은 아래 형식과 같이 **진단 결과**와 **진단 근거**를 명확히 구분하여 작성해주세요. 진단 근거는 2~3가지 핵심적인 이유를 간결한 불릿 포인트로 설명해야 합니다.
-    **진단 결과**: [봄 웜톤, 여름 쿨톤, 가을 웜톤, 겨울 쿨톤 중 하나]
-    **진단 근거**:
-    * 피부 톤: [피부 톤에 대한 구체적인 분석]
-    * 헤어/눈동자 컬러: [헤어와 눈동자 컬러에 대한 구체적인 분석]
-    * 전체적인 조화: [전체적인 이미지와 색의 조화에 대한 분석]
-    """
+    prompt = prompts.get("personal_color").full_text(local_hint="")
     try:
         response = llm_model.generate_content([prompt, img])
         return response.text.strip()
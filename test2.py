@@ -1,6 +1,7 @@
 import streamlit as st
 from PIL import Image
 import google.generativeai as genai
+import prompts
 import json
 from openai import OpenAI
 import re
@@ -74,10 +75,7 @@ def generate_image_with_dalle(prompt, retries=3, delay=5):
 
 def analyze_clothing_image(uploaded_image):
     img = Image.open(uploaded_image)
-    prompt = """
-    당신은 패션 스타일리스트이자 의류 분석 전문가입니다. 이 이미지에 있는 옷을 분석해서 아래 JSON 형식에 맞춰 답변해주세요. 각 항목에 대해 가장 적절한 단 하나의 값만 선택해주세요. **중요: 답변에는 JSON 코드 외에 어떤 설명이나 인사도 포함하지 말고, 오직 JSON 객체만 응답해야 합니다.**
-    {"item_type": "상의, 하의, 아우터, 신발, 액세서리 중 하나", "category": "티셔츠, 셔츠, 청바지 등 구체적인 카테고리", "color": "옷의 가장 주된 색상", "pattern": "솔리드(단색), 스트라이프, 체크 등", "style_tags": ["캐주얼", "미니멀", "스트리트", "포멀", "스포티"]}
-    """
+    prompt = prompts.get("clothing_analysis_text").full_text()
     try:
         response = llm_model.generate_content([prompt, img])
         match = re.search(r"\{.*\}", response.text, re.DOTALL)
@@ -118,15 +116,7 @@ def get_cody_recommendation_with_image(user_info, clothing_info, situation):
 
 def analyze_personal_color(face_image):
     img = Image.open(face_image)
-    prompt = """
-    당신은 전문 퍼스널 컬러 컨설턴트입니다. 이 인물의 얼굴 사진을 보고, 피부의 언더톤, 머리카락과 눈동자 색의 대비 등을 종합적으로 분석하여 가장 가능성이 높은 퍼스널 컬러를 진단해주세요.
-    답변은 아래 형식과 같이 **진단 결과**와 **진단 근거**를 명확히 구분하여 작성해주세요. 진단 근거는 2~3가지 핵심적인 이유를 간결한 불릿 포인트로 설명해야 합니다.
-    **진단 결과**: [봄 웜톤, 여름 쿨톤, 가을 웜톤, 겨울 쿨톤 중 하나]
-    **진단 근거**:
-    * 피부 톤: [피부 톤에 대한 구체적인 분석]
-    * 헤어/눈동자 컬러: [헤어와 눈동자 컬러에 대한 구체적인 분석]
-    * 전체적인 조화: [전체적인 이미지와 색의 조화에 대한 분석]
-    """
+    prompt = prompts.get("personal_color").full_text(local_hint="")
     try:
         response = llm_model.generate_content([prompt, img])
         return response.text.strip()
@@ -0,0 +1,198 @@
+"""외부 API 호출 구간의 지연 시간/재시도/페이로드/토큰/예상 비용을 기록하는 트레이싱 모듈
+
+기록은 프로세스 단위 링 버퍼에 쌓이고, JSONL 또는 OpenMetrics 텍스트로 내보낼 수 있습니다.
+환경 변수 OTTAKU_TRACE_FILE을 지정하면 모든 기록이 해당 JSONL 파일에도 추가됩니다.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+RING_SIZE = int(os.environ.get("OTTAKU_TRACE_RING_SIZE", "5000"))
+TRACE_FILE = os.environ.get("OTTAKU_TRACE_FILE")
+
+# 예상 비용 계산용 단가 (USD). 실제 청구액이 아닌 추세 비교용 추정치입니다.
+COST_TABLE = {
+    "gemini-1.5-flash": {"input_token": 0.075 / 1_000_000, "output_token": 0.30 / 1_000_000},
+    "dall-e-3": {"image": 0.040},
+    "tts-1": {"char": 15.0 / 1_000_000},
+}
+
+_records = deque(maxlen=RING_SIZE)
+_lock = threading.Lock()
+_current_span = contextvars.ContextVar("ottaku_current_span", default=None)
+# tagged() 블록 안에서 만들어진 구간에 붙일 필드와, 그 기록을 모을 리스트
+_tags = contextvars.ContextVar("ottaku_trace_tags", default=None)
+
+
+def estimate_cost(model, tokens_in=0, tokens_out=0, images=0, chars=0):
+    """모델별 단가표로 호출 1회의 예상 비용(USD)을 계산하는 함수"""
+    prices = COST_TABLE.get(model)
+    if not prices:
+        return 0.0
+    return (tokens_in * prices.get("input_token", 0) + tokens_out * prices.get("output_token", 0)
+            + images * prices.get("image", 0) + chars * prices.get("char", 0))
+
+
+class Span:
+    """하나의 호출 구간에 대한 측정값을 모으는 객체"""
+
+    def __init__(self, stage, **fields):
+        self.stage = stage
+        self.fields = {"retries": 0, "repairs": 0, "payload_bytes": 0, "tokens_in": 0, "tokens_out": 0,
+                       "images": 0, "chars": 0, "cost_usd": 0.0}
+        self.fields.update(fields)
+        tags = _tags.get()
+        self._collector = None
+        if tags is not None:
+            self.fields.update(tags[0])
+            self._collector = tags[1]
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+
+    def annotate(self, **fields):
+        for key, value in fields.items():
+            if key in ("payload_bytes", "tokens_in", "tokens_out", "images", "chars", "cost_usd", "retries",
+                       "repairs", "queue_wait_ms"):
+                self.fields[key] = self.fields.get(key, 0) + (value or 0)
+            else:
+                self.fields[key] = value
+
+    def finish(self, error=None):
+        model = self.fields.get("model")
+        if model and not self.fields["cost_usd"]:
+            self.fields["cost_usd"] = estimate_cost(model, self.fields["tokens_in"], self.fields["tokens_out"],
+                                                    self.fields["images"], self.fields["chars"])
+        record = {"stage": self.stage, "ts": self.started_at,
+                  "wall_ms": (time.perf_counter() - self._t0) * 1000, "error": error}
+        record.update(self.fields)
+        _record(record)
+        if self._collector is not None:
+            self._collector.append(record)
+        return record
+
+
+def _record(record):
+    with _lock:
+        _records.append(record)
+        if TRACE_FILE:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+@contextmanager
+def trace_span(stage, **fields):
+    """with 블록 하나를 stage 이름으로 측정하는 컨텍스트 매니저"""
+    span = Span(stage, **fields)
+    token = _current_span.set(span)
+    error = None
+    try:
+        yield span
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish(error)
+
+
+@contextmanager
+def tagged(**fields):
+    """with 블록 안의 모든 기록에 fields를 붙이고, 그 기록들이 쌓이는 리스트를 돌려주는 컨텍스트 매니저"""
+    collected = []
+    parent = _tags.get()
+    token = _tags.set(({**(parent[0] if parent else {}), **fields}, collected))
+    try:
+        yield collected
+    finally:
+        _tags.reset(token)
+
+
+def traced(stage, **fields):
+    """함수 호출 전체를 stage 이름으로 측정하는 데코레이터"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_span(stage, **fields):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**fields):
+    """현재 측정 중인 구간에 재시도, 바이트 수, 토큰 수 등을 더하는 함수 (구간 밖이면 무시)"""
+    span = _current_span.get()
+    if span is not None:
+        span.annotate(**fields)
+
+
+def annotate_gemini_usage(response):
+    """Gemini 응답의 usage_metadata에서 입력/출력 토큰 수를 현재 구간에 기록하는 함수"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        annotate(tokens_in=getattr(usage, "prompt_token_count", 0) or 0,
+                 tokens_out=getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def get_records():
+    """링 버퍼에 남아 있는 기록을 오래된 순서대로 복사해 반환하는 함수"""
+    with _lock:
+        return list(_records)
+
+
+def clear_records():
+    with _lock:
+        _records.clear()
+
+
+def stage_summary(records=None, by="stage"):
+    """stage(또는 by 필드)별 호출 수, p50/p95/p99 지연 시간, 오류/재시도/응답 복구 수, 누적 토큰과 비용을 DataFrame으로 반환하는 함수"""
+    df = pd.DataFrame(get_records() if records is None else records)
+    if df.empty:
+        return pd.DataFrame(columns=[by, "calls", "p50_ms", "p95_ms", "p99_ms", "errors", "retries",
+                                     "repairs", "tokens_in", "tokens_out", "cost_usd"])
+    grouped = df.groupby(by)
+    summary = pd.DataFrame({
+        "calls": grouped.size(),
+        "p50_ms": grouped["wall_ms"].quantile(0.50),
+        "p95_ms": grouped["wall_ms"].quantile(0.95),
+        "p99_ms": grouped["wall_ms"].quantile(0.99),
+        "errors": grouped["error"].count(),
+        "retries": grouped["retries"].sum(),
+        "repairs": grouped["repairs"].sum(),
+        "tokens_in": grouped["tokens_in"].sum(),
+        "tokens_out": grouped["tokens_out"].sum(),
+        "cost_usd": grouped["cost_usd"].sum(),
+    })
+    return summary.reset_index()
+
+
+def export_jsonl(records=None):
+    """기록을 JSONL 문자열로 변환하는 함수"""
+    records = get_records() if records is None else records
+    return "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records)
+
+
+def export_openmetrics(records=None):
+    """stage별 요약을 OpenMetrics 텍스트 형식으로 변환하는 함수"""
+    summary = stage_summary(records)
+    lines = ["# TYPE ottaku_call_latency_ms summary", "# UNIT ottaku_call_latency_ms ms"]
+    for row in summary.itertuples():
+        for quantile, value in (("0.5", row.p50_ms), ("0.95", row.p95_ms), ("0.99", row.p99_ms)):
+            lines.append(f'ottaku_call_latency_ms{{stage="{row.stage}",quantile="{quantile}"}} {value:.3f}')
+        lines.append(f'ottaku_call_latency_ms_count{{stage="{row.stage}"}} {row.calls}')
+    for metric, column in (("ottaku_call_errors", "errors"), ("ottaku_call_retries", "retries"),
+                           ("ottaku_response_repairs", "repairs"),
+                           ("ottaku_tokens_in", "tokens_in"), ("ottaku_tokens_out", "tokens_out"),
+                           ("ottaku_cost_usd", "cost_usd")):
+        lines.append(f"# TYPE {metric} counter")
+        for row in summary.itertuples():
+            lines.append(f'{metric}_total{{stage="{row.stage}"}} {getattr(row, column)}')
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,161 @@
+"""옷장(분석 결과와 임베딩 포함)과 저장한 코디를 zip 보관 파일 하나로 내보내고 다시 들여오는 모듈
+
+보관 파일 구성
+    manifest.jsonl           첫 줄은 {"type": "meta", ...}, 이후 항목마다 한 줄
+                             (type, content_hash, webp_hash, image, name, analysis, palette, embedding)
+    images/<webp_hash>.webp  같은 원본 이미지는 한 번만 담은 WebP (이미 WebP면 다시 인코딩하지 않음)
+
+내보낼 때는 이미지를 하나씩 변환해 바로 zip에 쓰고 manifest는 임시 파일에 모았다가 마지막에 붙이며,
+들여올 때는 manifest를 한 줄씩 읽으면서 필요한 이미지만 꺼내므로 옷장 크기와 관계없이 메모리는 이미지 한 장 분량만 씁니다.
+content_hash(원본 SHA-256)나 webp_hash가 이미 있는 항목은 이미지를 읽지 않고 건너뛰고,
+분석 결과와 임베딩을 그대로 가져오므로 들여오는 데 Gemini 호출이 필요 없습니다.
+"""
+import base64
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.jsonl"
+WEBP_QUALITY = 85
+# manifest가 이보다 커지면 메모리 대신 디스크 임시 파일에 모읍니다.
+MANIFEST_SPOOL_BYTES = 8 * 2 ** 20
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path, chunk_size=2 ** 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_webp(data):
+    return data[:4] == b"RIFF" and data[8:12] == b"WEBP"
+
+
+def to_webp(data, quality=WEBP_QUALITY):
+    """이미지 바이트를 WebP로 바꾸는 함수 (투명도가 있으면 유지, 이미 WebP면 그대로)"""
+    if is_webp(data):
+        return bytes(data)
+    img = Image.open(io.BytesIO(data))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if img.mode in ("P", "LA") or "transparency" in img.info else "RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def encode_vector(vector):
+    return None if vector is None else base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_vector(text):
+    return None if not text else np.frombuffer(base64.b64decode(text), dtype="<f4").copy()
+
+
+class ArchiveEntry:
+    """보관 파일의 항목 하나 (kind는 "closet" 또는 "outfit", data는 WebP 바이트)"""
+
+    def __init__(self, kind, content_hash, webp_hash, data, name=None, analysis=None, palette=None, vector=None):
+        self.kind = kind
+        self.content_hash = content_hash
+        self.webp_hash = webp_hash
+        self.data = data
+        self.name = name
+        self.analysis = analysis
+        self.palette = palette or []
+        self.vector = vector
+
+
+def export_archive(fileobj, closet, read_image, closet_vector=None, outfits=(), quality=WEBP_QUALITY):
+    """옷장 항목과 저장한 코디를 fileobj에 zip으로 쓰고 항목/이미지 수와 바이트 수를 반환하는 함수
+
+    closet은 옷장 항목 딕셔너리(image_id, name, analysis, palette) 목록, read_image(image_id)는 원본 바이트,
+    closet_vector(image_id)는 임베딩(없으면 None), outfits는 (파일 경로, 임베딩 또는 None) 목록입니다.
+    """
+    stats = {"closet": 0, "outfits": 0, "images": 0, "bytes_in": 0, "bytes_out": 0}
+    written = {}
+    stored = set()
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf, \
+            tempfile.SpooledTemporaryFile(max_size=MANIFEST_SPOOL_BYTES) as manifest:
+
+        def add_line(record):
+            manifest.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        def add_image(content_hash, load):
+            if content_hash not in written:
+                data = load()
+                webp = to_webp(data, quality)
+                webp_hash = sha256(webp)
+                written[content_hash] = webp_hash
+                stats["bytes_in"] += len(data)
+                # 원본이 달라도 변환한 WebP가 같으면 한 번만 담습니다.
+                if webp_hash not in stored:
+                    # WebP는 이미 압축되어 있으므로 zip에서는 다시 압축하지 않습니다.
+                    zf.writestr(f"images/{webp_hash}.webp", webp, compress_type=zipfile.ZIP_STORED)
+                    stored.add(webp_hash)
+                    stats["images"] += 1
+                    stats["bytes_out"] += len(webp)
+            return written[content_hash]
+
+        add_line({"type": "meta", "version": FORMAT_VERSION, "created": time.time()})
+        for item in closet:
+            webp_hash = add_image(item["image_id"], lambda: bytes(read_image(item["image_id"])))
+            add_line({"type": "closet", "content_hash": item["image_id"], "webp_hash": webp_hash,
+                      "image": f"images/{webp_hash}.webp", "name": item.get("name"), "analysis": item.get("analysis"),
+                      "palette": item.get("palette", []),
+                      "embedding": encode_vector(closet_vector(item["image_id"]) if closet_vector else None)})
+            stats["closet"] += 1
+        for path, vector in outfits:
+            with open(path, "rb") as f:
+                data = f.read()
+            content_hash = sha256(data)
+            webp_hash = add_image(content_hash, lambda: data)
+            add_line({"type": "outfit", "content_hash": content_hash, "webp_hash": webp_hash,
+                      "image": f"images/{webp_hash}.webp", "embedding": encode_vector(vector)})
+            stats["outfits"] += 1
+        manifest.seek(0)
+        with zf.open(MANIFEST, "w") as out:
+            shutil.copyfileobj(manifest, out)
+    return stats
+
+
+def read_archive(fileobj, known_hashes=None, stats=None):
+    """보관 파일의 항목을 manifest 순서대로 하나씩 내보내는 제너레이터
+
+    known_hashes는 이미 가진 이미지의 해시 집합으로, content_hash나 webp_hash가 들어 있으면 건너뜁니다.
+    내보낸 항목의 content_hash도 이 집합에 더하므로 보관 파일 안에서 같은 원본은 한 번만 나옵니다.
+    """
+    known_hashes = set() if known_hashes is None else known_hashes
+    stats = {} if stats is None else stats
+    stats.update(read=0, skipped=0)
+    with zipfile.ZipFile(fileobj) as zf, zf.open(MANIFEST) as raw:
+        lines = io.TextIOWrapper(raw, encoding="utf-8")
+        meta = json.loads(next(lines, "null") or "null")
+        if not meta or meta.get("type") != "meta" or meta.get("version") != FORMAT_VERSION:
+            raise ValueError("옷타쿠 옷장 보관 파일이 아니거나 지원하지 않는 버전입니다.")
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["content_hash"] in known_hashes or record["webp_hash"] in known_hashes:
+                stats["skipped"] += 1
+                continue
+            data = zf.read(record["image"])
+            known_hashes.add(record["content_hash"])
+            stats["read"] += 1
+            yield ArchiveEntry(record["type"], record["content_hash"], record["webp_hash"], data,
+                               name=record.get("name"), analysis=record.get("analysis"),
+                               palette=record.get("palette"), vector=decode_vector(record.get("embedding")))
@@ -0,0 +1,224 @@
+"""기상청 단기예보 DataFrame을 날짜별 요약 특징으로 가공하는 모듈
+
+사이드바 위젯, 로컬 옷차림 규칙, LLM 코디 프롬프트가 모두 같은 요약을 재사용합니다.
+"""
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pytz
+
+SKY_LABELS = {'1': '맑음', '3': '구름많음', '4': '흐림'}
+PTY_LABELS = {'0': '강수 없음', '1': '비', '2': '비/눈', '3': '눈', '4': '소나기'}
+# 강수 형태가 여러 개일 때 대표값으로 고를 우선순위 (눈 > 비/눈 > 비 > 소나기)
+PTY_SEVERITY = {'0': 0, '4': 1, '1': 2, '2': 3, '3': 4}
+
+# 단기예보는 3시간 간격으로 갱신되므로 같은 (지역, 날짜) 요약은 그 동안 재사용합니다.
+FEATURE_TTL_SECONDS = 3 * 60 * 60
+_feature_cache = {}
+
+KST = pytz.timezone('Asia/Seoul')
+# 상세 예보 표에 보여 줄 열과 이름 (나머지 카테고리는 브라우저로 보내지 않습니다)
+DETAIL_COLUMNS = {"fcstTime": "시각", "TMP": "기온(°C)", "SKY_STATUS": "하늘", "PTY_STATUS": "강수",
+                  "POP": "강수확률(%)", "PCP": "강수량", "REH": "습도(%)", "WSD": "풍속(m/s)"}
+DETAIL_NUMERIC = ("TMP", "POP", "REH", "WSD")
+
+
+def recommend_clothing(temp):
+    """기온에 따라 적절한 옷차림 추천 문구를 반환하는 함수."""
+    try:
+        temp = float(temp)
+    except (ValueError, TypeError):
+        return "온도 정보가 없어 추천할 수 없어요."
+    if temp >= 28:
+        return "민소매, 반팔, 반바지, 원피스 등 매우 가벼운 옷차림을 추천해요. 🥵"
+    elif temp >= 23:
+        return "반팔, 얇은 셔츠, 반바지, 면바지로 시원하게 입으세요. 😄"
+    elif temp >= 17:
+        return "얇은 니트, 가디건, 맨투맨, 청바지가 활동하기 좋은 날씨예요. 👍"
+    elif temp >= 10:
+        return "자켓, 트렌치코트, 니트, 청바지로 멋과 보온을 둘 다 챙기세요.🧥"
+    elif temp >= 5:
+        return "두꺼운 코트, 가죽 자켓, 플리스, 기모 옷차림이 필요해요. 🥶"
+    else:
+        return "패딩, 두꺼운 코트, 목도리, 장갑 등 방한용품으로 따뜻하게 입으세요. 🧤"
+
+
+def pivot_forecast(items):
+    """기상청 API의 item 목록을 (fcstDate, fcstTime) 행, 카테고리 열의 DataFrame으로 변환하는 함수"""
+    df = pd.DataFrame(items)
+    df_pivot = df.pivot_table(index=['fcstDate', 'fcstTime'], columns='category', values='fcstValue',
+                              aggfunc='first').reset_index()
+    sky_codes = {'1': '맑음 ☀️', '3': '구름많음 ☁️', '4': '흐림 🌥️'}
+    pty_codes = {'0': '강수 없음', '1': '비 🌧️', '2': '비/눈 🌨️', '3': '눈 ❄️', '4': '소나기 🌦️'}
+    if 'SKY' in df_pivot.columns: df_pivot['SKY_STATUS'] = df_pivot['SKY'].map(sky_codes)
+    if 'PTY' in df_pivot.columns: df_pivot['PTY_STATUS'] = df_pivot['PTY'].map(pty_codes).fillna('강수 없음')
+    return df_pivot
+
+
+def _numeric(group, column):
+    if column not in group.columns:
+        return pd.Series(dtype=float)
+    return pd.to_numeric(group[column], errors='coerce').dropna()
+
+
+def _summarize_day(group):
+    tmp = _numeric(group, 'TMP')
+    # TMN/TMX는 특정 발표 시각에만 포함되므로 없으면 시간별 기온에서 계산합니다.
+    tmn, tmx = _numeric(group, 'TMN'), _numeric(group, 'TMX')
+    min_temp = tmn.iloc[0] if not tmn.empty else (tmp.min() if not tmp.empty else None)
+    max_temp = tmx.iloc[0] if not tmx.empty else (tmp.max() if not tmp.empty else None)
+    pop, wind = _numeric(group, 'POP'), _numeric(group, 'WSD')
+
+    sky = None
+    if 'SKY' in group.columns and not group['SKY'].dropna().empty:
+        sky = str(group['SKY'].dropna().mode().iloc[0])
+    pty, rain_hours, windows = '0', 0, []
+    if 'PTY' in group.columns:
+        ptys = group['PTY'].fillna('0').astype(str)
+        rain_hours = int((ptys != '0').sum())
+        if rain_hours:
+            pty = max(ptys, key=lambda code: PTY_SEVERITY.get(code, 0))
+            windows = rain_windows(group['fcstTime'], ptys)
+
+    return {
+        "min_temp": None if min_temp is None else float(min_temp),
+        "max_temp": None if max_temp is None else float(max_temp),
+        "pop": int(pop.max()) if not pop.empty else 0,
+        "wind": float(wind.max()) if not wind.empty else 0.0,
+        "sky": sky,
+        "pty": pty,
+        "rain_hours": rain_hours,
+        "rain_windows": windows,
+    }
+
+
+def rain_windows(times, ptys):
+    """강수가 있는 연속된 예보 시각을 [(시작 시, 끝 시), ...] 구간으로 묶는 함수 (끝 시는 마지막 시각 + 1)"""
+    windows = []
+    for hhmm, code in sorted(zip(times, ptys)):
+        if code == '0':
+            continue
+        hour = int(hhmm[:2])
+        if windows and windows[-1][1] == hour:
+            windows[-1] = (windows[-1][0], hour + 1)
+        else:
+            windows.append((hour, hour + 1))
+    return windows
+
+
+def format_rain_windows(windows):
+    return ", ".join(f"{start:02d}~{end:02d}시" for start, end in windows)
+
+
+def build_daily_features(df):
+    """예보 DataFrame을 {fcstDate: 특징 dict} 형태의 날짜별 요약으로 변환하는 함수"""
+    if df is None or df.empty or 'fcstDate' not in df.columns:
+        return {}
+    return {date: _summarize_day(group) for date, group in df.groupby('fcstDate', sort=True)}
+
+
+class ForecastDay:
+    """하루치 예보 (요약 특징, 시각별 행, 미리 직렬화한 상세 표)"""
+
+    def __init__(self, date, group):
+        group = group.sort_values('fcstTime')
+        self.date = date
+        self.features = _summarize_day(group)
+        self.hours = group['fcstTime'].tolist()
+        self.rows = group.to_dict('records')
+        detail = group[[c for c in DETAIL_COLUMNS if c in group.columns]].copy()
+        for column in DETAIL_NUMERIC:
+            if column in detail.columns:
+                detail[column] = pd.to_numeric(detail[column], errors='coerce')
+        detail['fcstTime'] = detail['fcstTime'].str[:2] + "시"
+        # 날짜를 바꿀 때마다 DataFrame을 다시 변환하지 않도록 Arrow 표로 한 번만 만들어 둡니다.
+        self.table = pa.Table.from_pandas(detail.rename(columns=DETAIL_COLUMNS), preserve_index=False)
+
+    def at(self, hhmm):
+        """hhmm 시각에 해당하는 예보 행 (그 시각 이전의 가장 늦은 행, 없으면 첫 행)"""
+        return self.rows[max(0, bisect_right(self.hours, hhmm) - 1)]
+
+    def current(self, now=None):
+        """실제 현재 시각(한국 시간)의 예보 행 (다른 날짜는 같은 시각의 행)"""
+        now = now or datetime.now(KST)
+        return self.at(now.strftime('%H%M'))
+
+
+class ForecastIndex:
+    """예보 DataFrame을 받을 때 한 번만 날짜별로 나눠 둔 색인 (날짜 전환은 딕셔너리 조회)"""
+
+    def __init__(self, df):
+        self.days = {}
+        if df is not None and not df.empty and 'fcstDate' in df.columns:
+            self.days = {date: ForecastDay(date, group) for date, group in df.groupby('fcstDate', sort=True)}
+
+    def get(self, date):
+        return self.days.get(date)
+
+    def daily_features(self):
+        return {date: day.features for date, day in self.days.items()}
+
+
+def cache_daily_features(region, features_by_date):
+    """날짜별 요약을 (지역, 날짜) 키로 캐시에 저장하는 함수"""
+    expires_at = time.time() + FEATURE_TTL_SECONDS
+    for date, features in features_by_date.items():
+        _feature_cache[(region, date)] = (expires_at, features)
+
+
+def get_daily_features(region, date):
+    """캐시된 (지역, 날짜) 요약을 반환하고, 없거나 만료되었으면 None을 반환하는 함수"""
+    entry = _feature_cache.get((region, date))
+    if entry is None:
+        return None
+    expires_at, features = entry
+    if expires_at < time.time():
+        _feature_cache.pop((region, date), None)
+        return None
+    return features
+
+
+def feels_like_temp(features):
+    """하루 평균 기온에 바람 세기를 반영한 체감 기준 기온을 계산하는 함수"""
+    if features.get("min_temp") is None or features.get("max_temp") is None:
+        return None
+    mean_temp = (features["min_temp"] + features["max_temp"]) / 2
+    # 풍속 4m/s를 넘으면 2m/s마다 체감 온도를 1도씩 낮춰 잡습니다.
+    wind_penalty = max(0.0, features.get("wind", 0.0) - 4) / 2
+    return mean_temp - wind_penalty
+
+
+def recommend_clothing_by_weather(features):
+    """날짜별 요약(기온, 강수, 바람, 하늘 상태)을 종합해 옷차림 추천 문구를 반환하는 로컬 규칙 엔진"""
+    if not features:
+        return "날씨 정보가 없어 추천할 수 없어요."
+    tips = [recommend_clothing(feels_like_temp(features))]
+    if features["min_temp"] is not None and features["max_temp"] is not None \
+            and features["max_temp"] - features["min_temp"] >= 10:
+        tips.append("일교차가 크니 가볍게 걸칠 겉옷을 챙기세요.")
+    if features["pty"] == '3':
+        tips.append("눈 소식이 있어요. 미끄럽지 않은 신발을 신으세요. ☃️")
+    elif features["pty"] != '0' or features["pop"] >= 60:
+        tips.append("비 소식이 있으니 우산과 젖어도 괜찮은 신발을 준비하세요. ☔")
+    if features["wind"] >= 9:
+        tips.append("바람이 강하니 바람막이나 모자를 추천해요. 🌬️")
+    return " ".join(tips)
+
+
+def format_weather_for_prompt(features, region=None, date=None):
+    """날짜별 요약을 LLM 프롬프트에 넣을 한 줄 문자열로 변환하는 함수"""
+    if not features:
+        return ""
+    parts = []
+    if region or date:
+        parts.append(" ".join(str(p) for p in (region, date) if p) + ":")
+    if features["min_temp"] is not None and features["max_temp"] is not None:
+        parts.append(f"최저 {features['min_temp']:.0f}°C / 최고 {features['max_temp']:.0f}°C,")
+    parts.append(f"강수확률 {features['pop']}%,")
+    parts.append(f"최대 풍속 {features['wind']:.0f}m/s,")
+    parts.append(SKY_LABELS.get(features["sky"], "하늘 상태 정보 없음") + ",")
+    parts.append(PTY_LABELS.get(features["pty"], "강수 없음"))
+    return " ".join(parts)